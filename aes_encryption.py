@@ -11,12 +11,34 @@ import base64
 import os
 import sys
 import hashlib
+import hmac
+import mmap
+import struct
+import threading
+from collections import OrderedDict
 from pathlib import Path
 
+from encryption import ByteSize, _walk_files, _map_files
+from streaming import map_file
+from atomic_io import atomic_write, sync_dir_of, DirSyncBatch, DEFAULT_DURABILITY
+
 # Constants
 ENCRYPTION_HEADER = b'---  BEGIN ENCRYPTED DATA  ---\n\n'
 ENCRYPTION_FOOTER = b'\n\n---  END ENCRYPTED DATA  ---'
 DELIMITER = b'---END---'
+KEY_CACHE_SIZE = 64 # Max number of derived keys kept in memory
+AES_BUFFER_SIZE = 48 * 1024 # Multiple of the AES block size (16) and of 3 (for base64)
+PBKDF2_ITERATIONS = 100000
+MAX_PBKDF2_ITERATIONS = 100 * PBKDF2_ITERATIONS # Upper bound written to or read from a file header
+
+# Versioned binary container, used for the non-armored (`.bin`) files:
+#   magic | version | salt_len | iterations | iv | sha256(key) | payload_len | salt | payload
+# All fields up to `payload_len` are at fixed offsets. Files written before
+# this container existed (header + DELIMITER-separated parts) are still read.
+BINARY_MAGIC = b'LKAES'
+BINARY_VERSION = 2
+_BINARY_HEADER = struct.Struct('>5sBBI16s32sQ')
+_PAYLOAD_LEN_OFFSET = _BINARY_HEADER.size - 8
 
 # Lambda function for base64 encoding of bytes data
 base64_encode = lambda data: base64.b64encode(data).decode('utf-8')
@@ -27,11 +49,68 @@ base64_decode = lambda encoded_data: base64.b64decode(encoded_data.encode('utf-8
 # Lambda function for sha256 hash
 sha256_hash = lambda data: hashlib.sha256(data).hexdigest()
 
+# Derived keys, keyed on (password digest, salt, length, iterations); see `derive_aes_key()`
+_key_cache = OrderedDict()
+_key_cache_lock = threading.Lock()
+_key_locks = {}
+# Per-process secret so that the cache never holds a plain hash of a password
+_cache_secret = os.urandom(32)
+
+
+def _key_cache_id(password, salt, length, iterations):
+    digest = hmac.new(_cache_secret, password.encode(), hashlib.sha256).digest()
+    return digest, bytes(salt), length, iterations
+
+
+def clear_key_cache():
+    """Forget all the cached AES keys."""
+    with _key_cache_lock:
+        _key_cache.clear()
+        _key_locks.clear()
+
+
 # Derive an AES key from a password
-def derive_aes_key(password, salt=None, length=32, iterations=100000):
+def derive_aes_key(password, salt=None, length=32, iterations=PBKDF2_ITERATIONS, use_cache=True):
+    """
+    Derive an AES key from `password` with PBKDF2-SHA256.
+
+    The derived keys are kept in a bounded LRU cache (`KEY_CACHE_SIZE`
+    entries), so decrypting many files that share a salt pays the
+    `iterations` only once. Concurrent calls for the same salt wait for
+    a single derivation instead of repeating it.
+
+    Returns:
+    --------
+        tuple(`key`, `salt`)
+    """
     if salt is None:
         salt = os.urandom(16)  # Generate a random 16-byte salt if not provided
 
+    if not use_cache:
+        return _derive_aes_key(password, salt, length, iterations), salt
+
+    cache_id = _key_cache_id(password, salt, length, iterations)
+    with _key_cache_lock:
+        if cache_id in _key_cache:
+            _key_cache.move_to_end(cache_id)
+            return _key_cache[cache_id], salt
+        lock = _key_locks.setdefault(cache_id, threading.Lock())
+
+    with lock:
+        with _key_cache_lock:
+            key = _key_cache.get(cache_id)
+        if key is None:
+            key = _derive_aes_key(password, salt, length, iterations)
+            with _key_cache_lock:
+                _key_cache[cache_id] = key
+                while len(_key_cache) > KEY_CACHE_SIZE:
+                    _key_cache.popitem(last=False)
+                _key_locks.pop(cache_id, None)
+
+    return key, salt
+
+
+def _derive_aes_key(password, salt, length, iterations):
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
         length=length,
@@ -40,8 +119,7 @@ def derive_aes_key(password, salt=None, length=32, iterations=100000):
         backend=default_backend()
     )
 
-    key = kdf.derive(password.encode())
-    return key, salt
+    return kdf.derive(password.encode())
     
 
 def aes_encrypt(data, key):
@@ -87,6 +165,56 @@ def aes_decrypt(encrypted_data, key, iv):
     
     return unpadded_data
 
+def _check_iterations(iterations):
+    """
+    Raises ValueError unless `iterations` is in the range written and read
+    by the binary container. The header is untrusted: a huge count would
+    stall the key derivation.
+    """
+    if not 1 <= iterations <= MAX_PBKDF2_ITERATIONS:
+        raise ValueError(f"Unsupported PBKDF2 iteration count {iterations}")
+
+
+def _pack_binary_header(iv, salt, aes_key_hash, payload_len, iterations=PBKDF2_ITERATIONS):
+    """
+    Returns the header of the versioned binary container.
+    `aes_key_hash` is the hex sha256 of the key as returned by `aes_encrypt()`.
+    """
+    _check_iterations(iterations)
+    salt = b'' if salt is None else salt
+    return _BINARY_HEADER.pack(
+        BINARY_MAGIC, BINARY_VERSION, len(salt), iterations,
+        iv, bytes.fromhex(aes_key_hash.decode()), payload_len
+    ) + salt
+
+
+def _parse_binary_header(header, salt):
+    """
+    Parses the fixed part `header` of the binary container followed by the
+    `salt` bytes. Returns the same keys as `_locate_encrypted_payload()`.
+    """
+    magic, version, salt_len, iterations, iv, keyhash, payload_len = _BINARY_HEADER.unpack(header)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError("Invalid formatted data format")
+    if len(salt) != salt_len:
+        raise ValueError("Invalid formatted data format")
+    _check_iterations(iterations)
+
+    start = _BINARY_HEADER.size + salt_len
+    return {
+        'start': start,
+        'end': start + payload_len,
+        'iv': iv,
+        'salt': salt,
+        'iterations': iterations,
+        'old_keyhash': keyhash.hex().encode(),
+    }
+
+
+def _is_binary_container(data):
+    return data[:len(BINARY_MAGIC)] == BINARY_MAGIC
+
+
 def _get_formatted_encrypted_data(data:dict, armor=False):
     encrypted_data = data.get('encrypted_data')
     iv = data.get('iv')
@@ -100,12 +228,38 @@ def _get_formatted_encrypted_data(data:dict, armor=False):
         formatted_data = f"{ENCRYPTION_HEADER.decode()}{encrypted_data}{DELIMITER.decode()}{iv}{DELIMITER.decode()}{salt}{DELIMITER.decode()}{old_keyhash.decode()}{ENCRYPTION_FOOTER.decode()}"
         formatted_data = formatted_data.encode()
     else:
-        formatted_data = ENCRYPTION_HEADER + encrypted_data + DELIMITER + iv + DELIMITER + salt + DELIMITER + old_keyhash + ENCRYPTION_FOOTER
+        header = _pack_binary_header(
+            iv=iv, salt=salt, aes_key_hash=old_keyhash, payload_len=len(encrypted_data),
+            iterations=data.get('iterations', PBKDF2_ITERATIONS)
+        )
+        formatted_data = header + encrypted_data
 
     return formatted_data
 
 
 def _parse_formatted_encrypted_data(formatted_data, armor=False):
+    """
+    Parses data produced by `_get_formatted_encrypted_data()`. For the binary
+    container only the header is parsed and `encrypted_data` is a zero-copy
+    `memoryview` into `formatted_data`.
+    """
+    if not armor and _is_binary_container(formatted_data):
+        fixed = _BINARY_HEADER.size
+        if len(formatted_data) < fixed:
+            raise ValueError("Invalid formatted data format")
+        salt_len = formatted_data[len(BINARY_MAGIC) + 1]
+        info = _parse_binary_header(formatted_data[:fixed], bytes(formatted_data[fixed:fixed + salt_len]))
+        if info['end'] > len(formatted_data):
+            raise ValueError("Invalid formatted data format")
+
+        return {
+            'encrypted_data': memoryview(formatted_data)[info['start']:info['end']],
+            'iv': info['iv'],
+            'salt': info['salt'],
+            'iterations': info['iterations'],
+            'old_keyhash': info['old_keyhash'],
+        }
+
     if armor:
         formatted_data = formatted_data.decode()  # convert bytes to string
         header_index = formatted_data.find(ENCRYPTION_HEADER.decode())
@@ -145,10 +299,11 @@ def _parse_formatted_encrypted_data(formatted_data, armor=False):
         'encrypted_data': encrypted_data,
         'iv': iv,
         'salt': salt,
+        'iterations': PBKDF2_ITERATIONS,
         'old_keyhash': old_keyhash,
     }
 
-def store_encrypted_data(file_path:Path, data_dict, armor=False, replace=False):
+def store_encrypted_data(file_path:Path, data_dict, armor=False, replace=False, durability:str=DEFAULT_DURABILITY):
     file_path = file_path.absolute()
     parent_dir = file_path.parent
     filename = file_path.name
@@ -161,54 +316,320 @@ def store_encrypted_data(file_path:Path, data_dict, armor=False, replace=False):
     # Create the new file path by appending the new extension
     new_file_path = parent_dir / (filename + add_extension)
 
-    # If replace is true, delete the old file
-    if replace and file_path.exists():
-        file_path.unlink()
-    
     # Write to file
-    with open(new_file_path, 'wb') as file:
+    with atomic_write(new_file_path, durability=durability) as file:
         file.write(formatted_data)
+
+    # If replace is true, delete the old file; only now that the new one is in place
+    if replace and file_path.exists():
+        file_path.unlink()
+        sync_dir_of(file_path, durability=durability)
    
 
 def load_encrypted_data(file_path):
     with open(file_path, 'rb') as f:
         return f.read()
-    
-def aes_encrypt_file(filepath:Path, aes_key, salt=None, armor=False, replace=False):
-    with open(filepath, 'rb') as f:
-        data = f.read()
-    enc_dict = aes_encrypt(data=data, key=aes_key)
-    enc_dict['salt'] = salt
-    store_encrypted_data(file_path=filepath, data_dict=enc_dict, armor=armor, replace=replace)
-
-def aes_decrypt_file(filepath:Path, password, armor=False, replace=False):
-    data = load_encrypted_data(file_path=filepath)
-    
-    data_dict = _parse_formatted_encrypted_data(data, armor=armor)
 
-    # Derive the AES key
-    aes_key, _ = derive_aes_key(password=password, salt=data_dict['salt'])
 
-    # Match the key hash
-    if sha256_hash(aes_key) != data_dict['old_keyhash'].decode():
-        return False
+def map_encrypted_data(file_path):
+    """
+    Lazy counterpart of `load_encrypted_data()`: a context manager yielding a
+    read-only `mmap` of the file, which `_parse_formatted_encrypted_data()`
+    and `aes_decrypt_stream()` accept. Views taken from it must be released
+    before the context exits.
+    """
+    return map_file(file_path)
     
-    encrypted_data = data_dict['encrypted_data']
-    iv = data_dict['iv']
+class _Base64Writer:
+    """
+    Wraps a binary file object and base64-encodes everything written to it.
+    Up to two bytes are held back until the next write (or `close()`), so
+    that the concatenated output equals `base64.b64encode()` of the input.
+    """
 
-    original_data = aes_decrypt(encrypted_data=encrypted_data, key=aes_key, iv=iv)
+    def __init__(self, file):
+        self.file = file
+        self._rest = b''
+
+    def write(self, data):
+        data = self._rest + data
+        cut = len(data) - len(data) % 3
+        self._rest = data[cut:]
+        self.file.write(base64.b64encode(data[:cut]))
+
+    def close(self):
+        self.file.write(base64.b64encode(self._rest))
+        self._rest = b''
+
+
+def aes_encrypt_stream(src, dst, aes_key, salt, armor=False, buffer_size=AES_BUFFER_SIZE, iterations=PBKDF2_ITERATIONS):
+    """
+    Streaming counterpart of `aes_encrypt()` + `_get_formatted_encrypted_data()`.
+    Reads `src` in blocks of `buffer_size` and writes the formatted encrypted
+    data to `dst`, so memory use does not depend on the size of the input.
+    In binary mode `dst` must be seekable: the payload length is filled into
+    the header once the payload has been written.
+    """
+    iv = os.urandom(16)
+    encryptor = Cipher(algorithms.AES(aes_key), modes.CBC(iv), backend=default_backend()).encryptor()
+    padder = padding.PKCS7(algorithms.AES.block_size).padder()
+    aes_key_hash = sha256_hash(aes_key).encode()
+
+    if armor:
+        dst.write(ENCRYPTION_HEADER)
+        out = _Base64Writer(dst)
+    else:
+        header_pos = dst.tell()
+        dst.write(_pack_binary_header(iv=iv, salt=salt, aes_key_hash=aes_key_hash, payload_len=0, iterations=iterations))
+        out = dst
+
+    payload_len = 0
+    while True:
+        chunk = src.read(buffer_size)
+        if not chunk:
+            break
+        block = encryptor.update(padder.update(chunk))
+        payload_len += len(block)
+        out.write(block)
+
+    block = encryptor.update(padder.finalize()) + encryptor.finalize()
+    payload_len += len(block)
+    out.write(block)
+
+    if armor:
+        out.close()
+        iv, salt = base64_encode(iv).encode(), base64_encode(salt).encode()
+        dst.write(DELIMITER + iv + DELIMITER + salt + DELIMITER + aes_key_hash + ENCRYPTION_FOOTER)
+    else:
+        end = dst.tell()
+        dst.seek(header_pos + _PAYLOAD_LEN_OFFSET)
+        dst.write(struct.pack('>Q', payload_len))
+        dst.seek(end)
 
+
+def _locate_encrypted_payload(f, armor=False):
+    """
+    Finds the encrypted payload of an open `.bin`/`.asc` file. For the binary
+    container only the fixed-size header is read; for the legacy layout the
+    header and the trailer (IV, salt and key hash are at the end).
+
+    Returns:
+    --------
+        dict with keys `start`, `end` (offsets of the payload), `iv`, `salt`,
+        `iterations` and `old_keyhash`
+    """
+    f.seek(0)
+    head = f.read(_BINARY_HEADER.size)
+    if not armor and _is_binary_container(head):
+        if len(head) != _BINARY_HEADER.size:
+            raise ValueError("Invalid formatted data format")
+        salt = f.read(head[len(BINARY_MAGIC) + 1])
+        return _parse_binary_header(head, salt)
+
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    if not head.startswith(ENCRYPTION_HEADER):
+        raise ValueError("Invalid formatted data format")
+
+    tail_size = min(size - len(ENCRYPTION_HEADER), 4096)
+    f.seek(size - tail_size)
+    tail = f.read(tail_size)
+    if not tail.endswith(ENCRYPTION_FOOTER):
+        raise ValueError("Invalid formatted data format")
+
+    parts = tail[:-len(ENCRYPTION_FOOTER)].rsplit(DELIMITER, 3)
+    if len(parts) != 4:
+        raise ValueError("Invalid formatted data format")
+
+    _, iv, salt, old_keyhash = parts
+    end = size - len(ENCRYPTION_FOOTER) - sum(len(DELIMITER) + len(p) for p in (iv, salt, old_keyhash))
+    if armor:
+        iv, salt = base64_decode(iv.decode()), base64_decode(salt.decode())
+
+    return {
+        'start': len(ENCRYPTION_HEADER),
+        'end': end,
+        'iv': iv,
+        'salt': salt,
+        'iterations': PBKDF2_ITERATIONS,
+        'old_keyhash': old_keyhash,
+    }
+
+
+def _iter_payload(src, start, end, buffer_size):
+    """Yields `src[start:end]` in blocks of at most `buffer_size` bytes."""
+    if isinstance(src, (mmap.mmap, bytes, bytearray, memoryview)):
+        if end > len(src):
+            raise ValueError("Invalid formatted data format")
+        # Every slice is released once consumed, and all of them when the
+        # generator is closed, so that the caller can close an `mmap` `src`
+        with memoryview(src) as view:
+            for pos in range(start, end, buffer_size):
+                with view[pos:min(pos + buffer_size, end)] as chunk:
+                    yield chunk
+        return
+
+    src.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        chunk = src.read(min(buffer_size, remaining))
+        if not chunk:
+            raise ValueError("Invalid formatted data format")
+        remaining -= len(chunk)
+        yield chunk
+
+
+def aes_decrypt_stream(src, dst, aes_key, iv, start, end, armor=False, buffer_size=AES_BUFFER_SIZE):
+    """
+    Streaming counterpart of `aes_decrypt()`: decrypts the payload
+    `src[start:end]` (see `_locate_encrypted_payload()`) into `dst`.
+    `src` is a binary file object or a buffer such as an `mmap`; a buffer is
+    fed to the cipher as memoryview slices, without copying.
+    """
+    decryptor = Cipher(algorithms.AES(aes_key), modes.CBC(iv), backend=default_backend()).decryptor()
+    unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+
+    if armor:
+        buffer_size = 4 * (buffer_size // 3)  # whole base64 quanta
+
+    chunks = _iter_payload(src, start, end, buffer_size)
+    try:
+        for chunk in chunks:
+            if armor:
+                chunk = base64.b64decode(chunk)
+            dst.write(unpadder.update(decryptor.update(chunk)))
+    finally:
+        # Release the views of `src` before an error propagates to its owner
+        chunks.close()
+
+    dst.write(unpadder.update(decryptor.finalize()) + unpadder.finalize())
+
+
+def aes_encrypt_file(filepath:Path, aes_key, salt=None, armor=False, replace=False, iterations=PBKDF2_ITERATIONS,
+                     durability:str=DEFAULT_DURABILITY, dir_sync:DirSyncBatch=None):
+    """
+    Encrypts `filepath` into `filepath.bin` (or `filepath.asc` if `armor`)
+    in constant memory; see `aes_encrypt_stream()`.
+    `iterations` is the PBKDF2 iteration count `aes_key` was derived with;
+    it is recorded in the binary container.
+    The output is written atomically; see `atomic_io.py` for `durability`
+    and `dir_sync`. With `replace`, `filepath` is removed only afterwards.
+    """
+    _check_iterations(iterations)
     filepath = Path(filepath).absolute()
-    parent_dir = filepath.parent
-    
-    decrypted_file = parent_dir / filepath.stem
+    new_file_path = filepath.parent / (filepath.name + ('.asc' if armor else '.bin'))
+
+    with open(filepath, 'rb') as src:
+        with atomic_write(new_file_path, durability=durability, batch=dir_sync) as dst:
+            aes_encrypt_stream(src, dst, aes_key=aes_key, salt=salt, armor=armor, iterations=iterations)
 
     # If replace is true, delete the old file
-    if replace and filepath.exists():
+    if replace:
         filepath.unlink()
-    
-    with open(decrypted_file, 'wb') as f:
-        f.write(original_data)
+        sync_dir_of(filepath, durability=durability, batch=dir_sync)
+
+
+def aes_decrypt_file(filepath:Path, password, armor=False, replace=False,
+                     durability:str=DEFAULT_DURABILITY, dir_sync:DirSyncBatch=None):
+    """
+    Decrypts a file written by `aes_encrypt_file()` in constant memory.
+    The encrypted file is memory-mapped, so the header is skipped and the
+    payload decrypted without copying it. The output is written atomically
+    as in `aes_encrypt_file()`.
+    Returns False if `password` is wrong, True otherwise.
+    """
+    filepath = Path(filepath).absolute()
+    decrypted_file = filepath.parent / filepath.stem
+
+    with map_encrypted_data(filepath) as src:
+        if not src:
+            raise ValueError("Invalid formatted data format")
+        data_dict = _locate_encrypted_payload(src, armor=armor)
+
+        # Derive the AES key
+        aes_key, _ = derive_aes_key(password=password, salt=data_dict['salt'], iterations=data_dict['iterations'])
+
+        # Match the key hash
+        if not hmac.compare_digest(sha256_hash(aes_key).encode(), bytes(data_dict['old_keyhash'])):
+            return False
+
+        with atomic_write(decrypted_file, durability=durability, batch=dir_sync) as dst:
+            aes_decrypt_stream(
+                src, dst, aes_key=aes_key, iv=data_dict['iv'],
+                start=data_dict['start'], end=data_dict['end'], armor=armor
+            )
+
+    # If replace is true, delete the old file
+    if replace:
+        filepath.unlink()
+        sync_dir_of(filepath, durability=durability, batch=dir_sync)
+
+    return True
+
+
+def aes_encrypt_dir(root_dir:Path, password, armor=False, replace=False, jobs:int=None, durability:str=DEFAULT_DURABILITY):
+    """
+    AES-encrypts every file of `root_dir` and of all its subdirectories.
+    The key is derived only once, with one fresh salt for the whole batch,
+    so that `aes_decrypt_dir()` can reuse it as well.
+
+    Returns:
+    --------
+        tuple(`int`, ByteSize()): (number of files encrypted, total size in Bytes)
+    """
+    aes_key, salt = derive_aes_key(password=password)
+    dir_sync = DirSyncBatch()
+
+    def _encrypt(item):
+        file, st = item
+        aes_encrypt_file(
+            filepath=file, aes_key=aes_key, salt=salt, armor=armor, replace=replace,
+            durability=durability, dir_sync=dir_sync
+        )
+        return st.st_size
+
+    with dir_sync:
+        return _run_aes_batch(_encrypt, _walk_files(root_dir), jobs=jobs, action='encrypted')
+
+
+def aes_decrypt_dir(root_dir:Path, password, armor=False, replace=False, jobs:int=None, durability:str=DEFAULT_DURABILITY):
+    """
+    Decrypts every `.bin` (or `.asc` if `armor`) file of `root_dir` and of all
+    its subdirectories. The key is derived once per distinct salt and reused
+    from the key cache for the other files.
+
+    Returns:
+    --------
+        tuple(`int`, ByteSize()): (number of files decrypted, total size in Bytes)
+    """
+    suffix = '.asc' if armor else '.bin'
+    files = (item for item in _walk_files(root_dir) if item[0].suffix == suffix)
+    dir_sync = DirSyncBatch()
+
+    def _decrypt(item):
+        file, st = item
+        if not aes_decrypt_file(
+            filepath=file, password=password, armor=armor, replace=replace,
+            durability=durability, dir_sync=dir_sync
+        ):
+            raise ValueError("wrong password")
+        return st.st_size
+
+    with dir_sync:
+        return _run_aes_batch(_decrypt, files, jobs=jobs, action='decrypted')
+
+
+def _run_aes_batch(func, files, jobs, action):
+    file_count = 0
+    data_size = 0
+    for (file, _), size, error in _map_files(func, files, jobs=jobs):
+        if error is not None:
+            print(f"\nERROR: The following file could not be {action} ({error}):\n - {file}\n")
+            continue
+        file_count += 1
+        data_size += size
+
+    return file_count, ByteSize(data_size)
 
 
 # Example usage
@@ -0,0 +1,273 @@
+# Single-container archive of a whole directory tree
+#
+# Author: Indrajit Ghosh
+#
+# Created on: Oct 18, 2026
+#
+# Layout of an archive:
+#
+#   MARKER | ARCHIVE_MAGIC | version
+#   data stream  : the content of all files, back to back
+#   index stream : zlib-compressed JSON of the files
+#   index_length : 8 bytes, big endian
+#
+# Both streams use the segmented format of `streaming.py` with the stream
+# key of the fernet key. The index lists, for every file, its path relative
+# to the archived directory, its offset and size in the data stream, its
+# mode and its mtime, and every directory with its mode and mtime (so that
+# empty ones survive a round trip; archives without `dirs` are still read):
+#
+#   {"version": 1, "data_prefix": ..., "files": [[rel, offset, size, mode, mtime_ns], ...],
+#    "dirs": [[rel, mode, mtime_ns], ...]}
+#
+# Since the data stream is not compressed, a single file is extracted by
+# decrypting only the segments holding it (see `streaming.SegmentedStream`).
+#
+
+import io, json, os, stat, struct
+from pathlib import Path
+
+from atomic_io import atomic_write, DirSyncBatch, DEFAULT_DURABILITY
+from compressors import CODEC_ZLIB
+from streaming import encrypt_stream, decrypt_stream, parse_header, SegmentedStream, StreamReader, StreamFormatError, HEADER_SIZE
+
+ARCHIVE_MAGIC = b'\x00LKA'
+ARCHIVE_VERSION = 1
+INDEX_VERSION = 1
+READ_SIZE = 1024 * 1024
+
+_TRAILER = struct.Struct('>Q')
+
+
+class ArchiveError(ValueError):
+    """Raised for a malformed archive or a path not in it."""
+
+
+class _ConcatReader:
+    """
+    Reads the files of `items` (tuples of `Path` and `os.stat_result`) back
+    to back, as one file object, and records their index entries. `read(n)`
+    returns exactly `n` bytes until the end, as `encrypt_stream()` expects.
+    Files that vanish before they are read are left out.
+    """
+
+    def __init__(self, root_dir:Path, items):
+        self.root_dir = root_dir
+        self.entries = []
+        self._items = iter(items)
+        self._file = None
+        self._offset = 0
+        self._buf = bytearray()
+
+    def _next_file(self):
+        for path, st in self._items:
+            try:
+                self._file = open(path, 'rb')
+            except FileNotFoundError:
+                continue
+            rel = os.path.relpath(path, self.root_dir)
+            # size is filled in once the file is read completely
+            self.entries.append([rel, self._offset, 0, stat.S_IMODE(st.st_mode), st.st_mtime_ns])
+            return True
+        return False
+
+    def read(self, n:int):
+        while len(self._buf) < n:
+            if self._file is None and not self._next_file():
+                break
+            chunk = self._file.read(max(READ_SIZE, n - len(self._buf)))
+            if chunk:
+                self._buf += chunk
+                self._offset += len(chunk)
+                self.entries[-1][2] += len(chunk)
+            else:
+                self._file.close()
+                self._file = None
+
+        out = bytes(self._buf[:n])
+        del self._buf[:n]
+        return out
+
+
+class _HeaderRecorder:
+    """Passes writes on to `file` and keeps the first `HEADER_SIZE` bytes."""
+
+    def __init__(self, file):
+        self.file = file
+        self.header = b''
+
+    def write(self, data):
+        if len(self.header) < HEADER_SIZE:
+            self.header += bytes(data[:HEADER_SIZE - len(self.header)])
+        return self.file.write(data)
+
+
+def create_archive(archive_path:Path, root_dir:Path, files, key:bytes, marker:bytes=b'',
+                   durability:str=DEFAULT_DURABILITY, dir_sync:DirSyncBatch=None, dirs=()):
+    """
+    Packs `files` (an iterable of tuples of `Path` and `os.stat_result`, as
+    yielded by `encryption._walk_files()`) below `root_dir` into the
+    encrypted archive `archive_path`, which is written atomically.
+    `dirs` (tuples of `Path` and `os.stat_result` as well) are the
+    directories below `root_dir` to recreate on extraction, empty or not.
+
+    Returns:
+    --------
+        list of index entries [rel, offset, size, mode, mtime_ns]
+    """
+    root_dir = Path(root_dir)
+    src = _ConcatReader(root_dir, files)
+    dir_entries = [[os.path.relpath(d, root_dir), stat.S_IMODE(st.st_mode), st.st_mtime_ns] for d, st in dirs]
+
+    with atomic_write(archive_path, durability=durability, batch=dir_sync) as f:
+        f.write(marker + ARCHIVE_MAGIC + bytes([ARCHIVE_VERSION]))
+        data = _HeaderRecorder(f)
+        encrypt_stream(src, data, key=key)
+        data_prefix = parse_header(data.header)['nonce_prefix']
+
+        doc = json.dumps({'version': INDEX_VERSION, 'data_prefix': data_prefix.hex(), 'files': src.entries,
+                          'dirs': dir_entries})
+        index_length = encrypt_stream(io.BytesIO(doc.encode()), f, key=key, codec=CODEC_ZLIB)
+        f.write(_TRAILER.pack(index_length))
+
+    return src.entries
+
+
+def is_archive(filepath:Path, marker:bytes=b''):
+    """Returns True if `filepath` starts with `marker` and the archive magic."""
+    try:
+        with open(filepath, 'rb') as f:
+            return f.read(len(marker) + len(ARCHIVE_MAGIC)) == marker + ARCHIVE_MAGIC
+    except FileNotFoundError:
+        return False
+
+
+class ArchiveReader:
+    """
+    Reads an archive written by `create_archive()`. Only the index is
+    decrypted up front; a file is decrypted when it is read.
+
+    Example:
+    --------
+        >>> with ArchiveReader(archive_path, key=ctx.stream_key, marker=MARKER) as archive:
+        ...     data = archive.read('docs/notes.txt')
+        ...     archive.extractall(target_dir)
+    """
+
+    def __init__(self, archive_path:Path, key:bytes, marker:bytes=b''):
+        self.path = Path(archive_path)
+        self._f = open(self.path, 'rb')
+        try:
+            self._open(key, marker)
+        except BaseException:
+            self._f.close()
+            raise
+
+    def _open(self, key:bytes, marker:bytes):
+        size = os.fstat(self._f.fileno()).st_size
+        head = self._f.read(len(marker) + len(ARCHIVE_MAGIC) + 1)
+        if head[:-1] != marker + ARCHIVE_MAGIC:
+            raise ArchiveError(f"Not an archive: {self.path}")
+        if head[-1] != ARCHIVE_VERSION:
+            raise ArchiveError(f"Unsupported archive version {head[-1]}")
+        data_start = len(head)
+        if size < data_start + _TRAILER.size:
+            raise ArchiveError(f"Truncated archive: {self.path}")
+
+        self._f.seek(size - _TRAILER.size)
+        index_length, = _TRAILER.unpack(self._f.read(_TRAILER.size))
+        index_start = size - _TRAILER.size - index_length
+        if index_start < data_start:
+            raise ArchiveError(f"Truncated archive: {self.path}")
+
+        self._f.seek(index_start)
+        index = io.BytesIO()
+        decrypt_stream(io.BytesIO(self._f.read(index_length)), index, key=key)
+        doc = json.loads(index.getvalue())
+
+        self.data = SegmentedStream(self._f, key=key, start=data_start, length=index_start - data_start)
+        if bytes.fromhex(doc['data_prefix']) != self.data.nonce_prefix:
+            raise StreamFormatError("The index does not belong to this archive")
+
+        self.entries = doc['files']
+        self.dirs = doc.get('dirs', [])
+        self._by_name = {entry[0]: entry for entry in self.entries}
+
+    def names(self):
+        """Paths of the archived files, relative to the archived directory."""
+        return [entry[0] for entry in self.entries]
+
+    def _entry(self, name:str):
+        try:
+            return self._by_name[os.path.normpath(name)]
+        except KeyError:
+            raise ArchiveError(f"No such file in the archive: {name}") from None
+
+    def read(self, name:str):
+        """Returns the content of the archived file `name`."""
+        _, offset, size, _, _ = self._entry(name)
+        return self.data.read_range(offset, size)
+
+    def open(self, name:str):
+        """
+        Returns a read-only, seekable binary file object for the archived
+        file `name`; see `streaming.StreamReader`.
+        """
+        _, offset, size, _, _ = self._entry(name)
+        return io.BufferedReader(StreamReader(self.data, start=offset, size=size), buffer_size=self.data.segment_size)
+
+    @staticmethod
+    def _target(target_dir:Path, rel:str):
+        """Returns `target_dir / rel`; raises `ArchiveError` if that is outside `target_dir`."""
+        target_dir = Path(target_dir).absolute()
+        dest = target_dir / rel
+        if os.path.isabs(rel) or os.path.normpath(dest) != str(dest) or target_dir not in dest.parents:
+            raise ArchiveError(f"Unsafe path in the archive: {rel}")
+        return dest
+
+    def extract(self, name:str, target_dir:Path, durability:str=DEFAULT_DURABILITY, dir_sync:DirSyncBatch=None):
+        """
+        Writes the archived file `name` below `target_dir`, with its mode and
+        mtime, and returns its path.
+        """
+        rel, offset, size, mode, mtime_ns = self._entry(name)
+        dest = self._target(target_dir, rel)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_write(dest, durability=durability, batch=dir_sync) as f:
+            for chunk in self.data.iter_range(offset, size):
+                f.write(chunk)
+        os.chmod(dest, mode)
+        os.utime(dest, ns=(mtime_ns, mtime_ns))
+        return dest
+
+    def extractall(self, target_dir:Path, durability:str=DEFAULT_DURABILITY):
+        """
+        Extracts every file in archive order, so that each segment of the
+        data stream is decrypted once, and recreates the archived dirs (also
+        the empty ones) with their mode and mtime. Returns the number of
+        files and bytes.
+        """
+        dirs = [(self._target(target_dir, rel), mode, mtime_ns) for rel, mode, mtime_ns in self.dirs]
+        for path, _, _ in dirs:
+            path.mkdir(parents=True, exist_ok=True)
+
+        total = 0
+        with DirSyncBatch() as dir_sync:
+            for entry in self.entries:
+                self.extract(entry[0], target_dir, durability=durability, dir_sync=dir_sync)
+                total += entry[2]
+
+        # Deepest first, after the files, whose creation changes the mtimes
+        for path, mode, mtime_ns in sorted(dirs, key=lambda d: len(d[0].parts), reverse=True):
+            os.chmod(path, mode)
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+        return len(self.entries), total
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,432 @@
+# asyncio front end of Locker for servers
+#
+# Author: Indrajit Ghosh
+#
+# Created on: Oct 18, 2026
+#
+# File I/O and cipher work run on one bounded thread pool shared by all
+# coroutines, so the event loop never blocks. At most `max_pending` jobs
+# per event loop are submitted to the pool; further callers wait for a
+# slot (backpressure) instead of piling up work. The chunk streams are the
+# exception: their worker waits for the coroutine between chunks, so each
+# one runs on a thread of its own and never holds a worker of the pool.
+#
+# Cancellation takes effect at file (or chunk) boundaries: a cancelled
+# coroutine waits for the file being processed to be finished or rolled
+# back, so no file is ever left half-written (see `atomic_io.py`).
+#
+
+import asyncio, functools, hashlib, threading, weakref
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import Path
+
+from encryption import (encrypt_file, is_file_encrypted, load_cipher_context, default_jobs, _walk_files, ByteSize, MARKER,
+                        NOT_TO_ENCRYPT, DOT_ENCRYPTED_FILENAME)
+from decryption import decrypt_file, _is_stream_encrypted
+from streaming import encrypt_stream, decrypt_stream, cipher_from_name, CIPHER_AESGCM, DEFAULT_SEGMENT_SIZE
+from compressors import codec_from_name, CODEC_NONE
+from atomic_io import atomic_write, DirSyncBatch, DEFAULT_DURABILITY
+from journal import ProgressJournal, OP_ENCRYPT, OP_DECRYPT, MANIFEST_SUFFIX
+
+WALK_BATCH = 256 # Files fetched from the walker per executor call
+CHUNK_QUEUE_SIZE = 8 # Chunks buffered between a coroutine and its worker thread
+
+_executor = None
+_max_pending = None
+_limits = weakref.WeakKeyDictionary() # event loop -> asyncio.Semaphore
+_config_lock = threading.Lock()
+
+
+def configure(max_workers:int=None, max_pending:int=None):
+    """
+    Sets the size of the worker pool (default: the CPU count) and the max.
+    number of jobs submitted to it per event loop (default: 4 per worker).
+    Call it before the first job; the old pool is shut down.
+    """
+    global _executor, _max_pending
+    with _config_lock:
+        old = _executor
+        max_workers = default_jobs() if max_workers is None else max(1, int(max_workers))
+        _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='locker')
+        _max_pending = 4 * max_workers if max_pending is None else max(1, int(max_pending))
+        _limits.clear()
+    if old is not None:
+        old.shutdown(wait=False)
+
+
+def _pool():
+    if _executor is None:
+        configure()
+    return _executor
+
+
+def _limiter():
+    _pool()
+    loop = asyncio.get_running_loop()
+    sem = _limits.get(loop)
+    if sem is None:
+        sem = _limits[loop] = asyncio.Semaphore(_max_pending)
+    return sem
+
+
+async def _run_on_pool(func, *args, **kwargs):
+    """
+    Runs `func(*args, **kwargs)` on the worker pool. If the caller is
+    cancelled meanwhile, the call is still waited for before
+    `CancelledError` propagates.
+    """
+    fut = asyncio.get_running_loop().run_in_executor(_pool(), functools.partial(func, *args, **kwargs))
+    try:
+        return await asyncio.shield(fut)
+    except asyncio.CancelledError:
+        await asyncio.wait({fut})
+        raise
+
+
+def _run_on_thread(func):
+    """
+    Runs `func()` on a new thread and returns an asyncio future of its
+    result. On the pool, workers waiting for their coroutine could take
+    every thread, e.g. a `decrypt_chunks_async()` piped into an
+    `encrypt_chunks_async()`, and deadlock.
+    """
+    fut = Future()
+
+    def _run():
+        if not fut.set_running_or_notify_cancel():
+            return
+        try:
+            fut.set_result(func())
+        except BaseException as e:
+            fut.set_exception(e)
+
+    threading.Thread(target=_run, name='locker-stream', daemon=True).start()
+    return asyncio.wrap_future(fut)
+
+
+async def _offload(func, *args, **kwargs):
+    """`_run_on_pool()` once one of the `max_pending` slots is free."""
+    async with _limiter():
+        return await _run_on_pool(func, *args, **kwargs)
+
+
+async def encrypt_file_async(filepath:Path, fernet_file:Path, **kwargs):
+    """Async `encryption.encrypt_file()`; `print_status` defaults to False."""
+    kwargs.setdefault('print_status', False)
+    return await _offload(encrypt_file, filepath, fernet_file, **kwargs)
+
+
+async def decrypt_file_async(encrypted_file:Path, fernet_file:Path, **kwargs):
+    """Async `decryption.decrypt_file()`; `print_status` defaults to False."""
+    kwargs.setdefault('print_status', False)
+    return await _offload(decrypt_file, encrypted_file, fernet_file, **kwargs)
+
+
+def _next_batch(files):
+    batch = []
+    for item in files:
+        batch.append(item)
+        if len(batch) >= WALK_BATCH:
+            break
+    return batch
+
+
+async def _run_tree(root_dir:Path, ignore:list, walk_options:dict, process, journal:ProgressJournal):
+    """
+    Walks `root_dir` in batches on the pool and runs `process(file, st)` on
+    the pool for every file, with at most `max_pending` jobs in flight.
+    The `journal` is closed as completed only if every file got through.
+
+    Returns:
+    --------
+        tuple(`int`, ByteSize()): (number of files processed, total size in Bytes)
+    """
+    files = _walk_files(root_dir, ignore=ignore, **walk_options)
+    tasks = set()
+    file_count = 0
+    data_size = 0
+    completed = False
+
+    def _collect(task):
+        nonlocal file_count, data_size
+        tasks.discard(task)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            print(f"\nERROR: The following file could not be processed ({error}):\n - {task.get_name()}\n")
+        elif task.result() is not None:
+            file_count += 1
+            data_size += task.result()
+
+    limiter = _limiter()
+    try:
+        while True:
+            batch = await _offload(_next_batch, files)
+            if not batch:
+                break
+            for file, st in batch:
+                # Take the slot before creating the task, so that huge
+                # trees never build up a backlog of tasks
+                await limiter.acquire()
+                task = asyncio.ensure_future(_run_on_pool(process, file, st))
+                task.set_name(str(file))
+                task.add_done_callback(lambda task: limiter.release())
+                task.add_done_callback(_collect)
+                tasks.add(task)
+
+        if tasks:
+            await asyncio.wait(set(tasks))
+        completed = True
+    finally:
+        if tasks:
+            # Cancelled: running jobs are finished (or rolled back) first
+            for task in tasks:
+                task.cancel()
+            await asyncio.wait(set(tasks))
+        if journal is not None:
+            await _offload(journal.close, completed=completed)
+
+    return file_count, ByteSize(data_size)
+
+
+async def encrypt_dir_async(root_dir:Path, fernet_file:Path, durability:str=DEFAULT_DURABILITY, resume:bool=True,
+                            compress:str=None, cipher:str=None, **walk_options):
+    """
+    Async `encryption.encrypt_dir()` without console output. The journal
+    and manifest are kept as there, so a cancelled run resumes where it
+    stopped.
+
+    Returns:
+    --------
+        tuple(`int`, ByteSize()): (number of files encrypted, total size in Bytes)
+    """
+    root_dir = Path(root_dir)
+    ctx = load_cipher_context(fernet_file)
+    journal_file = root_dir / DOT_ENCRYPTED_FILENAME
+    ignore = NOT_TO_ENCRYPT + [journal_file, root_dir / (DOT_ENCRYPTED_FILENAME + MANIFEST_SUFFIX)]
+    journal = None
+    if resume:
+        journal = await _offload(ProgressJournal, root_dir, journal_file, op=OP_ENCRYPT, key=ctx.stream_key)
+    dir_sync = DirSyncBatch()
+
+    def _encrypt(file, st):
+        if journal is not None and journal.is_done(file, st):
+            return None
+        digest = hashlib.sha256() if journal is not None else None
+        result = encrypt_file(file, ctx, print_status=False, durability=durability, dir_sync=dir_sync,
+                              digest=digest, compress=compress, cipher=cipher)
+        if journal is not None:
+            journal.record(file, digest=None if result == -1 else digest.hexdigest())
+        return st.st_size
+
+    try:
+        return await _run_tree(root_dir, ignore, walk_options, _encrypt, journal)
+    finally:
+        await _offload(dir_sync.flush)
+
+
+async def decrypt_dir_async(root_dir:Path, fernet_file:Path, durability:str=DEFAULT_DURABILITY, resume:bool=True,
+                            **walk_options):
+    """
+    Async `decryption.decrypt_dir()` without console output; see
+    `encrypt_dir_async()`. Archived trees are not supported here.
+
+    Returns:
+    --------
+        tuple(`int`, ByteSize()): (number of files decrypted, total size in Bytes)
+    """
+    root_dir = Path(root_dir)
+    ctx = load_cipher_context(fernet_file)
+    journal_file = root_dir / DOT_ENCRYPTED_FILENAME
+    ignore = [journal_file, root_dir / (DOT_ENCRYPTED_FILENAME + MANIFEST_SUFFIX)]
+    journal = None
+    if resume:
+        journal = await _offload(ProgressJournal, root_dir, journal_file, op=OP_DECRYPT, key=ctx.stream_key)
+    dir_sync = DirSyncBatch()
+
+    def _decrypt(file, st):
+        if journal is not None:
+            if journal.is_done(file, st):
+                return None
+            if journal.has_manifest and not journal.is_known(file) and not is_file_encrypted(file):
+                # Not in the manifest: plaintext added later, unless it was
+                # encrypted on its own since (e.g. by `encrypt_file()`)
+                return None
+        result = decrypt_file(file, ctx, print_status=False, durability=durability, dir_sync=dir_sync)
+        if result == -1:
+            return None
+        if journal is not None:
+            journal.record(file)
+        return st.st_size
+
+    try:
+        return await _run_tree(root_dir, ignore, walk_options, _decrypt, journal)
+    finally:
+        await _offload(dir_sync.flush)
+
+
+class _Cancelled(Exception):
+    """Raised inside a worker thread whose coroutine was cancelled."""
+
+
+class _QueueReader:
+    """
+    File object read by a worker thread, fed with chunks by a coroutine
+    through the asyncio queue `queue`. `read(n)` returns exactly `n` bytes
+    until the end, as `encrypt_stream()` expects.
+    """
+
+    def __init__(self, queue:asyncio.Queue, loop):
+        self._queue = queue
+        self._loop = loop
+        self._buf = bytearray()
+        self._eof = False
+
+    def read(self, n:int):
+        while len(self._buf) < n and not self._eof:
+            chunk = asyncio.run_coroutine_threadsafe(self._queue.get(), self._loop).result()
+            if chunk is None:
+                self._eof = True
+            elif chunk is _Cancelled:
+                raise _Cancelled()
+            else:
+                self._buf += chunk
+        out = bytes(self._buf[:n])
+        del self._buf[:n]
+        return out
+
+
+async def encrypt_chunks_async(chunks, dst:Path, fernet_file:Path, cipher:str=None, compress:str=None,
+                               durability:str=DEFAULT_DURABILITY, segment_size:int=DEFAULT_SEGMENT_SIZE):
+    """
+    Encrypts the byte chunks of the (async or plain) iterable `chunks`, e.g.
+    the body of an upload, into the new file `dst` in the streaming format,
+    i.e. as `encrypt_file(..., stream=True)` would. At most
+    `CHUNK_QUEUE_SIZE` chunks are buffered, so a fast producer is slowed
+    down to the speed of the cipher and the disk. `dst` appears atomically
+    once everything is written; if cancelled before the last chunk was
+    handed over, it is not created.
+    `compress` is a codec name ('zlib', 'lzma', 'zstd'); 'auto' cannot
+    sample a stream and means no compression here.
+
+    Returns:
+    --------
+        size of `dst`
+    """
+    ctx = load_cipher_context(fernet_file)
+    codec = CODEC_NONE if compress in (None, 'none', 'auto') else codec_from_name(compress)
+    cipher_id = CIPHER_AESGCM if cipher is None else cipher_from_name(cipher)
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=CHUNK_QUEUE_SIZE)
+    src = _QueueReader(queue, loop)
+
+    def _write():
+        with atomic_write(dst, durability=durability) as f:
+            return encrypt_stream(src, f, key=ctx.stream_key, marker=MARKER, segment_size=segment_size,
+                                  codec=codec, cipher=cipher_id)
+
+    worker = _run_on_thread(_write)
+
+    async def _put(chunk):
+        # Stop waiting for room in the queue if the worker failed
+        put = asyncio.ensure_future(queue.put(chunk))
+        await asyncio.wait({put, worker}, return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            put.cancel()
+            worker.result()
+
+    try:
+        if hasattr(chunks, '__aiter__'):
+            async for chunk in chunks:
+                await _put(bytes(chunk))
+        else:
+            for chunk in chunks:
+                await _put(bytes(chunk))
+        await _put(None)
+        return await asyncio.shield(worker)
+    except BaseException:
+        if not worker.done():
+            # Unblock the worker and make it roll back
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(_Cancelled)
+            await asyncio.wait({worker})
+            if not worker.cancelled():
+                worker.exception()  # retrieved; the original error wins
+        raise
+
+
+class _QueueWriter:
+    """File object written by a worker thread, handing the data to a coroutine."""
+
+    def __init__(self, queue:asyncio.Queue, loop, cancelled:threading.Event):
+        self._queue = queue
+        self._loop = loop
+        self._cancelled = cancelled
+
+    def write(self, data):
+        if self._cancelled.is_set():
+            raise _Cancelled()
+        if data:
+            asyncio.run_coroutine_threadsafe(self._queue.put(bytes(data)), self._loop).result()
+        return len(data)
+
+
+def _decrypt_fernet_file(encrypted_file:Path, ctx):
+    with open(encrypted_file, 'rb') as f:
+        if f.read(len(MARKER)) != MARKER:
+            raise ValueError(f"Not an encrypted file: {encrypted_file}")
+        return ctx.fernet.decrypt(f.read())
+
+
+async def decrypt_chunks_async(encrypted_file:Path, fernet_file:Path):
+    """
+    Async generator of the plaintext chunks (one segment each) of an
+    encrypted file, without writing it to disk. A file in the Fernet format
+    is decrypted in one go and yielded as a single chunk. Otherwise the
+    worker thread runs at most `CHUNK_QUEUE_SIZE` chunks ahead of the
+    consumer. Every chunk is authenticated before it is yielded, but a
+    truncated or tampered file is only detected when its chunk is reached.
+
+    Example:
+    --------
+        >>> async for chunk in decrypt_chunks_async(path, fernet_file):
+        ...     await response.write(chunk)
+    """
+    ctx = load_cipher_context(fernet_file)
+    if not await _offload(_is_stream_encrypted, encrypted_file):
+        yield await _offload(_decrypt_fernet_file, encrypted_file, ctx)
+        return
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=CHUNK_QUEUE_SIZE)
+    cancelled = threading.Event()
+    done = object()
+
+    def _read():
+        try:
+            with open(encrypted_file, 'rb') as src:
+                decrypt_stream(src, _QueueWriter(queue, loop, cancelled), key=ctx.stream_key, marker=MARKER)
+        finally:
+            if not cancelled.is_set():
+                asyncio.run_coroutine_threadsafe(queue.put(done), loop).result()
+
+    worker = _run_on_thread(_read)
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is done:
+                break
+            yield chunk
+        await worker  # re-raises InvalidTag etc.
+    finally:
+        if not worker.done():
+            cancelled.set()
+            while not worker.done():
+                # Unblock a worker waiting for room in the queue
+                while not queue.empty():
+                    queue.get_nowait()
+                await asyncio.wait({worker}, timeout=0.05)
+            if not worker.cancelled():
+                worker.exception()  # retrieved; it is the `_Cancelled` we caused
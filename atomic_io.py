@@ -0,0 +1,145 @@
+# Crash-safe file replacement: temp file -> fsync -> atomic rename
+#
+# Author: Indrajit Ghosh
+#
+# Created on: Oct 18, 2026
+#
+# Durability levels:
+#   'none'  : atomic rename only; nothing is fsync'ed
+#   'file'  : fsync the file data and its directory for every file
+#   'batch' : fsync the file data for every file, but the directories only
+#             once per `DirSyncBatch` flush (i.e. once per directory for a
+#             whole batch of files)
+#
+
+import os, shutil, threading
+from contextlib import contextmanager
+from pathlib import Path
+
+DURABILITY_NONE = 'none'
+DURABILITY_FILE = 'file'
+DURABILITY_BATCH = 'batch'
+DURABILITY_LEVELS = (DURABILITY_NONE, DURABILITY_FILE, DURABILITY_BATCH)
+DEFAULT_DURABILITY = DURABILITY_BATCH
+TEMP_SUFFIX = '.locker-tmp'
+
+
+def temp_path_for(filepath:Path):
+    """
+    Returns a hidden sibling path of `filepath` to write into before
+    replacing `filepath` itself.
+    """
+    filepath = Path(filepath)
+    return filepath.with_name(f".{filepath.name}{TEMP_SUFFIX}")
+
+
+def is_temp_path(filepath:Path):
+    """Returns True for the leftovers of an interrupted `atomic_write()`."""
+    name = Path(filepath).name
+    return name.startswith('.') and name.endswith(TEMP_SUFFIX)
+
+
+def fsync_dir(dirpath:Path):
+    """fsync a directory so that renames and unlinks inside it are durable."""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return  # e.g. Windows, where directories cannot be fsync'ed
+    fd = os.open(dirpath, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _check_durability(durability:str):
+    if durability not in DURABILITY_LEVELS:
+        raise ValueError(f"durability must be one of {DURABILITY_LEVELS}, not {durability!r}")
+
+
+class DirSyncBatch:
+    """
+    Collects the directories touched by `atomic_write()` and fsyncs each of
+    them once on `flush()`. A flush also happens automatically after every
+    `batch_size` files. Safe to share between worker threads.
+
+    Example:
+    --------
+        >>> with DirSyncBatch() as batch:
+        ...     for file in files:
+        ...         with atomic_write(file, durability='batch', batch=batch) as f:
+        ...             f.write(data)
+    """
+
+    def __init__(self, batch_size:int=1000):
+        self.batch_size = batch_size
+        self._dirs = set()
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def add(self, dirpath:Path):
+        with self._lock:
+            self._dirs.add(str(dirpath))
+            self._count += 1
+            flush = self._count >= self.batch_size
+        if flush:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            dirs, self._dirs = self._dirs, set()
+            self._count = 0
+        for d in dirs:
+            fsync_dir(d)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+
+def sync_dir_of(filepath:Path, durability:str=DEFAULT_DURABILITY, batch:DirSyncBatch=None):
+    """
+    Makes a rename or unlink inside the directory of `filepath` durable
+    according to `durability`. Without a `batch`, 'batch' behaves as 'file'.
+    """
+    _check_durability(durability)
+    parent = Path(filepath).absolute().parent
+    if durability == DURABILITY_BATCH and batch is not None:
+        batch.add(parent)
+    elif durability != DURABILITY_NONE:
+        fsync_dir(parent)
+
+
+@contextmanager
+def atomic_write(filepath:Path, durability:str=DEFAULT_DURABILITY, batch:DirSyncBatch=None, mode_from:Path=None):
+    """
+    Opens a temporary sibling of `filepath` for binary writing; on a clean
+    exit it is fsync'ed (unless `durability` is 'none') and renamed over
+    `filepath`. If the block raises, the temporary file is removed and
+    `filepath` is left untouched.
+
+    Arguments:
+    ----------
+        `filepath`: Path() of the file to (re)place
+        `durability`: one of `DURABILITY_LEVELS`
+        `batch`: `DirSyncBatch` collecting the directory fsyncs for 'batch'
+        `mode_from`: copy the permission bits of this file (e.g. the file
+                     being replaced)
+    """
+    _check_durability(durability)
+    filepath = Path(filepath)
+    tmp = temp_path_for(filepath)
+    try:
+        with open(tmp, 'wb') as f:
+            yield f
+            f.flush()
+            if durability != DURABILITY_NONE:
+                os.fsync(f.fileno())
+        if mode_from is not None:
+            shutil.copymode(mode_from, tmp)
+        os.replace(tmp, filepath)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+    sync_dir_of(filepath, durability=durability, batch=batch)
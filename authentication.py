@@ -15,16 +15,18 @@ load_dotenv(dotenv_path)
 SECRET_KEY = os.environ.get("HASHED_PASSWORD")
 SALT = os.environ.get("SALT")
 
-import hashlib
+import hashlib, hmac, getpass
 from pathlib import Path
 DOT_ENV_FILE = Path(__file__).parent.resolve() / '.env'
+CREDENTIALS_FILE = Path(__file__).parent.resolve() / '.credentials.json'
+
+from credentials import CredentialStore
 
 PWINPUT = True
 try:
     import pwinput
 except ModuleNotFoundError:
     PWINPUT = False
-    import getpass
 
 INDENT = "    "
 SUBHEADING = '\033[1m' + '\x1b[38;2;255;127;80m'
@@ -38,7 +40,87 @@ def sha256_hash(raw_text):
     return hashed
 
 
-def input_secret_key():
+_store = None
+
+
+def get_store(filepath:Path=CREDENTIALS_FILE):
+    """Returns the `CredentialStore` of `filepath`, loaded once per process."""
+    global _store
+    if _store is None or _store.path != Path(filepath):
+        _store = CredentialStore(filepath)
+    return _store
+
+
+def default_user():
+    """The user name to authenticate: `$LOCKER_USER`, else the login name."""
+    return os.environ.get("LOCKER_USER") or getpass.getuser()
+
+
+def _legacy_user(user:str, store:CredentialStore):
+    """
+    Returns True if `user` may still log in with the legacy sha256 hash of
+    `.env`: it was the password of the one local user, so it is honoured
+    only for `default_user()` and only until the store has a user.
+    """
+    return SECRET_KEY is not None and not store.users and user == default_user()
+
+
+def has_password(user:str=None):
+    """Returns True if a password is set for `user` (or the legacy `.env` one)."""
+    user = default_user() if user is None else user
+    store = get_store()
+    return user in store or _legacy_user(user, store)
+
+
+def check_password(password:str, user:str=None):
+    """
+    Verifies `password` of `user` against the credential store (scrypt).
+    Before the store has any user, `default_user()` is checked against the
+    legacy sha256 hash of `.env` and, if that matches, moved into the store;
+    from then on the legacy hash is ignored.
+    Return: True or False
+    """
+    user = default_user() if user is None else user
+    store = get_store()
+    if not _legacy_user(user, store):
+        return store.verify(user, password)
+
+    if not hmac.compare_digest(sha256_hash(password + SALT), SECRET_KEY):
+        return False
+    store.set_password(user, password)
+    print(f"\nThe password of `{user}` is moved to `{store.path}`; the `HASHED_PASSWORD` in `.env` "
+          f"is no longer used and can be removed.\n", file=sys.stderr)
+    return True
+
+
+def read_password(env:str=None, fd:int=None, filepath:Path=None):
+    """
+    Reads the password without a prompt, for scripts: from the environment
+    variable `env`, the first line of the file descriptor `fd` (e.g. a pipe
+    set up by the caller) or the first line of the file `filepath`, which
+    should be readable by its owner only.
+    Return: the password, or None if no source is given
+    """
+    if env is not None:
+        if env not in os.environ:
+            raise KeyError(f"The environment variable `{env}` is not set")
+        return os.environ[env]
+
+    if fd is not None:
+        with open(fd, closefd=False) as f:
+            return f.readline().rstrip('\r\n')
+
+    if filepath is not None:
+        filepath = Path(filepath)
+        if filepath.stat().st_mode & 0o077:
+            print(f"\nWARNING: The password file `{filepath}` is readable by others; chmod it to 600.\n", file=sys.stderr)
+        with open(filepath) as f:
+            return f.readline().rstrip('\r\n')
+
+    return None
+
+
+def input_secret_key(user:str=None):
     """
     Ask user for the secret key
     Return: True or False
@@ -48,13 +130,14 @@ def input_secret_key():
     else:
         res = getpass.getpass(f"\n{INDENT}{SUBHEADING}Kindly enter the `password`{RESET}: ")
 
-    return sha256_hash(res + SALT) == SECRET_KEY
+    return check_password(res, user=user)
 
 
-def save_password(filepath:Path=DOT_ENV_FILE):
+def save_password(filepath:Path=CREDENTIALS_FILE, user:str=None):
     """
-    Take password from user and then saves the sha256().hex of that password
-    into `.env` together with a random salt.
+    Take password from user and then saves its scrypt hash, with a random
+    per-user salt, into the credential store `filepath`. The scrypt cost is
+    calibrated to this host when the store is created.
     """
     if PWINPUT:
         passwd = pwinput.pwinput(prompt=f"\n{INDENT}{SUBHEADING}Kindly enter a new `password`{RESET}: ", mask="*")
@@ -66,10 +149,10 @@ def save_password(filepath:Path=DOT_ENV_FILE):
 
     if passwd == passwd2:
         # Save password
-        salt = "sHIi2348@$sdfJK8923$9dfl" # TODO: make it random every time
-        with open(filepath, 'w') as f:
-            hashed_passwd = sha256_hash(passwd + salt)
-            f.write(f"HASHED_PASSWORD={hashed_passwd}\nSALT={salt}")
+        store = get_store(filepath)
+        if not store.path.exists():
+            store.calibrate()
+        store.set_password(default_user() if user is None else user, passwd)
 
         print("\nThe password saved successfully!\n")
 
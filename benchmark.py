@@ -0,0 +1,305 @@
+# Reproducible benchmarks for encryption, decryption, key derivation and
+# tree walking
+#
+# Author: Indrajit Ghosh
+#
+# Created on: Oct 18, 2026
+#
+# Usage:
+#   python3 benchmark.py --files 2000 --sizes lognormal:16K:1.5 --depth 3 -o now.json
+#   python3 benchmark.py --files 2000 --sizes lognormal:16K:1.5 --depth 3 --compare now.json
+#
+# A synthetic tree is generated from `--seed`, so two runs with the same
+# parameters work on byte-identical data. Every case runs `--repeat` times
+# and the median is reported, together with MB/s and files/s. The result is
+# a JSON document; `--compare` exits with status 1 if any case got slower
+# than a baseline document by more than `--tolerance`.
+#
+
+import argparse, json, os, platform, random, shutil, statistics, sys, tempfile, time
+from pathlib import Path
+
+import cryptography
+
+from encryption import encrypt_file, generate_fernet_key, CipherContext, ByteSize, format_time, _get_files_in
+from decryption import decrypt_file
+from aes_encryption import aes_encrypt_file, aes_decrypt_file, derive_aes_key, clear_key_cache
+from atomic_io import DURABILITY_LEVELS, DURABILITY_NONE
+
+BENCHMARK_VERSION = 1
+PASSWORD = 'locker-benchmark'
+CASES = ('walk', 'fernet', 'aes', 'kdf')
+_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_size(text:str):
+    """'512' -> 512, '4K' -> 4096, '1.5M' -> 1572864"""
+    text = text.strip().upper().rstrip('B')
+    unit = text[-1:] if text[-1:] in _UNITS else ''
+    return int(float(text[:len(text) - len(unit)]) * _UNITS[unit])
+
+
+def size_sampler(spec:str, rng:random.Random):
+    """
+    Returns a function drawing one file size from the distribution `spec`:
+
+        fixed:SIZE               every file has SIZE bytes
+        uniform:MIN:MAX          uniform between MIN and MAX
+        lognormal:MEDIAN:SIGMA   many small files and a long tail of big ones
+    """
+    kind, *args = spec.split(':')
+    try:
+        if kind == 'fixed' and len(args) == 1:
+            size = parse_size(args[0])
+            return lambda: size
+        if kind == 'uniform' and len(args) == 2:
+            low, high = parse_size(args[0]), parse_size(args[1])
+            return lambda: rng.randint(low, high)
+        if kind == 'lognormal' and len(args) == 2:
+            median, sigma = parse_size(args[0]), float(args[1])
+            return lambda: int(median * rng.lognormvariate(0, sigma))
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid size distribution {spec!r}")
+
+
+def generate_tree(root:Path, files:int, sizes:str='fixed:4K', depth:int=2, fanout:int=4,
+                  compressible:float=0.5, seed:int=0):
+    """
+    Writes `files` files into a tree of `fanout` directories per level,
+    `depth` levels deep, below `root`. Files are spread round-robin over all
+    directories. A `compressible` fraction of the files hold repetitive text,
+    the rest random bytes.
+
+    Returns:
+    --------
+        tuple(number of files, total size in Bytes)
+    """
+    rng = random.Random(seed)
+    draw = size_sampler(sizes, rng)
+
+    dirs = [Path(root)]
+    level = [Path(root)]
+    for _ in range(depth):
+        level = [d / f'd{i}' for d in level for i in range(fanout)]
+        dirs.extend(level)
+    for d in dirs:
+        d.mkdir(parents=True, exist_ok=True)
+
+    text = b'The quick brown fox jumps over the lazy dog. ' * 64
+    total = 0
+    for i in range(files):
+        size = draw()
+        if rng.random() < compressible:
+            data = (text * (size // len(text) + 1))[:size]
+        else:
+            data = rng.randbytes(size)
+        with open(dirs[i % len(dirs)] / f'f{i}.dat', 'wb') as f:
+            f.write(data)
+        total += size
+
+    return files, total
+
+
+def _time_runs(func, repeat:int):
+    """Returns the wall times of `repeat` calls of `func()`."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def _result(runs:list, files:int=0, size:int=0, ops:int=0):
+    seconds = statistics.median(runs)
+    res = {'seconds': seconds, 'runs': runs}
+    if files:
+        res['files'] = files
+        res['files_per_s'] = files / seconds if seconds else None
+    if size:
+        res['bytes'] = size
+        res['mb_per_s'] = size / (1024 ** 2) / seconds if seconds else None
+    if ops:
+        res['ops'] = ops
+        res['ops_per_s'] = ops / seconds if seconds else None
+    return res
+
+
+def run_benchmarks(root:Path, files:list, size:int, repeat:int=3, kdf_rounds:int=3, durability:str=DURABILITY_NONE,
+                   compress:str=None, cipher:str=None, stream:bool=None, cases:list=None):
+    """
+    Runs the benchmark `cases` (all by default) over the generated `files`
+    of total `size` below `root`. Every encryption case is followed by its
+    decryption case, which restores the tree for the next run.
+
+    Returns:
+    --------
+        dict: case name -> result
+    """
+    cases = cases or list(CASES)
+    results = {}
+    n = len(files)
+
+    if 'walk' in cases:
+        count = []
+        runs = _time_runs(lambda: count.append(sum(1 for _ in _get_files_in(root))), repeat)
+        results['walk'] = _result(runs, files=count[-1])
+
+    if 'fernet' in cases:
+        ctx = CipherContext(generate_fernet_key())
+        enc_runs, dec_runs = [], []
+        for _ in range(repeat):
+            enc_runs += _time_runs(lambda: [
+                encrypt_file(f, ctx, print_status=False, durability=durability,
+                             compress=compress, cipher=cipher, stream=stream)
+                for f in files
+            ], 1)
+            dec_runs += _time_runs(lambda: [
+                decrypt_file(f, ctx, print_status=False, durability=durability)
+                for f in files
+            ], 1)
+        results['encrypt_file'] = _result(enc_runs, files=n, size=size)
+        results['decrypt_file'] = _result(dec_runs, files=n, size=size)
+
+    if 'aes' in cases:
+        aes_key, salt = derive_aes_key(password=PASSWORD)
+        bins = [f.with_name(f.name + '.bin') for f in files]
+        enc_runs, dec_runs = [], []
+        for _ in range(repeat):
+            enc_runs += _time_runs(lambda: [
+                aes_encrypt_file(f, aes_key=aes_key, salt=salt, replace=True, durability=durability)
+                for f in files
+            ], 1)
+            dec_runs += _time_runs(lambda: [
+                aes_decrypt_file(b, password=PASSWORD, replace=True, durability=durability)
+                for b in bins
+            ], 1)
+        results['aes_encrypt_file'] = _result(enc_runs, files=n, size=size)
+        results['aes_decrypt_file'] = _result(dec_runs, files=n, size=size)
+
+    if 'kdf' in cases:
+        salt = b'\x00' * 16
+        runs = _time_runs(lambda: derive_aes_key(PASSWORD, salt=salt, use_cache=False), kdf_rounds)
+        results['derive_aes_key'] = _result(runs, ops=1)
+        clear_key_cache()
+        derive_aes_key(PASSWORD, salt=salt)
+        hits = 10000
+        runs = _time_runs(lambda: [derive_aes_key(PASSWORD, salt=salt) for _ in range(hits)], repeat)
+        results['derive_aes_key_cached'] = _result(runs, ops=hits)
+
+    return results
+
+
+def compare(results:dict, baseline:dict, tolerance:float=0.1):
+    """
+    Compares the median times of `results` with those of `baseline` (both
+    as returned by `run_benchmarks()`).
+
+    Returns:
+    --------
+        list of tuple(case, baseline seconds, seconds, change); only the cases
+        slower by more than `tolerance` (a fraction)
+    """
+    regressions = []
+    for case, res in results.items():
+        old = baseline.get(case)
+        if old is None or not old['seconds']:
+            continue
+        change = res['seconds'] / old['seconds'] - 1
+        if change > tolerance:
+            regressions.append((case, old['seconds'], res['seconds'], change))
+    return regressions
+
+
+def _environment():
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'cryptography': cryptography.__version__,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Locker on a synthetic directory tree")
+    parser.add_argument('--files', type=int, default=1000, help="number of files (default: 1000)")
+    parser.add_argument('--sizes', default='fixed:4K',
+                        help="size distribution: fixed:SIZE, uniform:MIN:MAX or lognormal:MEDIAN:SIGMA (default: fixed:4K)")
+    parser.add_argument('--depth', type=int, default=2, help="directory levels (default: 2)")
+    parser.add_argument('--fanout', type=int, default=4, help="subdirectories per directory (default: 4)")
+    parser.add_argument('--compressible', type=float, default=0.5, help="fraction of text files (default: 0.5)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help="runs per case; the median is reported (default: 3)")
+    parser.add_argument('--kdf-rounds', type=int, default=3, help="uncached key derivations (default: 3)")
+    parser.add_argument('--cases', nargs='+', choices=CASES, default=list(CASES))
+    parser.add_argument('--durability', choices=DURABILITY_LEVELS, default=DURABILITY_NONE,
+                        help="durability of the written files (default: none, i.e. no fsync)")
+    parser.add_argument('--compress', default=None, help="compression for encrypt_file, e.g. auto or zlib")
+    parser.add_argument('--cipher', default=None, help="stream cipher for encrypt_file: aesgcm or chacha20")
+    parser.add_argument('--stream', action='store_true', default=None, help="force the stream format")
+    parser.add_argument('--dir', type=Path, default=None, help="where to generate the tree (default: a temp dir)")
+    parser.add_argument('-o', '--output', type=Path, default=None, help="write the JSON here instead of stdout")
+    parser.add_argument('--compare', type=Path, default=None, help="baseline JSON to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="allowed slowdown vs. the baseline (default: 0.1)")
+    args = parser.parse_args()
+
+    params = {
+        k: getattr(args, k)
+        for k in ('files', 'sizes', 'depth', 'fanout', 'compressible', 'seed', 'repeat', 'kdf_rounds',
+                  'durability', 'compress', 'cipher', 'stream')
+    }
+
+    workdir = Path(tempfile.mkdtemp(prefix='locker-bench-', dir=args.dir))
+    try:
+        tree = workdir / 'tree'
+        start = time.perf_counter()
+        n, size = generate_tree(
+            tree, args.files, sizes=args.sizes, depth=args.depth, fanout=args.fanout,
+            compressible=args.compressible, seed=args.seed
+        )
+        print(f"Generated {n} files ({ByteSize(size):.2f}) in {format_time(time.perf_counter() - start)}", file=sys.stderr)
+
+        files = sorted(_get_files_in(tree))
+        results = run_benchmarks(
+            tree, files, size, repeat=args.repeat, kdf_rounds=args.kdf_rounds, durability=args.durability,
+            compress=args.compress, cipher=args.cipher, stream=args.stream, cases=args.cases
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'version': BENCHMARK_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'environment': _environment(),
+        'params': params,
+        'tree': {'files': n, 'bytes': size},
+        'results': results,
+    }
+
+    doc = json.dumps(report, indent=2)
+    if args.output is not None:
+        args.output.write_text(doc + '\n')
+    else:
+        print(doc)
+
+    for case, res in results.items():
+        rates = [f"{res[k]:.1f} {unit}" for k, unit in (('mb_per_s', 'MB/s'), ('files_per_s', 'files/s'), ('ops_per_s', 'ops/s'))
+                 if res.get(k)]
+        print(f"{case:>24}: {format_time(res['seconds']):>12}  {'  '.join(rates)}", file=sys.stderr)
+
+    if args.compare is not None:
+        baseline = json.loads(args.compare.read_text())
+        if baseline.get('params') != params:
+            print("\nWARNING: the baseline was run with different parameters\n", file=sys.stderr)
+        regressions = compare(results, baseline.get('results', {}), tolerance=args.tolerance)
+        for case, old, new, change in regressions:
+            print(f"\nREGRESSION: {case} took {format_time(new)} (baseline {format_time(old)}, +{change:.0%})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+# Optional compression stage applied before the stream cipher
+#
+# Author: Indrajit Ghosh
+#
+# Created on: Oct 18, 2026
+#
+# The codec of a file is recorded in the `flags` of its stream header (see
+# `streaming.py`), so decryption always picks the matching decompressor.
+# zlib and lzma come with Python; zstd is used only if the `zstandard`
+# package is installed.
+#
+
+import lzma, os, zlib
+from pathlib import Path
+
+try:
+    import zstandard
+except ModuleNotFoundError:
+    zstandard = None
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+CODEC_ZSTD = 3
+
+CODECS = {
+    'none': CODEC_NONE,
+    'zlib': CODEC_ZLIB,
+    'lzma': CODEC_LZMA,
+    'zstd': CODEC_ZSTD,
+}
+AUTO = 'auto'
+
+READ_SIZE = 256 * 1024
+MAX_OUTPUT = 1024 * 1024 # Bound on what one decompression step may produce
+# zstd decompressors have no output limit, so the input is fed in slices
+# that cannot exceed it: a block (at most 128 KiB of output) takes at least
+# 4 bytes, and a slice may also finish a block begun before it
+ZSTD_SLICE = (MAX_OUTPUT - 128 * 1024) // (128 * 1024 // 4)
+
+SAMPLE_SIZE = 64 * 1024
+SAMPLE_COUNT = 3
+MIN_SAVING = 0.1 # Compress only if the sample shrinks by at least 10%
+
+# Formats that are compressed already; never worth a second pass
+INCOMPRESSIBLE_SUFFIXES = {
+    '.7z', '.avi', '.br', '.bz2', '.docx', '.flac', '.gif', '.gz', '.heic',
+    '.jpeg', '.jpg', '.lz4', '.lzma', '.m4a', '.mkv', '.mov', '.mp3', '.mp4',
+    '.ogg', '.pdf', '.png', '.pptx', '.rar', '.tgz', '.webm', '.webp',
+    '.xlsx', '.xz', '.zip', '.zst',
+}
+
+
+class CompressionError(ValueError):
+    """Raised for an unknown or unavailable codec, or corrupt compressed data."""
+
+
+def available_codecs():
+    """Returns the names of the codecs usable on this host."""
+    return [name for name, codec in CODECS.items() if codec != CODEC_ZSTD or zstandard is not None]
+
+
+def default_codec():
+    """The codec used by 'auto': zstd if installed, else zlib."""
+    return CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+
+def codec_from_name(name:str):
+    """
+    Maps a codec name to its id. Raises `CompressionError` for unknown names
+    and for zstd when `zstandard` is not installed.
+    """
+    if name not in CODECS:
+        raise CompressionError(f"Unknown codec {name!r}; choose one of {list(CODECS)}")
+    codec = CODECS[name]
+    if codec == CODEC_ZSTD and zstandard is None:
+        raise CompressionError("The zstd codec needs the `zstandard` package")
+    return codec
+
+
+def _sample(filepath:Path):
+    """Reads up to `SAMPLE_COUNT` blocks spread evenly over the file."""
+    size = os.path.getsize(filepath)
+    if size <= SAMPLE_SIZE * SAMPLE_COUNT:
+        with open(filepath, 'rb') as f:
+            return [f.read()]
+
+    step = (size - SAMPLE_SIZE) // (SAMPLE_COUNT - 1)
+    blocks = []
+    with open(filepath, 'rb') as f:
+        for i in range(SAMPLE_COUNT):
+            f.seek(i * step)
+            blocks.append(f.read(SAMPLE_SIZE))
+    return blocks
+
+
+def is_compressible(filepath:Path):
+    """
+    Guesses whether compressing `filepath` pays off, from its suffix and from
+    a fast zlib pass over a few sampled blocks.
+    """
+    filepath = Path(filepath)
+    if filepath.suffix.lower() in INCOMPRESSIBLE_SUFFIXES:
+        return False
+
+    blocks = [b for b in _sample(filepath) if b]
+    raw = sum(len(b) for b in blocks)
+    if raw == 0:
+        return False
+    packed = sum(len(zlib.compress(b, 1)) for b in blocks)
+    return packed <= raw * (1 - MIN_SAVING)
+
+
+def choose_codec(filepath:Path, compress:str=None):
+    """
+    Returns the codec id to use for `filepath`.
+
+    Arguments:
+    ----------
+        `compress`: None or 'none' (no compression), 'auto' (the default
+                    codec, but only if sampling shows the file is
+                    compressible) or the name of a codec (always used)
+    """
+    if compress is None:
+        return CODEC_NONE
+    if compress == AUTO:
+        return default_codec() if is_compressible(filepath) else CODEC_NONE
+    return codec_from_name(compress)
+
+
+def _compressobj(codec:int):
+    if codec == CODEC_ZLIB:
+        return zlib.compressobj(6)
+    if codec == CODEC_LZMA:
+        return lzma.LZMACompressor()
+    if codec == CODEC_ZSTD and zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    raise CompressionError(f"Unsupported codec id {codec}")
+
+
+class CompressingReader:
+    """
+    Read-only file-like view of `src` that returns the compressed bytes.
+    At most one `READ_SIZE` block of input is buffered.
+    """
+
+    def __init__(self, src, codec:int):
+        self.src = src
+        self._comp = _compressobj(codec)
+        self._buf = bytearray()
+        self._eof = False
+
+    def read(self, n:int):
+        while len(self._buf) < n and not self._eof:
+            chunk = self.src.read(READ_SIZE)
+            if chunk:
+                self._buf += self._comp.compress(chunk)
+            else:
+                self._buf += self._comp.flush()
+                self._eof = True
+        out = bytes(self._buf[:n])
+        del self._buf[:n]
+        return out
+
+
+class DecompressingWriter:
+    """
+    Write-only file-like wrapper of `dst` that decompresses what is written.
+    Output is produced in steps of at most `MAX_OUTPUT` bytes, so a small,
+    highly compressed segment cannot blow up the memory.
+    Call `close()` at the end to detect truncated compressed data.
+    """
+
+    def __init__(self, dst, codec:int):
+        self.dst = dst
+        self.codec = codec
+        self.written = 0
+        if codec == CODEC_ZLIB:
+            self._dec = zlib.decompressobj()
+        elif codec == CODEC_LZMA:
+            self._dec = lzma.LZMADecompressor()
+        elif codec == CODEC_ZSTD and zstandard is not None:
+            # One decompressor per frame: `eof` is set at the end of a frame
+            self._dec = zstandard.ZstdDecompressor().decompressobj()
+        else:
+            raise CompressionError(f"Unsupported codec id {codec}")
+
+    def _emit(self, data):
+        if data:
+            self.dst.write(data)
+            self.written += len(data)
+
+    def write(self, data):
+        try:
+            if self.codec == CODEC_ZLIB:
+                self._emit(self._dec.decompress(data, MAX_OUTPUT))
+                while self._dec.unconsumed_tail:
+                    self._emit(self._dec.decompress(self._dec.unconsumed_tail, MAX_OUTPUT))
+            elif self.codec == CODEC_LZMA:
+                self._emit(self._dec.decompress(data, max_length=MAX_OUTPUT))
+                while not self._dec.needs_input and not self._dec.eof:
+                    self._emit(self._dec.decompress(b'', max_length=MAX_OUTPUT))
+            else:
+                data = memoryview(data)
+                for i in range(0, len(data), ZSTD_SLICE):
+                    chunk = data[i:i + ZSTD_SLICE]
+                    while chunk:
+                        if self._dec.eof:
+                            self._dec = zstandard.ZstdDecompressor().decompressobj()
+                        self._emit(self._dec.decompress(chunk))
+                        chunk = self._dec.unused_data if self._dec.eof else b''
+        except (zlib.error, lzma.LZMAError) as e:
+            raise CompressionError(f"Corrupt compressed data: {e}") from e
+        except Exception as e:
+            if zstandard is not None and isinstance(e, zstandard.ZstdError):
+                raise CompressionError(f"Corrupt compressed data: {e}") from e
+            raise
+        return len(data)
+
+    def close(self):
+        if self.codec == CODEC_ZLIB:
+            self._emit(self._dec.flush())
+            if not self._dec.eof:
+                raise CompressionError("Truncated compressed data")
+        elif self.codec == CODEC_LZMA and not self._dec.eof:
+            raise CompressionError("Truncated compressed data")
+        elif self.codec == CODEC_ZSTD and not self._dec.eof:
+            raise CompressionError("Truncated compressed data")
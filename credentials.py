@@ -0,0 +1,228 @@
+# Multi-user credential store with scrypt hashes and a session cache
+#
+# Author: Indrajit Ghosh
+#
+# Created on: Oct 18, 2026
+#
+# The store is a JSON file (mode 0600):
+#
+#   {"version": 1, "params": {"n": ..., "r": ..., "p": ...},
+#    "users": {"<name>": {"salt": "<b64>", "n": ..., "r": ..., "p": ..., "hash": "<b64>"}}}
+#
+# Every user has a random salt and the scrypt cost the hash was made with;
+# `params` is the cost used for new hashes (see `calibrate()`). A hash made
+# with a lower cost is upgraded at the next successful verification.
+#
+
+import base64, hmac, json, os, secrets, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+STORE_VERSION = 1
+SALT_SIZE = 16
+HASH_SIZE = 32
+DEFAULT_PARAMS = {'n': 2**15, 'r': 8, 'p': 1} # ~32 MiB, ~0.1 s on a typical core
+MIN_N = 2**14
+MAX_MEMORY = 256 * 1024 * 1024 # Upper bound of 128 * n * r Bytes when calibrating
+DEFAULT_TARGET_TIME = 0.25 # Seconds per verification aimed at by `calibrate()`
+DEFAULT_SESSION_TTL = 300 # Seconds a successful verification is remembered
+
+
+def _b64(data:bytes):
+    return base64.b64encode(data).decode()
+
+
+def scrypt_hash(password:str, salt:bytes, n:int, r:int, p:int):
+    """Returns the raw scrypt hash of `password`."""
+    return Scrypt(salt=salt, length=HASH_SIZE, n=n, r=r, p=p).derive(password.encode())
+
+
+def calibrate(target_time:float=DEFAULT_TARGET_TIME, r:int=8, p:int=1, max_memory:int=MAX_MEMORY):
+    """
+    Benchmarks scrypt on this host and returns the cost parameters
+    {'n', 'r', 'p'} with the largest `n` (a power of 2, at least `MIN_N`)
+    whose hash takes about `target_time` seconds or less and needs at most
+    `max_memory` Bytes.
+    """
+    n = MIN_N
+    salt = os.urandom(SALT_SIZE)
+    while 128 * (2 * n) * r <= max_memory:
+        start = time.perf_counter()
+        scrypt_hash('calibration', salt, n, r, p)
+        elapsed = time.perf_counter() - start
+        # Doubling n doubles the time; stop before overshooting the target
+        if 2 * elapsed > target_time:
+            break
+        n *= 2
+    return {'n': n, 'r': r, 'p': p}
+
+
+class SessionCache:
+    """
+    Remembers successful verifications for `ttl` seconds. Credentials are
+    keyed by an HMAC under a per-process secret, so no password is kept in
+    memory. `open_session()` hands out random tokens usable instead of the
+    password until they expire. Safe to share between threads.
+    """
+
+    def __init__(self, ttl:float=DEFAULT_SESSION_TTL):
+        self.ttl = ttl
+        self._secret = os.urandom(32)
+        self._verified = {}  # hmac -> (user, expiry)
+        self._tokens = {}    # token -> (user, expiry)
+        self._lock = threading.Lock()
+
+    def _id(self, user:str, password:str):
+        return hmac.new(self._secret, f'{user}\0{password}'.encode(), 'sha256').digest()
+
+    def check(self, user:str, password:str):
+        """True if `user`/`password` was verified less than `ttl` seconds ago."""
+        key = self._id(user, password)
+        with self._lock:
+            entry = self._verified.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                return True
+            self._verified.pop(key, None)
+            return False
+
+    def add(self, user:str, password:str):
+        with self._lock:
+            self._verified[self._id(user, password)] = (user, time.monotonic() + self.ttl)
+
+    def open_session(self, user:str):
+        """Returns a new session token of `user`."""
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._tokens[token] = (user, time.monotonic() + self.ttl)
+        return token
+
+    def user_of(self, token:str):
+        """Returns the user of a live session `token`, else None."""
+        with self._lock:
+            entry = self._tokens.get(token)
+            if entry is not None and entry[1] > time.monotonic():
+                return entry[0]
+            self._tokens.pop(token, None)
+            return None
+
+    def forget(self, user:str):
+        """Drops every cached verification and session of `user`."""
+        with self._lock:
+            for table in (self._verified, self._tokens):
+                for key in [k for k, (u, _) in table.items() if u == user]:
+                    del table[key]
+
+
+class CredentialStore:
+    """
+    Users and their scrypt password hashes, persisted in `path`.
+
+    Example:
+    --------
+        >>> store = CredentialStore(Path('.credentials.json'))
+        >>> store.set_password('alice', 's3cret')
+        >>> store.verify('alice', 's3cret')
+        True
+        >>> token = store.login('alice', 's3cret')
+        >>> store.session_user(token)
+        'alice'
+    """
+
+    def __init__(self, path:Path, session_ttl:float=DEFAULT_SESSION_TTL):
+        self.path = Path(path)
+        self.sessions = SessionCache(ttl=session_ttl)
+        self._lock = threading.RLock()
+        try:
+            with open(self.path) as f:
+                doc = json.load(f)
+        except FileNotFoundError:
+            doc = {}
+        self.params = doc.get('params', dict(DEFAULT_PARAMS))
+        self.users = doc.get('users', {})
+
+    def _save(self):
+        doc = {'version': STORE_VERSION, 'params': self.params, 'users': self.users}
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(doc, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def __contains__(self, user:str):
+        return user in self.users
+
+    def calibrate(self, target_time:float=DEFAULT_TARGET_TIME, **kwargs):
+        """
+        Sets the cost of new hashes with `calibrate()` and saves it. Existing
+        hashes are upgraded as their users log in.
+        """
+        with self._lock:
+            self.params = calibrate(target_time=target_time, **kwargs)
+            self._save()
+        return self.params
+
+    def _record(self, user:str, password:str):
+        salt = os.urandom(SALT_SIZE)
+        digest = scrypt_hash(password, salt, **self.params)
+        self.users[user] = {'salt': _b64(salt), **self.params, 'hash': _b64(digest)}
+
+    def set_password(self, user:str, password:str):
+        """Adds `user` or changes its password."""
+        with self._lock:
+            self._record(user, password)
+            self._save()
+        self.sessions.forget(user)
+
+    def remove_user(self, user:str):
+        with self._lock:
+            if self.users.pop(user, None) is not None:
+                self._save()
+        self.sessions.forget(user)
+
+    def verify(self, user:str, password:str):
+        """
+        Returns True if `password` is the one of `user`. A success is cached
+        for the session TTL, so repeating it costs no hash.
+        """
+        if self.sessions.check(user, password):
+            return True
+
+        entry = self.users.get(user)
+        if entry is None:
+            # Spend the same time as for a wrong password, so that unknown
+            # users cannot be told apart
+            scrypt_hash(password, os.urandom(SALT_SIZE), **self.params)
+            return False
+
+        digest = scrypt_hash(password, base64.b64decode(entry['salt']), entry['n'], entry['r'], entry['p'])
+        if not hmac.compare_digest(digest, base64.b64decode(entry['hash'])):
+            return False
+
+        self.sessions.add(user, password)
+        if (entry['n'], entry['r'], entry['p']) < (self.params['n'], self.params['r'], self.params['p']):
+            with self._lock:
+                self._record(user, password)
+                self._save()
+        return True
+
+    def verify_many(self, credentials:list, jobs:int=None):
+        """
+        Verifies a list of (user, password) pairs on `jobs` threads and
+        returns a list of bools in the same order.
+        """
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+            return list(pool.map(lambda c: self.verify(*c), credentials))
+
+    def login(self, user:str, password:str):
+        """Returns a session token if the password is right, else None."""
+        if not self.verify(user, password):
+            return None
+        return self.sessions.open_session(user)
+
+    def session_user(self, token:str):
+        """Returns the user of a live session `token`, else None."""
+        return self.sessions.user_of(token)
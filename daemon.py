@@ -0,0 +1,403 @@
+# A long-running Locker daemon on a Unix domain socket, and its client
+#
+# Author: Indrajit Ghosh
+#
+# Created on: Oct 18, 2026
+#
+# Usage:
+#   python daemon.py serve [--workers N] [--socket PATH] [auth options]
+#   python daemon.py enc PATH [PATH ...] [--option NAME=JSON ...]
+#   python daemon.py dec PATH [PATH ...]
+#   python daemon.py ping | stop
+#
+# `--socket PATH` (default: $LOCKER_SOCKET, else .locker.sock here) may be
+# given before or after the command.
+#
+# `serve` imports `cryptography`, checks the password and loads the fernet
+# key once, then runs the jobs it is sent on a pool of worker threads. The
+# client imports nothing but the standard library, so a job costs a socket
+# round trip instead of a full start-up.
+#
+# Protocol: JSON lines in both directions. Requests may be pipelined on one
+# connection; every reply carries the `id` of its request and replies come
+# in the order the jobs finish.
+#
+#   -> {"id": 1, "op": "enc", "path": "/abs/path", "options": {...}}
+#   <- {"id": 1, "status": "done", "error": null, "elapsed": 0.012}
+#   -> {"id": 2, "op": "ping"}            <- {"id": 2, "status": "ok", ...}
+#   -> {"id": 3, "op": "shutdown"}        <- {"id": 3, "status": "ok"}
+#
+# `status` is 'done', 'skipped' or 'failed' as in `main.run_jobs()`.
+# `options` are those of a manifest job; see `main.JOB_OPTIONS`.
+#
+# Only the user running the daemon may use it: the socket is created with
+# mode 0600 and, on Linux, the uid of every peer is checked (SO_PEERCRED).
+#
+
+import argparse, json, os, socket, struct, sys, threading, time
+from pathlib import Path
+
+DEFAULT_SOCKET = Path(os.environ.get('LOCKER_SOCKET') or Path(__file__).resolve().parent / '.locker.sock')
+DEFAULT_WORKERS = 4
+PING = 'ping'
+SHUTDOWN = 'shutdown'
+OK = 'ok'
+
+
+class DaemonError(Exception):
+    """Raised by the client when the daemon cannot be reached or replies badly."""
+
+
+def _peer_uid(conn:socket.socket):
+    """Returns the uid of the process at the other end of `conn`, or None if unknown."""
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    _, uid, _ = struct.unpack('3i', creds)
+    return uid
+
+
+def _overlaps(a:str, b:str):
+    """True if the normalized paths `a` and `b` are equal or one is inside the other."""
+    return a == b or a.startswith(b.rstrip(os.sep) + os.sep) or b.startswith(a.rstrip(os.sep) + os.sep)
+
+
+class LockerDaemon:
+    """
+    Serves encrypt/decrypt jobs on the Unix socket `socket_path` with the
+    `CipherContext` `ctx`, on `workers` threads. At most `max_pending` jobs
+    are queued or running; beyond that the daemon stops reading requests,
+    which holds back the clients. A path is not accepted while it, a dir
+    containing it or a path inside it is being processed.
+
+    Example:
+    --------
+        >>> daemon = LockerDaemon(Path('/tmp/locker.sock'), ctx, workers=8)
+        >>> daemon.serve_forever()  # until a 'shutdown' request or SIGTERM
+    """
+
+    def __init__(self, socket_path:Path, ctx, workers:int=DEFAULT_WORKERS, max_pending:int=None):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.socket_path = Path(socket_path)
+        self.ctx = ctx
+        self.workers = max(1, int(workers))
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        self._slots = threading.BoundedSemaphore(max_pending or 4 * self.workers)
+        self._busy = set()  # paths of the running jobs
+        self._busy_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._sock = None
+        self.jobs_done = 0
+        self.started = time.time()
+
+    def _bind(self):
+        if self.socket_path.exists():
+            # A socket nobody listens on is left over from a crashed daemon
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(os.fspath(self.socket_path))
+                raise DaemonError(f"A daemon is already listening on {self.socket_path}")
+            except ConnectionRefusedError:
+                self.socket_path.unlink()
+            finally:
+                probe.close()
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            sock.bind(os.fspath(self.socket_path))
+        finally:
+            os.umask(old_umask)
+        sock.listen(64)
+        self._sock = sock
+
+    def serve_forever(self):
+        """Accepts connections until `stop()` is called; each one gets a thread."""
+        self._bind()
+        print(f"Locker daemon listening on {self.socket_path} ({self.workers} workers)")
+        try:
+            while not self._stopping.is_set():
+                try:
+                    conn, _ = self._sock.accept()
+                except OSError:
+                    break  # closed by `stop()`
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+        finally:
+            self._pool.shutdown(wait=True)
+            try:
+                self.socket_path.unlink()
+            except FileNotFoundError:
+                pass
+            print(f"Locker daemon stopped after {self.jobs_done} job(s)")
+
+    def stop(self):
+        """Stops accepting connections; the queued jobs still finish."""
+        self._stopping.set()
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._sock.close()
+
+    def _serve_connection(self, conn:socket.socket):
+        uid = _peer_uid(conn)
+        if uid is not None and uid != os.getuid():
+            conn.close()
+            return
+
+        write_lock = threading.Lock()
+        pending = []
+
+        def reply(msg:dict):
+            data = (json.dumps(msg) + '\n').encode()
+            with write_lock:
+                try:
+                    conn.sendall(data)
+                except OSError:
+                    pass  # the client went away; the job is done anyway
+
+        with conn, conn.makefile('rb') as rfile:
+            for line in rfile:
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("expected a JSON object")
+                except ValueError as e:
+                    reply({'id': None, 'status': 'failed', 'error': f"bad request: {e}"})
+                    continue
+
+                op = request.get('op')
+                if op == PING:
+                    reply({'id': request.get('id'), 'status': OK, 'pid': os.getpid(),
+                           'workers': self.workers, 'jobs_done': self.jobs_done,
+                           'uptime': time.time() - self.started})
+                elif op == SHUTDOWN:
+                    reply({'id': request.get('id'), 'status': OK})
+                    self.stop()
+                else:
+                    fut = self._submit(request, reply)
+                    if fut is not None:
+                        pending = [f for f in pending if not f.done()] + [fut]
+
+            # Keep the connection open until its jobs have replied
+            for fut in pending:
+                fut.result()
+
+    def _submit(self, request:dict, reply):
+        from main import _make_job, JobError, FAILED
+
+        rid = request.get('id')
+        try:
+            op, path, options = _make_job(request.get('op'), request.get('path'), request.get('options', {}), 'request')
+        except JobError as e:
+            reply({'id': rid, 'status': FAILED, 'error': str(e)})
+            return None
+        if not path.is_absolute():
+            reply({'id': rid, 'status': FAILED, 'error': "`path` must be absolute"})
+            return None
+
+        key = os.path.normpath(path)
+        with self._busy_lock:
+            busy = next((b for b in self._busy if _overlaps(key, b)), None)
+            if busy is not None:
+                reply({'id': rid, 'status': FAILED, 'error': f"`{path}` overlaps `{busy}`, which is being processed"})
+                return None
+            self._busy.add(key)
+
+        self._slots.acquire()
+        try:
+            return self._pool.submit(self._run, rid, op, path, options, key, reply)
+        except RuntimeError:  # the pool is shut down
+            self._slots.release()
+            with self._busy_lock:
+                self._busy.discard(key)
+            reply({'id': rid, 'status': FAILED, 'error': "the daemon is stopping"})
+            return None
+
+    def _run(self, rid, op:str, path:Path, options:dict, key:str, reply):
+        from main import _run_job, FAILED
+
+        t1 = time.perf_counter()
+        try:
+            status, error = _run_job(self.ctx, op, path, {'quiet': True, **options}), None
+        except Exception as e:
+            status, error = FAILED, str(e) or type(e).__name__
+        finally:
+            with self._busy_lock:
+                self._busy.discard(key)
+                self.jobs_done += 1
+            self._slots.release()
+        reply({'id': rid, 'status': status, 'error': error, 'elapsed': time.perf_counter() - t1})
+
+
+class DaemonClient:
+    """
+    Sends jobs to a running `LockerDaemon`. One connection is kept open, so
+    many jobs can be pipelined.
+
+    Example:
+    --------
+        >>> with DaemonClient() as client:
+        ...     client.run('enc', ['/data/a.txt', '/data/reports'], options={'compress': 'auto'})
+        [{'id': 1, 'status': 'done', ...}, {'id': 2, 'status': 'done', ...}]
+    """
+
+    def __init__(self, socket_path:Path=DEFAULT_SOCKET, timeout:float=None):
+        self.socket_path = Path(socket_path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        try:
+            self._sock.connect(os.fspath(self.socket_path))
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            self._sock.close()
+            raise DaemonError(f"No daemon is listening on {self.socket_path} ({e})") from None
+        self._rfile = self._sock.makefile('rb')
+        self._next_id = 0
+
+    def send(self, op:str, path=None, options:dict=None):
+        """Sends one request without waiting for its reply; returns its id."""
+        self._next_id += 1
+        request = {'id': self._next_id, 'op': op}
+        if path is not None:
+            request['path'] = os.path.abspath(path)
+            request['options'] = options or {}
+        self._sock.sendall((json.dumps(request) + '\n').encode())
+        return self._next_id
+
+    def receive(self):
+        """Returns the next reply."""
+        line = self._rfile.readline()
+        if not line:
+            raise DaemonError("The daemon closed the connection")
+        return json.loads(line)
+
+    def run(self, op:str, paths:list, options:dict=None):
+        """
+        Sends a job per path, waits for all of them and returns the replies
+        in the order of `paths`.
+        """
+        ids = [self.send(op, p, options) for p in paths]
+        replies = {}
+        while len(replies) < len(ids):
+            msg = self.receive()
+            replies[msg.get('id')] = msg
+        return [replies[i] for i in ids]
+
+    def ping(self):
+        self.send(PING)
+        return self.receive()
+
+    def shutdown(self):
+        self.send(SHUTDOWN)
+        return self.receive()
+
+    def close(self):
+        self._rfile.close()
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _serve(args):
+    import signal
+    from main import authenticate, resolve_fernet_key
+    from authentication import has_password
+    from encryption import load_cipher_context
+
+    # The password is checked and the key loaded once, for all the jobs
+    if not has_password(args.user):
+        print("\nERROR: no password is set yet; run `python main.py enc` on a terminal first.\n")
+        sys.exit(1)
+    if not authenticate(args, interactive=sys.stdin.isatty()):
+        print("\nSorry that didn't work!\n")
+        sys.exit(1)
+    ctx = load_cipher_context(resolve_fernet_key(args.fernet_key))
+
+    daemon = LockerDaemon(args.socket, ctx, workers=args.workers, max_pending=args.max_pending)
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: daemon.stop())
+    try:
+        daemon.serve_forever()
+    except DaemonError as e:
+        print(f"\nERROR: {e}\n")
+        sys.exit(1)
+
+
+def _parse_options(items:list):
+    """Turns `NAME=JSON` strings into a dict; a value that is not JSON is a string."""
+    options = {}
+    for item in items or []:
+        name, sep, value = item.partition('=')
+        if not sep:
+            raise SystemExit(f"ERROR: `--option` expects NAME=VALUE, not {item!r}")
+        try:
+            options[name] = json.loads(value)
+        except ValueError:
+            options[name] = value
+    return options
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Locker daemon and its client.")
+    parser.add_argument('--socket', type=Path, default=DEFAULT_SOCKET, help=f'Socket path (default: {DEFAULT_SOCKET})')
+    # Also accepted after the command; SUPPRESS keeps the value given before it
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--socket', type=Path, default=argparse.SUPPRESS, help='Socket path')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', parents=[common], help='Run the daemon')
+    serve.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS, help='Worker threads')
+    serve.add_argument('--max-pending', type=int, default=None, help='Max queued jobs (default: 4 per worker)')
+    serve.add_argument('--fernet-key', type=Path, default=None, help='Fernet key file')
+    # As `main.add_auth_arguments()`, which is not imported so that the client stays light
+    serve.add_argument('--user', default=None, help='User to authenticate (default: $LOCKER_USER or the login name)')
+    source = serve.add_mutually_exclusive_group()
+    source.add_argument('--password-env', metavar='VAR', help='Read the password from this environment variable')
+    source.add_argument('--password-fd', metavar='FD', type=int, help='Read the password from this file descriptor')
+    source.add_argument('--password-file', metavar='FILE', type=Path, help='Read the password from this file (mode 600)')
+
+    for op in ('enc', 'dec'):
+        job = commands.add_parser(op, parents=[common], help=f"Send '{op}' jobs to the daemon")
+        job.add_argument('paths', nargs='+', help='Files or dirs')
+        job.add_argument('-o', '--option', action='append', metavar='NAME=VALUE',
+                         help='Job option, e.g. compress=auto or jobs=8 (see main.JOB_OPTIONS)')
+    commands.add_parser('ping', parents=[common], help='Check that the daemon is running')
+    commands.add_parser('stop', parents=[common], help='Stop the daemon once its jobs are done')
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        _serve(args)
+        return
+
+    try:
+        with DaemonClient(args.socket) as client:
+            if args.command == 'ping':
+                print(json.dumps(client.ping()))
+            elif args.command == 'stop':
+                client.shutdown()
+            else:
+                failed = 0
+                for path, msg in zip(args.paths, client.run(args.command, args.paths, _parse_options(args.option))):
+                    if msg['status'] == 'failed':
+                        failed += 1
+                        print(f"ERROR: '{args.command}' of `{path}` failed: {msg['error']}")
+                    else:
+                        print(f"{msg['status']}: `{path}` ({msg['elapsed'] * 1000:.1f} ms)")
+                if failed:
+                    sys.exit(1)
+    except DaemonError as e:
+        print(f"\nERROR: {e}\n")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,34 +6,79 @@
 # Modified on: Oct 8, 2023
 #
 
+import io
+
 from encryption import *
-from encryption import _get_files_in
+from encryption import _get_files_in, _walk_files, _replace_with_stream, _map_files
+from cryptography.exceptions import InvalidTag
+from atomic_io import atomic_write, sync_dir_of, DirSyncBatch, DEFAULT_DURABILITY
+from journal import ProgressJournal, OP_DECRYPT, MANIFEST_SUFFIX
+from streaming import decrypt_buffer, is_stream_header, map_file, SegmentedStream, StreamReader, StreamFormatError, HEADER_SIZE, SEGMENT_CACHE_SIZE
+from compressors import CompressionError
+from progress import Progress, NO_CLOCK
+from archive import ArchiveReader, ArchiveError
+
 
-def decrypt_file(encrypted_file:Path, fernet_file:Path, print_status=True):
+def _is_stream_encrypted(encrypted_file:Path):
+    """
+    Returns True if `encrypted_file` uses the segmented streaming format.
+    """
+    with open(encrypted_file, 'rb') as f:
+        return is_stream_header(f.read(len(MARKER) + HEADER_SIZE), marker=MARKER)
+
+
+def decrypt_file(encrypted_file:Path, fernet_file:Path, print_status=True,
+                 durability:str=DEFAULT_DURABILITY, dir_sync:DirSyncBatch=None, clock=None):
     """
     NOTE: This function should not be given to target user
+
+    `fernet_file` is either the Path() of the fernet key or a `CipherContext`.
+    The file is replaced atomically; `durability` and `dir_sync` are as in
+    `encrypt_file()`, as is `clock`.
+
+    Returns:
+    --------
+        file_size_after_decryption, or -1 if the file could not be decrypted
     """
     encrypted_file = Path(encrypted_file)
+    clock = NO_CLOCK if clock is None else clock
 
     # Check if the file is encrypted
     if not is_file_encrypted(encrypted_file):
         print(f"The file {encrypted_file} is not encrypted or encrypted with a different marker.")
         return -1
 
-    # Getting the encrypted message without the marker
-    with open(encrypted_file, 'rb') as f:
-        encrypted_message = f.read()[len(MARKER):]
+    ctx = load_cipher_context(fernet_file)
+
+    if _is_stream_encrypted(encrypted_file):
+        try:
+            with clock.rest('crypt'):
+                _replace_with_stream(
+                    encrypted_file,
+                    lambda src, dst: decrypt_buffer(src, clock.writer(dst), key=ctx.stream_key, marker=MARKER),
+                    mapped=True, durability=durability, dir_sync=dir_sync
+                )
+            if print_status:
+                print("File Decrypted!")
 
+        except (InvalidTag, StreamFormatError, CompressionError):
+            print(f"\nERROR: The following file might be corrupted or encrypted with different Fernet key:\n - {encrypted_file}\n")
+            return -1
 
-    fernet_key = open(fernet_file, 'rb').read()
+        return encrypted_file.stat().st_size
+
+    # Getting the encrypted message without the marker; slicing the mapped
+    # file copies the token once instead of reading the file and slicing it
+    with clock.phase('read'), map_file(encrypted_file) as mm:
+        encrypted_message = mm[len(MARKER):]
 
     # Getting original message
-    fer = Fernet(fernet_key)
     try:
-        original_message = fer.decrypt(encrypted_message)
+        with clock.phase('crypt'):
+            original_message = ctx.fernet.decrypt(encrypted_message)
     
         # print(original_message.decode())
-        with open(encrypted_file, 'wb') as f:
+        with clock.phase('write'), atomic_write(encrypted_file, durability=durability, batch=dir_sync, mode_from=encrypted_file) as f:
             f.write(original_message)
 
         if print_status:
@@ -41,30 +86,157 @@ def decrypt_file(encrypted_file:Path, fernet_file:Path, print_status=True):
     
     except InvalidToken:
         print(f"\nERROR: The following file might be non-encrypted or encrypted with different Fernet key:\n - {encrypted_file}\n")
+        return -1
+
+    return len(original_message)
+
+
+def open_encrypted(encrypted_file:Path, fernet_file:Path, cache_size:int=SEGMENT_CACHE_SIZE):
+    """
+    Opens an encrypted file for reading without decrypting it to disk.
+    Returns a read-only, seekable binary file object; `seek()` and `read()`
+    decrypt only the segments they touch, and the last `cache_size`
+    segments are cached. `fernet_file` is either the Path() of the fernet
+    key or a `CipherContext`.
 
+    Files in the Fernet format (smaller than `STREAM_THRESHOLD` unless
+    streamed explicitly) are decrypted into memory as a whole. Compressed
+    streams cannot be read at random and raise `StreamFormatError`, as
+    does a file that is not encrypted.
 
-def decrypt_dir(root_dir:Path, fernet_file:Path):
+    Example:
+    --------
+        >>> with open_encrypted('huge.log', fernet_file) as f:
+        ...     f.seek(-4096, io.SEEK_END)
+        ...     tail = f.read()
+    """
+    ctx = load_cipher_context(fernet_file)
+
+    if not is_file_encrypted(encrypted_file):
+        raise StreamFormatError(f"Not an encrypted file: {encrypted_file}")
+
+    if not _is_stream_encrypted(encrypted_file):
+        with map_file(encrypted_file) as mm:
+            return io.BytesIO(ctx.fernet.decrypt(mm[len(MARKER):]))
+
+    f = open(encrypted_file, 'rb')
+    try:
+        segments = SegmentedStream(f, key=ctx.stream_key, marker=MARKER, cache_size=cache_size)
+    except BaseException:
+        f.close()
+        raise
+    return io.BufferedReader(StreamReader(segments, file=f), buffer_size=segments.segment_size)
+
+
+def _unpack_archive(root_dir:Path, ctx:CipherContext, durability:str=DEFAULT_DURABILITY):
+    """
+    Extracts `root_dir/.encrypted.archive` into `root_dir` and removes it.
+    The archive is kept if anything fails. Returns True on success.
+    """
+    archive_file = root_dir / DOT_ARCHIVE_FILENAME
+    t1 = time.time()
+    try:
+        with ArchiveReader(archive_file, key=ctx.stream_key, marker=MARKER) as archive:
+            file_count, data_size = archive.extractall(root_dir, durability=durability)
+    except (InvalidTag, StreamFormatError, ArchiveError) as e:
+        print(f"\nERROR: The following archive might be corrupted or encrypted with different Fernet key ({e}):\n - {archive_file}\n")
+        return False
+
+    archive_file.unlink()
+    sync_dir_of(archive_file, durability=durability)
+
+    print(f"\n\nThe directory `{root_dir}` is unpacked successfully.\nTotal file decrypted: {file_count}.\n")
+    print(f"Total size of data decrypted: {ByteSize(data_size):.3f}\n")
+    print(f"Total time taken: {format_time(time.time() - t1)}\n")
+    return True
+
+
+def decrypt_dir(root_dir:Path, fernet_file:Path, jobs:int=None, durability:str=DEFAULT_DURABILITY, resume:bool=True,
+                quiet:bool=False, metrics_file:Path=None, **walk_options):
     """
     Decrypt all files of the dir and of all its sub dir.
+    `jobs` is the number of worker threads; defaults to the CPU count.
+    `fernet_file` is loaded once and shared by all the files.
+    With `durability` 'batch' the directory fsyncs are shared by the files.
+    With `resume`, decrypted files are journaled in `root_dir/.encrypted` as in
+    `encrypt_dir()`, so an interrupted run continues where it stopped. If
+    the tree has a manifest from `encrypt_dir()`, files it does not list are
+    plaintext added later and are skipped without being opened.
+    `walk_options`, `quiet` and `metrics_file` are as in `encrypt_dir()`.
+    A tree packed by `encrypt_dir(archive=True)` is unpacked instead.
+
+    Returns:
+    --------
+        `int`: number of files that could not be decrypted (1 if the archive
+        could not be unpacked), so 0 means success
     """
     root_dir = Path(root_dir)
+    fernet_file = load_cipher_context(fernet_file)
+    dir_sync = DirSyncBatch()
+
+    if (root_dir / DOT_ARCHIVE_FILENAME).exists():
+        return 0 if _unpack_archive(root_dir, fernet_file, durability=durability) else 1
     
     # Decrypt this dir.
 
-    _ignore = []
+    journal_file = root_dir / DOT_ENCRYPTED_FILENAME
+    _ignore = [journal_file, root_dir / (DOT_ENCRYPTED_FILENAME + MANIFEST_SUFFIX)]
+    journal = ProgressJournal(root_dir, journal_file, op=OP_DECRYPT, key=fernet_file.stream_key) if resume else None
+    if metrics_file is not None:
+        _ignore.append(Path(metrics_file))
     file_count = 0
     data_size = 0
 
-    t1 = time.time()
-    for file in _get_files_in(root_dir, ignore=_ignore):
-        print(f"Decrypting: '{file}'")
-        file_count += 1
-        data_size += file.stat().st_size
-        decrypt_file(
+    progress = Progress('Decrypting', live=quiet and sys.stderr.isatty(), metrics_file=metrics_file)
+    if progress.enabled:
+        progress.count_in_background(_walk_files(root_dir, ignore=_ignore, **walk_options))
+
+    def _decrypt(item):
+        file, st = item
+        if journal is not None:
+            if journal.is_done(file, st):
+                return None
+            if journal.has_manifest and not journal.is_known(file) and not is_file_encrypted(file):
+                # Not in the manifest: plaintext added later, unless it was
+                # encrypted on its own since (e.g. by `encrypt_file()`)
+                return None
+        clock = progress.clock()
+        result = decrypt_file(
             encrypted_file=file,
             fernet_file=fernet_file,
-            print_status=False
+            print_status=False,
+            durability=durability,
+            dir_sync=dir_sync,
+            clock=clock
         )
+        clock.close()
+        if result == -1:
+            # Left as it was; a plaintext file is skipped, anything else failed
+            return -1 if is_file_encrypted(file) else None
+        if journal is not None:
+            journal.record(file)
+        return st.st_size
+
+    t1 = time.time()
+    completed = False
+    try:
+        with dir_sync:
+            files = progress.walk(_walk_files(root_dir, ignore=_ignore, **walk_options))
+            for (file, st), size, error in _map_files(_decrypt, files, jobs=jobs):
+                if error is not None:
+                    print(f"\nERROR: The following file could not be decrypted ({error}):\n - {file}\n")
+                elif size is not None and size != -1:
+                    if not quiet:
+                        print(f"Decrypting: '{file}'")
+                    file_count += 1
+                    data_size += size
+
+                progress.update(st.st_size, skipped=size is None and error is None, error=error is not None or size == -1)
+        completed = True
+    finally:
+        progress.close()
+        if journal is not None:
+            journal.close(completed=completed)
         
     t2 = time.time()
     time_taken = format_time(t2-t1)
@@ -72,7 +244,8 @@ def decrypt_dir(root_dir:Path, fernet_file:Path):
 
     print(f"\n\nThe directory `{root_dir}` is decrypted successfully.\nTotal file decrypted: {file_count}.\n")
     print(f"Total size of data decrypted: {data_size:.3f}\n")
-    print(f"Total time taken: {time_taken}\n")
+    print(f"Total time taken: {time_taken} ({progress.rate_summary()})\n")
+    return progress.errors
 
 
 
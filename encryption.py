@@ -7,20 +7,30 @@
 #
 
 from pathlib import Path
-import sys, os, time
+import sys, os, re, stat, time, fnmatch, hashlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 from cryptography.fernet import Fernet
 from cryptography.fernet import InvalidToken
 
+from streaming import encrypt_stream, derive_stream_key, map_file, cipher_from_name, CIPHER_AESGCM
+from compressors import choose_codec, CODEC_NONE
+from atomic_io import atomic_write, is_temp_path, DirSyncBatch, DEFAULT_DURABILITY
+from journal import ProgressJournal, OP_ENCRYPT, MANIFEST_SUFFIX
+from progress import Progress, NO_CLOCK
+from archive import create_archive
+
 CWD = Path.cwd()
 KB = 1024
 ONE_MB = 1024 * KB
 ONE_GB = 1024 * ONE_MB
 TWO_GB = 2 * ONE_GB
+STREAM_THRESHOLD = 64 * ONE_MB # Files at least this big use the streaming format
 
 THIS_SCRIPT = Path(__file__).absolute()
 MAIN_DOT_PY = THIS_SCRIPT.resolve().parent / 'main.py'
 DOT_ENCRYPTED_FILENAME = '.encrypted'
+DOT_ARCHIVE_FILENAME = '.encrypted.archive'
 MARKER = b'ENCRYPTED_BY_INDRAJIT\n'
 
 NOT_TO_ENCRYPT = [
@@ -108,6 +118,43 @@ def generate_fernet_key():
     return Fernet.generate_key()
 
 
+class CipherContext:
+    """
+    Holds a Fernet key together with the cipher objects built from it, so
+    that a directory run reads and parses the key file only once.
+    The object is read-only after construction and can be shared between
+    worker threads.
+
+    Example:
+    --------
+        >>> ctx = CipherContext.from_file(fernet_file)
+        >>> encrypt_file(filepath, fernet_file=ctx)
+    """
+
+    def __init__(self, fernet_key:bytes):
+        self.fernet_key = fernet_key
+        self.fernet = Fernet(fernet_key)
+        self.stream_key = derive_stream_key(fernet_key)
+
+    @classmethod
+    def from_file(cls, fernet_file:Path):
+        with open(fernet_file, 'rb') as f:
+            return cls(f.read())
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(<hidden>)'
+
+
+def load_cipher_context(fernet_file):
+    """
+    Returns a `CipherContext` for `fernet_file`, which may either be a
+    `CipherContext` already (returned as it is) or the path of a fernet key.
+    """
+    if isinstance(fernet_file, CipherContext):
+        return fernet_file
+    return CipherContext.from_file(fernet_file)
+
+
 def is_file_encrypted(filepath):
     try:
         with open(filepath, 'rb') as file:
@@ -117,27 +164,72 @@ def is_file_encrypted(filepath):
         return False
 
 
-def encrypt_file(filepath:Path, fernet_file:Path, print_status=True):
+class _HashingWriter:
+    """Passes writes on to `file` while feeding them to the hash object `digest`."""
+
+    def __init__(self, file, digest):
+        self.file = file
+        self.digest = digest
+
+    def write(self, data):
+        self.digest.update(data)
+        return self.file.write(data)
+
+
+def _replace_with_stream(filepath:Path, transform, mapped:bool=False, durability:str=DEFAULT_DURABILITY, dir_sync:DirSyncBatch=None):
+    """
+    Streams `filepath` through `transform(src, dst)` into a temporary file
+    which then atomically replaces `filepath` (see `atomic_io.atomic_write()`).
+    The original file is left untouched if `transform` raises. With `mapped`,
+    `src` is a read-only `mmap` of `filepath` (see `streaming.map_file()`)
+    instead of a file object.
+    """
+    with (map_file(filepath) if mapped else open(filepath, 'rb')) as src:
+        with atomic_write(filepath, durability=durability, batch=dir_sync, mode_from=filepath) as dst:
+            transform(src, dst)
+
+
+def encrypt_file(filepath:Path, fernet_file:Path, print_status=True, stream:bool=None,
+                 durability:str=DEFAULT_DURABILITY, dir_sync:DirSyncBatch=None, digest=None,
+                 compress:str=None, cipher:str=None, clock=None):
     """
     Encrypts a file using Fernet.
     
     Arguments:
     ----------
         `filepath`: Path() of the file to encrypt
-        `fernet_file`: Path() of the fernet key 
+        `fernet_file`: Path() of the fernet key or a `CipherContext`
         `print_status`: 
+        `stream`: use the segmented streaming format (see `streaming.py`),
+                  which runs in constant memory and is raw binary, i.e.
+                  plaintext size plus a small constant overhead instead of
+                  the ~1.33x of a base64 Fernet token. Defaults to streaming
+                  only the files of size >= `STREAM_THRESHOLD`.
+        `durability`: 'none', 'file' or 'batch'; see `atomic_io.py`. The file
+                      is always replaced atomically, never overwritten.
+        `dir_sync`: `DirSyncBatch` collecting the directory fsyncs of a
+                    directory run when `durability` is 'batch'
+        `digest`: optional `hashlib` object fed with every byte written, i.e.
+                  with the content of the encrypted file
+        `compress`: compress before encrypting: 'auto' (sample the file and
+                    skip incompressible data), 'zlib', 'lzma' or 'zstd'.
+                    The codec is recorded in the header, which implies the
+                    streaming format. Defaults to no compression.
+        `cipher`: AEAD of the streaming format, 'aesgcm' or 'chacha20';
+                  giving one implies the streaming format. Defaults to
+                  'aesgcm'.
+        `clock`: `progress.PhaseClock` timing the read, crypt and write
+                 phases; the caller closes it
 
     Returns:
     --------
         file_size_after_encryption
     """
     filepath = Path(filepath)
+    clock = NO_CLOCK if clock is None else clock
 
-    # generate new fernet key
-    fernet_key = open(fernet_file, 'rb').read()
-
-    # creating Fernet object
-    fer = Fernet(fernet_key)
+    # load the fernet key (no-op for a `CipherContext`)
+    ctx = load_cipher_context(fernet_file)
 
     # Check if the file is already encrypted
     if is_file_encrypted(filepath):
@@ -147,19 +239,35 @@ def encrypt_file(filepath:Path, fernet_file:Path, print_status=True):
     # encrypt the file with fernet key
     file_size_before = filepath.stat().st_size # File size before encryption
 
-    if file_size_before >= TWO_GB:
-        # TODO: for bigger file use compressing that file and then encrypt.
-        # URL: "https://www.thepythoncode.com/article/compress-decompress-files-tarfile-python"
-        # If the file is bigger than 2GB then don't encrypt
-        print(f"\n >>> SKIPPED_BIG_FILE: The following file has been skipped due to a file size > 2GB:\n - {filepath}\n")
-        print_status = False
+    codec = choose_codec(filepath, compress)
+    cipher_id = CIPHER_AESGCM if cipher is None else cipher_from_name(cipher)
+
+    if stream is None:
+        stream = file_size_before >= STREAM_THRESHOLD or codec != CODEC_NONE or cipher is not None
+
+    if stream:
+        with clock.rest('crypt'):
+            _replace_with_stream(
+                filepath,
+                lambda src, dst: encrypt_stream(
+                    clock.reader(src), clock.writer(dst if digest is None else _HashingWriter(dst, digest)),
+                    key=ctx.stream_key, marker=MARKER, codec=codec, cipher=cipher_id
+                ),
+                durability=durability, dir_sync=dir_sync
+            )
     else:
-        msg = open(filepath, 'rb').read()
-        msg_encrypted = fer.encrypt(data=msg)
+        with clock.phase('read'), open(filepath, 'rb') as f:
+            msg = f.read()
+        with clock.phase('crypt'):
+            msg_encrypted = ctx.fernet.encrypt(data=msg)
 
         # save the encrypted file
-        with open(filepath, 'wb') as f:
-            f.write(MARKER + msg_encrypted)
+        with clock.phase('write'), atomic_write(filepath, durability=durability, batch=dir_sync, mode_from=filepath) as f:
+            f.write(MARKER)
+            f.write(msg_encrypted)
+        if digest is not None:
+            digest.update(MARKER)
+            digest.update(msg_encrypted)
 
     size_after_encryption = filepath.stat().st_size # File size after encryption
         
@@ -181,27 +289,187 @@ def encrypt_file(filepath:Path, fernet_file:Path, print_status=True):
 
 
 
-def _get_files_in(dir:Path, ignore:list=None):
+def _compile_patterns(patterns:list=None):
+    """
+    Compiles glob `patterns` (e.g. `'*.iso'`, `'build/*'`) into one regex.
+    Patterns containing a `/` are matched against the path relative to the
+    walked directory, the others against the file or directory name only.
+    Returns:
+    --------
+        tuple(name_regex, relpath_regex); either may be None
+    """
+    if not patterns:
+        return None, None
+
+    name_pats = [fnmatch.translate(p) for p in patterns if '/' not in p]
+    rel_pats = [fnmatch.translate(p.strip('/')) for p in patterns if '/' in p]
+    compile_ = lambda pats: re.compile('|'.join(f'(?:{p})' for p in pats)) if pats else None
+    return compile_(name_pats), compile_(rel_pats)
+
+
+def _walk_files(dir:Path, ignore:list=None, exclude:list=None, follow_symlinks:bool=False,
+                one_filesystem:bool=False, skip_hidden:bool=False):
+    """
+    Iterative `os.scandir()` walk over `dir` and all its subdirectories.
+
+    Arguments:
+    ----------
+        `dir`: `Path`; path of the directory
+        `ignore`: `list`; paths to be ignored, looked up in a set
+        `exclude`: `list`; glob patterns of files and directories to skip
+        `follow_symlinks`: descend into symlinked dirs and yield the targets
+                           of symlinked files (each target once); otherwise
+                           symlinks are skipped
+        `one_filesystem`: do not descend into other mounted filesystems
+        `skip_hidden`: skip files and directories whose name starts with '.'
+
+    Yields:
+    -------
+        tuple(`Path`, `os.stat_result`) for every regular file; the stat is
+        the one taken while walking, so callers need not stat again.
+    """
+    root = os.fspath(dir)
+    abs_root = os.path.abspath(root)
+    ignore = {os.path.abspath(os.fspath(p)) for p in (ignore or [])}
+    name_re, rel_re = _compile_patterns(exclude)
+
+    root_st = os.stat(root)
+    # (st_dev, st_ino) of everything visited when following symlinks, so
+    # that loops are cut and no file is yielded twice
+    seen = {(root_st.st_dev, root_st.st_ino)}
+
+    # (path as given, absolute path, path relative to `dir`)
+    stack = [(root, abs_root, '')]
+    while stack:
+        path, abs_path, rel_path = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                # List the whole dir first: its files are about to be replaced
+                entries = list(it)
+        except OSError:
+            continue
+
+        subdirs = []
+        for entry in entries:
+            name = entry.name
+            if skip_hidden and name.startswith('.'):
+                continue
+            abs_entry = os.path.join(abs_path, name)
+            if abs_entry in ignore:
+                continue
+            rel_entry = os.path.join(rel_path, name) if rel_path else name
+            if name_re is not None and name_re.match(name):
+                continue
+            if rel_re is not None and rel_re.match(rel_entry):
+                continue
+
+            try:
+                is_link = entry.is_symlink()
+                if is_link and not follow_symlinks:
+                    continue
+                if entry.is_dir():
+                    if follow_symlinks or one_filesystem:
+                        st = entry.stat()
+                        if one_filesystem and st.st_dev != root_st.st_dev:
+                            continue
+                        if follow_symlinks:
+                            if (st.st_dev, st.st_ino) in seen:
+                                continue
+                            seen.add((st.st_dev, st.st_ino))
+                    subdirs.append((entry.path, abs_entry, rel_entry))
+                    continue
+                if not entry.is_file() or is_temp_path(name):
+                    continue
+
+                st = entry.stat()
+            except OSError:
+                continue
+
+            if follow_symlinks:
+                if (st.st_dev, st.st_ino) in seen:
+                    continue
+                seen.add((st.st_dev, st.st_ino))
+            if is_link:
+                yield Path(os.path.realpath(entry.path)), st
+            else:
+                yield Path(entry.path), st
+
+        # Reversed, so that subdirectories are visited in listing order
+        stack.extend(reversed(subdirs))
+
+
+def _get_files_in(dir:Path, ignore:list=None, **walk_options):
     """
     Returns all files of the directory and of all its subdirectories.
+    Leftovers of interrupted atomic writes are skipped.
     Arguments:
     ----------
         `dir`: `Path`; path of the directory
         `ignore`: `list`; list of paths to be ignored. defaults to None
+        `walk_options`: see `_walk_files()`
     """
-    dir = Path(dir)
-    ignore = [] if ignore is None else ignore
+    for filepath, _ in _walk_files(dir, ignore=ignore, **walk_options):
+        yield filepath
 
-    for path, subdir, files in os.walk(dir):
-        for name in files:
-            filepath = Path(path) / name
-            if filepath not in ignore:
-                yield filepath
 
+def default_jobs():
+    """
+    Returns the default number of worker threads: the CPU count.
+    """
+    return os.cpu_count() or 1
 
-def _encrypt_dir_tree(root_dir:Path, fernet_file:Path, ignore:list=None, silent:bool=True):
+
+def _map_files(func, files, jobs:int=None):
+    """
+    Calls `func(file)` for each of the `files` on a pool of `jobs` worker
+    threads, so that file I/O of one file overlaps with the crypto work of
+    another. At most a few tasks per worker are queued at any time, hence
+    huge trees are never materialised in memory.
+
+    Yields:
+    -------
+        tuple(`file`, `result`, `error`) in completion order; `error` is the
+        exception raised by `func(file)` or None.
+    """
+    jobs = default_jobs() if jobs is None else max(1, int(jobs))
+
+    if jobs == 1:
+        for file in files:
+            try:
+                yield file, func(file), None
+            except Exception as e:
+                yield file, None, e
+        return
+
+    def _collect(futures):
+        for fut in futures:
+            file = pending.pop(fut)
+            error = fut.exception()
+            yield file, None if error else fut.result(), error
+
+    pending = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for file in files:
+            pending[pool.submit(func, file)] = file
+            if len(pending) >= 4 * jobs:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from _collect(done)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from _collect(done)
+
+
+def _encrypt_dir_tree(root_dir:Path, fernet_file:Path, ignore:list=None, silent:bool=True, jobs:int=None,
+                      durability:str=DEFAULT_DURABILITY, journal:ProgressJournal=None, walk_options:dict=None,
+                      compress:str=None, cipher:str=None, progress:Progress=None):
     """
     Encrypt each files in a dir and its subdirectories.
+    `jobs` is the number of worker threads; defaults to the CPU count.
+    With `durability` 'batch' the directory fsyncs are shared by the files.
+    Files recorded as done in the `journal` are skipped (and not counted).
+    `walk_options` are passed on to `_walk_files()`; `compress` and `cipher`
+    to `encrypt_file()`. Every file is reported to `progress`, if given.
     Returns:
     --------
         tuple(`int`, ByteSize()): (total number of files encrypted, total size in Bytes)
@@ -212,36 +480,219 @@ def _encrypt_dir_tree(root_dir:Path, fernet_file:Path, ignore:list=None, silent:
 
     root_dir = Path(root_dir)
     ignore = NOT_TO_ENCRYPT if ignore is None else NOT_TO_ENCRYPT + ignore
+    fernet_file = load_cipher_context(fernet_file)
 
-    for file in _get_files_in(root_dir, ignore):
-        file_count += 1
-        data_size += file.stat().st_size
-        if not silent:
-            print(f"Encrypting '{file}'")
+    dir_sync = DirSyncBatch()
 
-        encrypt_file(
+    def _encrypt(item):
+        file, st = item
+        if journal is not None and journal.is_done(file, st):
+            return None
+        digest = hashlib.sha256() if journal is not None else None
+        clock = progress.clock() if progress is not None else None
+        result = encrypt_file(
             filepath=file,
             fernet_file=fernet_file,
-            print_status=False
+            print_status=False,
+            durability=durability,
+            dir_sync=dir_sync,
+            digest=digest,
+            compress=compress,
+            cipher=cipher,
+            clock=clock
         )
+        if clock is not None:
+            clock.close()
+        if journal is not None:
+            journal.record(file, digest=None if result == -1 else digest.hexdigest())
+        return st.st_size
+
+    with dir_sync:
+        files = _walk_files(root_dir, ignore=ignore, **(walk_options or {}))
+        if progress is not None:
+            files = progress.walk(files)
+        for (file, st), size, error in _map_files(_encrypt, files, jobs=jobs):
+            if error is not None:
+                print(f"\nERROR: The following file could not be encrypted ({error}):\n - {file}\n")
+            elif size is not None:
+                file_count += 1
+                data_size += size
+                if not silent:
+                    print(f"Encrypting '{file}'")
+
+            if progress is not None:
+                progress.update(st.st_size, skipped=size is None and error is None, error=error is not None)
 
     return file_count, ByteSize(data_size)
 
 
-def encrypt_dir(root_dir:Path, fernet_file:Path, silent=False):
+def _walk_dirs(root_dir:Path, exclude:list=None, one_filesystem:bool=False, skip_hidden:bool=False, **_):
+    """
+    Yields (`Path`, `os.stat_result`) of every directory below `root_dir`,
+    empty or not, with the filters of `_walk_files()`. Symlinked dirs are
+    never included.
+    """
+    root = os.fspath(root_dir)
+    root_dev = os.stat(root).st_dev
+    name_re, rel_re = _compile_patterns(exclude)
+    for dirpath, dirnames, _ in os.walk(root):
+        keep = []
+        for name in dirnames:
+            path = os.path.join(dirpath, name)
+            if skip_hidden and name.startswith('.'):
+                continue
+            if name_re is not None and name_re.match(name):
+                continue
+            if rel_re is not None and rel_re.match(os.path.relpath(path, root)):
+                continue
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            if not stat.S_ISDIR(st.st_mode) or (one_filesystem and st.st_dev != root_dev):
+                continue
+            keep.append(name)
+            yield Path(path), st
+        dirnames[:] = keep
+
+
+def _archive_dir_tree(root_dir:Path, ctx:CipherContext, ignore:list=None, durability:str=DEFAULT_DURABILITY,
+                      walk_options:dict=None):
+    """
+    Packs all files of `root_dir` into the archive `root_dir/.encrypted.archive`
+    (see `archive.py`) and removes them, together with the directories left
+    empty by that. The directories are recorded too, so that empty ones are
+    restored by `decrypt_dir()`. The archive is complete and durable before
+    any file is removed.
+
+    Files that resolve to outside `root_dir` (possible with `follow_symlinks`)
+    are left alone with a warning, since they could not be extracted back.
+    Returns:
+    --------
+        tuple(`int`, ByteSize()): (total number of files archived, total size in Bytes)
+    """
+    root_dir = Path(root_dir)
+    walk_options = walk_options or {}
+    ignore = NOT_TO_ENCRYPT if ignore is None else NOT_TO_ENCRYPT + ignore
+    archive_file = root_dir / DOT_ARCHIVE_FILENAME
+    real_root = os.path.realpath(root_dir)
+
+    def _inside(files):
+        for path, st in files:
+            rel = os.path.relpath(path, root_dir)
+            real = os.path.realpath(path)
+            if rel == os.pardir or rel.startswith(os.pardir + os.sep) or os.path.commonpath([real, real_root]) != real_root:
+                print(f"\nWARNING: not archiving the file outside the directory:\n - {path}\n")
+                continue
+            yield path, st
+
+    files = _inside(_walk_files(root_dir, ignore=ignore + [archive_file], **walk_options))
+    dirs = list(_walk_dirs(root_dir, **walk_options))
+    entries = create_archive(archive_file, root_dir, files, key=ctx.stream_key, marker=MARKER,
+                             durability=durability, dirs=dirs)
+
+    parents = set()
+    with DirSyncBatch() as dir_sync:
+        for rel, *_ in entries:
+            path = root_dir / rel
+            path.unlink(missing_ok=True)
+            dir_sync.add(path.parent)
+            parents.add(path.parent)
+
+    # Deepest first, so that a parent is empty once its children are gone;
+    # every ancestor up to `root_dir` is removed as well once it is empty
+    for d in sorted(parents | {d for d, _ in dirs}, key=lambda d: len(d.parts), reverse=True):
+        while d != root_dir and root_dir in d.parents:
+            try:
+                d.rmdir()
+            except OSError:
+                break  # not empty (or gone already)
+            d = d.parent
+
+    return len(entries), ByteSize(sum(entry[2] for entry in entries))
+
+
+def encrypt_dir(root_dir:Path, fernet_file:Path, silent=False, jobs:int=None, durability:str=DEFAULT_DURABILITY,
+                resume:bool=True, compress:str=None, cipher:str=None, quiet:bool=False, metrics_file:Path=None,
+                archive:bool=False, **walk_options):
     """
     Use `_encrypt_dir_tree()` to encrypt all files in all subdirectories.
+    `fernet_file` is loaded once and shared by all the files.
+
+    With `resume`, every completed file is appended to the journal
+    `root_dir/.encrypted` (see `journal.py`), and files it lists as done and
+    unchanged are skipped. An interrupted run therefore picks up where it
+    stopped. A completed run leaves the encrypted manifest
+    `root_dir/.encrypted.manifest` of (path, size, mtime, hash), so the next
+    run only touches the files added or changed since.
+
+    `walk_options` (`exclude`, `follow_symlinks`, `one_filesystem`,
+    `skip_hidden`) control the traversal; see `_walk_files()`.
+    `compress` and `cipher` select the per-file compression and the binary
+    format's cipher; see `encrypt_file()`.
+
+    With `quiet`, the line per file is replaced by a live status line with
+    files/s, MB/s and ETA (on a terminal). `metrics_file` receives JSON lines
+    of progress and per-phase timings; see `progress.py`. `silent` prints
+    nothing at all.
+
+    With `archive`, the whole tree is instead packed into the single
+    encrypted container `root_dir/.encrypted.archive` with an encrypted
+    index (see `archive.py`), which is much faster for many small files.
+    `decrypt_dir()` unpacks it again.
+
+    Returns:
+    --------
+        `int`: number of files that could not be encrypted (1 if the dir
+        could not be archived), so 0 means success
     """
     root_dir = Path(root_dir)
+    fernet_file = load_cipher_context(fernet_file)
     already_encrypted = 0
 
+    if archive:
+        if (root_dir / DOT_ARCHIVE_FILENAME).exists():
+            print(f"\nERROR: The directory '{root_dir}' is already archived.\n")
+            return 1
+        t1 = time.time()
+        total_encrypted_files, encrypted_data_size = _archive_dir_tree(
+            root_dir, fernet_file, durability=durability, walk_options=walk_options,
+            ignore=[root_dir / DOT_ENCRYPTED_FILENAME, root_dir / (DOT_ENCRYPTED_FILENAME + MANIFEST_SUFFIX)]
+        )
+        if not silent:
+            print(f"\nAll files in the directory '{root_dir}' are now archived.\nTotal files archived: {total_encrypted_files}\n")
+            print(f"Total size of data encrypted: {encrypted_data_size:.3f}\n")
+            print(f"Total time taken: {format_time(time.time() - t1)}")
+            print("\nCheers!\n\nFrom,\nIndrajit\n")
+        return 0
+
     # Encrypt the dir
-    _ignore = []
+    journal_file = root_dir / DOT_ENCRYPTED_FILENAME
+    _ignore = [journal_file, root_dir / (DOT_ENCRYPTED_FILENAME + MANIFEST_SUFFIX)]
+    journal = ProgressJournal(root_dir, journal_file, op=OP_ENCRYPT, key=fernet_file.stream_key) if resume else None
+    if metrics_file is not None:
+        _ignore.append(Path(metrics_file))
+
+    progress = Progress('Encrypting', live=quiet and not silent and sys.stderr.isatty(), metrics_file=metrics_file)
+    if progress.enabled:
+        progress.count_in_background(
+            _walk_files(root_dir, ignore=NOT_TO_ENCRYPT + _ignore, **walk_options)
+        )
 
     t1 = time.time()
-    total_encrypted_files, encrypted_data_size = _encrypt_dir_tree(
-        root_dir=root_dir, ignore=_ignore, silent=silent, fernet_file=fernet_file
-    )
+    completed = False
+    try:
+        total_encrypted_files, encrypted_data_size = _encrypt_dir_tree(
+            root_dir=root_dir, ignore=_ignore, silent=silent or quiet, fernet_file=fernet_file, jobs=jobs,
+            durability=durability, journal=journal, walk_options=walk_options, compress=compress,
+            cipher=cipher, progress=progress
+        )
+        completed = True
+    finally:
+        progress.close()
+        if journal is not None:
+            journal.close(completed=completed)
+            already_encrypted = journal.skipped
     t2 = time.time()
     time_taken = format_time(t2-t1)
 
@@ -249,10 +700,14 @@ def encrypt_dir(root_dir:Path, fernet_file:Path, silent=False):
     if not silent:
         # Inform the user
         print(f"\nAll files in the directory '{root_dir}' are now encrypted.\nTotal files encrypted: {total_encrypted_files}\n"),
+        if already_encrypted:
+            print(f"Files skipped as unchanged since the last run: {already_encrypted}\n")
         print(f"Total size of data encrypted: {encrypted_data_size:.3f}\n")
-        print(f"Total time taken: {time_taken}")
+        print(f"Total time taken: {time_taken} ({progress.rate_summary()})")
         print("\nCheers!\n\nFrom,\nIndrajit\n")
 
+    return progress.errors
+
 
 def main():
     print('Python Script for Encryption!')
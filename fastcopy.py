@@ -0,0 +1,181 @@
+# Parallel, zero-copy file and directory copying
+#
+# Author: Indrajit Ghosh
+#
+# Created on: Oct 18, 2026
+#
+# Copy modes:
+#   'copy'     : copy the bytes in the kernel (`os.copy_file_range`, else
+#                `os.sendfile`, else a plain read/write loop)
+#   'reflink'  : share the data blocks copy-on-write (Btrfs, XFS, ...);
+#                falls back to 'copy' where not supported
+#   'hardlink' : link the files (same filesystem only; the copy and the
+#                original are then the *same* file); falls back to 'copy'
+#   'auto'     : 'reflink', i.e. instant where possible and a real copy
+#                everywhere else
+#
+
+import errno, os, shutil
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+try:
+    import fcntl
+except ModuleNotFoundError:  # Windows
+    fcntl = None
+
+COPY = 'copy'
+REFLINK = 'reflink'
+HARDLINK = 'hardlink'
+AUTO = 'auto'
+COPY_MODES = (COPY, REFLINK, HARDLINK, AUTO)
+
+FICLONE = 0x40049409 # ioctl of Linux, see ioctl_ficlone(2)
+CHUNK_SIZE = 64 * 1024 * 1024 # Max bytes per copy_file_range/sendfile call
+
+# Errors meaning "not possible here", after which the next method is tried
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EPERM, errno.EBADF}
+
+
+def _reflink(fsrc, fdst):
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflink is not supported")
+    fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def _copy_in_kernel(fsrc, fdst, size:int):
+    """Copies `size` bytes with `copy_file_range` or `sendfile`; raises OSError if neither works."""
+    infd, outfd = fsrc.fileno(), fdst.fileno()
+    for func in (getattr(os, 'copy_file_range', None), getattr(os, 'sendfile', None)):
+        if func is None:
+            continue
+        copied = 0
+        try:
+            while copied < size:
+                if func is os.sendfile:
+                    n = func(outfd, infd, copied, min(CHUNK_SIZE, size - copied))
+                else:
+                    n = func(infd, outfd, min(CHUNK_SIZE, size - copied), copied, copied)
+                if n == 0:
+                    break
+                copied += n
+            return
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED or copied:
+                raise
+    raise OSError(errno.ENOSYS, "no in-kernel copy available")
+
+
+def copy_file(src:Path, dst:Path, mode:str=AUTO):
+    """
+    Copies the file `src` to `dst` (a file path, replaced if it exists)
+    with its permission bits and times, using `mode` (see above).
+
+    Returns:
+    --------
+        the method actually used: 'hardlink', 'reflink' or 'copy'
+    """
+    if mode not in COPY_MODES:
+        raise ValueError(f"mode must be one of {COPY_MODES}, not {mode!r}")
+    src, dst = os.fspath(src), os.fspath(dst)
+
+    if mode == HARDLINK:
+        try:
+            if os.path.lexists(dst):
+                os.unlink(dst)
+            os.link(src, dst)
+            return HARDLINK
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+
+    if os.path.lexists(dst) and os.path.samefile(src, dst):
+        os.unlink(dst)  # e.g. hardlinked earlier; opening it would truncate `src`
+
+    used = COPY
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        done = False
+        if mode in (REFLINK, AUTO):
+            try:
+                _reflink(fsrc, fdst)
+                used = REFLINK
+                done = True
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED:
+                    raise
+        if not done:
+            try:
+                _copy_in_kernel(fsrc, fdst, size)
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED:
+                    raise
+                fdst.seek(0)
+                fdst.truncate()
+                fsrc.seek(0)
+                shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+
+    shutil.copystat(src, dst)
+    return used
+
+
+def copy_tree(src:Path, dst:Path, mode:str=AUTO, jobs:int=None):
+    """
+    Copies the contents of the directory `src` into `dst` (created if
+    needed; existing files are overwritten), like the former
+    `distutils.dir_util.copy_tree`. Directories are created while walking;
+    the files are copied by a pool of `jobs` threads (default: 4 per CPU,
+    since copies mostly wait for the disk). Symlinks are recreated, not
+    followed.
+
+    Returns:
+    --------
+        tuple(`int`, `int`): (number of files copied, total size in Bytes)
+    """
+    if mode not in COPY_MODES:
+        raise ValueError(f"mode must be one of {COPY_MODES}, not {mode!r}")
+    jobs = 4 * (os.cpu_count() or 1) if jobs is None else max(1, int(jobs))
+    file_count = 0
+    data_size = 0
+    dirs = []  # (src, dst) of the dirs whose times are set at the end
+
+    def _collect(futures):
+        nonlocal file_count, data_size
+        for fut in futures:
+            data_size += fut.result()
+            file_count += 1
+
+    def _copy(s, d, size):
+        copy_file(s, d, mode=mode)
+        return size
+
+    pending = set()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        stack = [(os.fspath(src), os.fspath(dst))]
+        while stack:
+            sdir, ddir = stack.pop()
+            os.makedirs(ddir, exist_ok=True)
+            dirs.append((sdir, ddir))
+            with os.scandir(sdir) as it:
+                for entry in it:
+                    target = os.path.join(ddir, entry.name)
+                    if entry.is_symlink():
+                        if os.path.lexists(target):
+                            os.unlink(target)
+                        os.symlink(os.readlink(entry.path), target)
+                    elif entry.is_dir():
+                        stack.append((entry.path, target))
+                    elif entry.is_file():
+                        pending.add(pool.submit(_copy, entry.path, target, entry.stat().st_size))
+                        if len(pending) >= 4 * jobs:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            _collect(done)
+
+        done, _ = wait(pending)
+        _collect(done)
+
+    # Deepest first, so that creating the children does not touch them again
+    for sdir, ddir in reversed(dirs):
+        shutil.copystat(sdir, ddir)
+
+    return file_count, data_size
@@ -0,0 +1,203 @@
+# Progress journal and encrypted manifest for resumable, incremental
+# directory runs
+#
+# Author: Indrajit Ghosh
+#
+# Created on: Oct 18, 2026
+#
+# The journal lives at `<root_dir>/.encrypted` (see `DOT_ENCRYPTED_FILENAME`)
+# and holds one JSON array per line:
+#
+#   [op, size, mtime_ns, relative_path, sha256]
+#
+# where `op` is 'E' (encrypted) or 'D' (decrypted), `size`/`mtime_ns`
+# describe the file right after it was processed and `sha256` is the hash
+# of its content then (or null). The last line of a path wins. A line torn
+# by a crash is ignored, so at worst one file is redone.
+#
+# When a run completes, the state of the tree is folded into the manifest
+# `<root_dir>/.encrypted.manifest`, a JSON document of the same entries
+# encrypted with the stream format (see `streaming.py`), and the journal is
+# removed. The next run starts from the manifest, so unchanged files are
+# recognised from their metadata alone.
+#
+
+import hashlib, io, json, os, threading
+from pathlib import Path
+
+from atomic_io import atomic_write, DURABILITY_NONE
+from streaming import encrypt_stream, decrypt_stream, StreamFormatError
+from cryptography.exceptions import InvalidTag
+
+OP_ENCRYPT = 'E'
+OP_DECRYPT = 'D'
+MANIFEST_SUFFIX = '.manifest'
+MANIFEST_VERSION = 1
+HASH_BUFFER_SIZE = 1024 * 1024
+
+
+def file_sha256(filepath:Path):
+    """Returns the hex sha256 of the content of `filepath`."""
+    h = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_BUFFER_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ProgressJournal:
+    """
+    Records the files completed by a directory run so that a rerun skips
+    them with one dict lookup per file, without opening them.
+
+    With a `key` (see `streaming.derive_stream_key()`), the entries are
+    persisted across runs in the encrypted manifest. A file whose mtime
+    changed but whose size did not is then hashed and compared with the
+    manifest, so a mere `touch` or a copy does not force it to be redone.
+
+    Example:
+    --------
+        >>> journal = ProgressJournal(root_dir, root_dir / '.encrypted', op=OP_ENCRYPT, key=ctx.stream_key)
+        >>> if not journal.is_done(file, st):
+        ...     encrypt_file(file, ctx)
+        ...     journal.record(file)
+        >>> journal.close(completed=True)
+    """
+
+    def __init__(self, root_dir:Path, journal_file:Path, op:str, key:bytes=None):
+        self.root_dir = Path(root_dir)
+        self.path = Path(journal_file)
+        self.manifest_path = self.path.with_name(self.path.name + MANIFEST_SUFFIX)
+        self.op = op
+        self.key = key
+        self.skipped = 0
+        self.has_manifest = False
+        self._entries = {}
+        self._seen = set()
+        self._lock = threading.Lock()
+        self._file = None
+
+        if key is not None:
+            self._load_manifest()
+        self._load_journal()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'rb') as src:
+                plain = io.BytesIO()
+                decrypt_stream(src, plain, key=self.key)
+        except FileNotFoundError:
+            return
+        except (InvalidTag, StreamFormatError):
+            print(f"\nWARNING: ignoring the unreadable manifest:\n - {self.manifest_path}\n")
+            return
+
+        doc = json.loads(plain.getvalue().decode('utf-8', 'surrogateescape'))
+        for rel, entry in doc.get('files', {}).items():
+            self._entries[rel] = tuple(entry)
+        self.has_manifest = True
+
+    def _load_journal(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+                for line in f:
+                    try:
+                        op, size, mtime_ns, rel, *digest = json.loads(line)
+                    except ValueError:
+                        continue  # torn line
+                    self._entries[rel] = (op, size, mtime_ns, digest[0] if digest else None)
+        except FileNotFoundError:
+            pass
+
+    def _key(self, filepath:Path):
+        return os.path.relpath(filepath, self.root_dir)
+
+    def is_known(self, filepath:Path):
+        """Returns True if the journal or the manifest has an entry for `filepath`."""
+        key = self._key(filepath)
+        with self._lock:
+            self._seen.add(key)
+            return key in self._entries
+
+    def is_done(self, filepath:Path, st:os.stat_result):
+        """
+        Returns True if `filepath` was completed by an earlier run of the same
+        operation and has not changed since: same size and mtime, or same
+        size and content hash.
+        """
+        key = self._key(filepath)
+        with self._lock:
+            self._seen.add(key)
+            entry = self._entries.get(key)
+
+        if entry is None or entry[0] != self.op or entry[1] != st.st_size:
+            return False
+
+        if entry[2] != st.st_mtime_ns:
+            if entry[3] is None or file_sha256(filepath) != entry[3]:
+                return False
+            # Unchanged content: remember the new mtime
+            self.record(filepath, digest=entry[3])
+
+        with self._lock:
+            self.skipped += 1
+        return True
+
+    def record(self, filepath:Path, digest:str=None):
+        """
+        Appends a line for `filepath` with its current size and mtime.
+        `digest` is the hex sha256 of its content, if known.
+        """
+        st = os.stat(filepath)
+        key = self._key(filepath)
+        entry = (self.op, st.st_size, st.st_mtime_ns, digest)
+        line = json.dumps([*entry[:3], key, digest], ensure_ascii=False) + '\n'
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8', errors='surrogateescape')
+            self._file.write(line)
+            self._file.flush()
+            self._entries[key] = entry
+            self._seen.add(key)
+
+    def close(self, completed:bool=False):
+        """
+        Closes the journal. After a `completed` run the entries of the files
+        seen in this run that are left encrypted are saved (the encrypted
+        manifest if there is a `key`, else the compacted journal) and the
+        journal itself is removed.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+            if not completed:
+                return
+
+            files = {
+                key: self._entries[key]
+                for key in sorted(self._seen)
+                if key in self._entries and self._entries[key][0] == OP_ENCRYPT
+            }
+
+            if self.key is None:
+                if self.op == OP_DECRYPT:
+                    self.path.unlink(missing_ok=True)
+                    return
+                with atomic_write(self.path, durability=DURABILITY_NONE) as f:
+                    for key, entry in files.items():
+                        line = json.dumps([*entry[:3], key, entry[3]], ensure_ascii=False) + '\n'
+                        f.write(line.encode('utf-8', 'surrogateescape'))
+                return
+
+            if files:
+                doc = json.dumps({'version': MANIFEST_VERSION, 'files': files}, ensure_ascii=False)
+                with atomic_write(self.manifest_path, durability=DURABILITY_NONE) as f:
+                    encrypt_stream(io.BytesIO(doc.encode('utf-8', 'surrogateescape')), f, key=self.key)
+            else:
+                self.manifest_path.unlink(missing_ok=True)
+            self.path.unlink(missing_ok=True)
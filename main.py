@@ -4,105 +4,348 @@
 #
 # Created on: Dec 24, 2022
 #
+# Usage:
+#   python main.py enc PATH [PATH ...] [options]
+#   python main.py dec PATH [PATH ...] [options]
+#   python main.py --manifest jobs.jsonl [enc|dec] [options]
+#
+# A manifest ('-' for stdin) has one JSON object per line:
+#
+#   {"path": "docs", "op": "enc", "options": {"compress": "auto", "jobs": 8}}
+#
+# `op` defaults to the one given on the command line; `options` override the
+# command line options for that job (names as in `JOB_OPTIONS`). Blank lines
+# and lines starting with '#' are ignored.
+#
+# The password is asked for once per run, or taken without a prompt from
+# `--password-env VAR`, `--password-fd FD`, `--password-file FILE` or the
+# environment variable LOCKER_PASSWORD; then every job runs in this process.
+#
 
-from encryption import encrypt_file, encrypt_dir, generate_fernet_key
+from encryption import encrypt_file, encrypt_dir, generate_fernet_key, load_cipher_context, format_time
 from decryption import decrypt_file, decrypt_dir
-from authentication import save_password, input_secret_key
+from authentication import save_password, input_secret_key, has_password, check_password, read_password
+from atomic_io import DURABILITY_LEVELS
+from compressors import CODECS, AUTO
+from streaming import CIPHERS
 from pathlib import Path
-import sys
+import argparse, json, os, sys, time
 
 DEFAULT_RSA_KEYS_DIR = Path(__file__).resolve().parent / ".rsa_keys"
 INDRAJIT_FERNET_KEY_FILE = Path(__file__).resolve().parent / "rsa_keys/fernet.key"
 DEFAULT_FERNET_KEY_FILE = DEFAULT_RSA_KEYS_DIR / 'fernet.key'
 DOT_ENV_FILE = Path(__file__).parent.resolve() / '.env'
+PASSWORD_ENV = 'LOCKER_PASSWORD'
 CWD = Path.cwd()
 
+ENC = 'enc'
+DEC = 'dec'
+
+# Options a job may have, as (options of a file, options of a dir only)
+_WALK_OPTIONS = {'exclude', 'follow_symlinks', 'one_filesystem', 'skip_hidden'}
+JOB_OPTIONS = {
+    ENC: ({'compress', 'cipher', 'durability'},
+          {'jobs', 'quiet', 'metrics_file', 'archive', 'resume'} | _WALK_OPTIONS),
+    DEC: ({'durability'},
+          {'jobs', 'quiet', 'metrics_file', 'resume'} | _WALK_OPTIONS),
+}
+
+# Outcomes of a job
+DONE = 'done'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
 
-def _encrypt(fernet_file:Path, path:Path=CWD, **kwargs):
+class JobError(Exception):
+    """Raised for a job that cannot run, e.g. a bad manifest line, or fails in part."""
+
+
+def _run_job(ctx, op:str, path:Path, options:dict):
     """
-    This checks whether `path` is a file or dir and according encrypt it.
-    By default it will encrypt `Path.cwd()`.
+    Encrypts (`op` 'enc') or decrypts (`op` 'dec') the file or dir `path`
+    with the `CipherContext` `ctx`. `options` are keyword arguments of
+    `encrypt_file()`/`encrypt_dir()` (resp. the decrypt ones); those that do
+    not apply to a file are left out for one.
+
+    Returns:
+    --------
+        `DONE`, `SKIPPED` (a file that is already encrypted) or `FAILED`
+        (a file that could not be decrypted); raises `JobError` if files of
+        a dir failed
     """
     path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"no such file or dir exists > `{path}`")
+
+    file_options, dir_options = JOB_OPTIONS[op]
     if path.is_file():
-        encrypt_file(filepath=path, fernet_file=fernet_file, **kwargs)
+        kwargs = {k: v for k, v in options.items() if k in file_options}
+        print_status = not options.get('quiet', False)
+        if op == ENC:
+            return SKIPPED if encrypt_file(filepath=path, fernet_file=ctx, print_status=print_status, **kwargs) == -1 else DONE
+        return FAILED if decrypt_file(encrypted_file=path, fernet_file=ctx, print_status=print_status, **kwargs) == -1 else DONE
 
+    kwargs = {k: v for k, v in options.items() if k in file_options | dir_options}
+    if op == ENC:
+        errors = encrypt_dir(root_dir=path, fernet_file=ctx, **kwargs)
     else:
-        encrypt_dir(root_dir=path, fernet_file=fernet_file, **kwargs)
+        errors = decrypt_dir(root_dir=path, fernet_file=ctx, **kwargs)
+    if errors:
+        raise JobError(f"{errors} error(s) in the dir")
+    return DONE
+
+
+def _make_job(op:str, path, options:dict, source:str):
+    """Checks a job and returns it as a tuple (op, path, options)."""
+    if op not in JOB_OPTIONS:
+        raise JobError(f"{source}: `op` must be '{ENC}' or '{DEC}', not {op!r}")
+    if not isinstance(path, str) or not path:
+        raise JobError(f"{source}: `path` must be a non-empty string")
+    if not isinstance(options, dict):
+        raise JobError(f"{source}: `options` must be an object")
+
+    file_options, dir_options = JOB_OPTIONS[op]
+    unknown = set(options) - file_options - dir_options
+    if unknown:
+        raise JobError(f"{source}: unknown option(s) for '{op}': {', '.join(sorted(unknown))}")
+    if 'metrics_file' in options:
+        options['metrics_file'] = Path(options['metrics_file']).absolute()
+    return op, Path(path), options
 
 
-def _decrypt(fernet_file:Path, path:Path=CWD):
+def read_manifest(filepath, default_op:str=None, defaults:dict=None):
     """
-    This checks whether `path` is a file or dir and according decrypt it.
-    By default it will decrypt `Path.cwd()`.
+    Reads the jobs of the manifest `filepath` ('-' for stdin); see the top
+    of this file. `defaults` are the options of every job, overridden by the
+    job's own.
+
+    Returns:
+    --------
+        list of tuples (op, path, options)
     """
-    path = Path(path)
-    if path.is_file():
-        decrypt_file(
-            encrypted_file=path, 
-            fernet_file=fernet_file
-        )
+    defaults = defaults or {}
+    f = sys.stdin if str(filepath) == '-' else open(filepath)
+    jobs = []
+    try:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            source = f"{filepath}:{lineno}"
+            try:
+                job = json.loads(line)
+            except ValueError as e:
+                raise JobError(f"{source}: invalid JSON ({e})") from None
+            if not isinstance(job, dict):
+                raise JobError(f"{source}: expected a JSON object")
 
-    else:
-        decrypt_dir(
-            root_dir=path,
-            fernet_file=fernet_file
-        )
+            op = job.get('op', default_op)
+            options = job.get('options', {})
+            if isinstance(options, dict):
+                # The command line defaults only where they apply to this op
+                file_options, dir_options = JOB_OPTIONS.get(op, (set(), set()))
+                options = {**{k: v for k, v in defaults.items() if k in file_options | dir_options}, **options}
+            jobs.append(_make_job(op, job.get('path'), options, source))
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+    return jobs
+
+
+def authenticate(args, interactive:bool):
+    """
+    Checks the password once for the whole run. Returns True if it is right.
+    Without a non-interactive source it is asked for on the terminal.
+    """
+    try:
+        password = read_password(env=args.password_env, fd=args.password_fd, filepath=args.password_file)
+    except (KeyError, OSError) as e:
+        print(f"\nERROR: could not read the password: {e}\n")
+        return False
+
+    if password is None and os.environ.get(PASSWORD_ENV) is not None:
+        password = os.environ[PASSWORD_ENV]
+
+    if password is None:
+        if not interactive:
+            print("\nERROR: no password given and stdin is not a terminal\n")
+            return False
+        return input_secret_key(user=args.user)
+    return check_password(password, user=args.user)
 
 
-def main():
-    
-    fernet_key_file = INDRAJIT_FERNET_KEY_FILE # Set it None at the time of distribution
+def run_jobs(ctx, jobs:list, keep_going:bool=True):
+    """
+    Runs `jobs` (tuples (op, path, options)) one after the other with the
+    `CipherContext` `ctx`. An error fails its job only; with `keep_going`
+    False the remaining jobs are then not run.
+
+    Returns:
+    --------
+        list of tuples (op, path, outcome, error message or None)
+    """
+    results = []
+    for op, path, options in jobs:
+        try:
+            outcome, error = _run_job(ctx, op, path, options), None
+        except Exception as e:
+            outcome, error = FAILED, str(e) or type(e).__name__
+            print(f"\nERROR: '{op}' of `{path}` failed: {error}\n")
+        results.append((op, path, outcome, error))
+        if outcome == FAILED and not keep_going:
+            break
+    return results
+
+
+def print_summary(results:list, total_jobs:int, elapsed:float):
+    """Prints the outcome of a batch run by `run_jobs()`."""
+    counts = {DONE: 0, SKIPPED: 0, FAILED: 0}
+    for _, _, outcome, _ in results:
+        counts[outcome] += 1
+    not_run = total_jobs - len(results)
+
+    print(f"\nSummary: {total_jobs} job(s) in {format_time(elapsed)}")
+    print(f" - done: {counts[DONE]}")
+    if counts[SKIPPED]:
+        print(f" - skipped (already encrypted): {counts[SKIPPED]}")
+    if counts[FAILED]:
+        print(f" - failed: {counts[FAILED]}")
+        for op, path, outcome, error in results:
+            if outcome == FAILED:
+                print(f"     {op} `{path}`" + (f": {error}" if error else ""))
+    if not_run:
+        print(f" - not run: {not_run}")
+    print()
+
+
+def add_auth_arguments(parser):
+    """Adds the options of `authenticate()` to the argparse `parser`."""
+    auth = parser.add_argument_group('authentication (default: prompt, or $' + PASSWORD_ENV + ')')
+    auth.add_argument('--user', default=None, help='User to authenticate (default: $LOCKER_USER or the login name)')
+    source = auth.add_mutually_exclusive_group()
+    source.add_argument('--password-env', metavar='VAR', help='Read the password from this environment variable')
+    source.add_argument('--password-fd', metavar='FD', type=int, help='Read the password from this file descriptor')
+    source.add_argument('--password-file', metavar='FILE', type=Path, help='Read the password from this file (mode 600)')
+
+
+def resolve_fernet_key(fernet_key:Path=None):
+    """
+    Returns the path of the fernet key file: `fernet_key` if given (it must
+    exist), else the default one, which is created on first use.
+    """
+    fernet_key_file = fernet_key if fernet_key is not None else INDRAJIT_FERNET_KEY_FILE # Set it None at the time of distribution
     fernet_key_file = Path(fernet_key_file) if fernet_key_file is not None else DEFAULT_FERNET_KEY_FILE
-    
+
     # If `fernet_key_file` not exists then create a new fernet key file
     # at the `./rsa_keys/fernet.key`
     if not fernet_key_file.exists():
+        if fernet_key is not None:
+            print(f"\nERROR: no such fernet key file > `{fernet_key_file}`\n")
+            sys.exit(1)
+
         # Generate fernet keys
         fernet_key = generate_fernet_key()
 
-        # Create `.rsa_keys` dir 
+        # Create `.rsa_keys` dir
         if not DEFAULT_RSA_KEYS_DIR.exists():
             DEFAULT_RSA_KEYS_DIR.mkdir()
 
         # Save the fernet key for future use
         with open(DEFAULT_FERNET_KEY_FILE, 'wb') as f:
             f.write(fernet_key)
+        fernet_key_file = DEFAULT_FERNET_KEY_FILE
+
+    return fernet_key_file
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(
+        description="Encrypt or decrypt files and dirs; many paths or a job manifest in one run."
+    )
+    parser.add_argument('op', nargs='?', choices=(ENC, DEC), help="'enc' or 'dec' (default op of a manifest)")
+    parser.add_argument('paths', nargs='*', help='Files or dirs (default: the current dir)')
+    parser.add_argument('-m', '--manifest', help="JSON lines file of jobs (path/op/options); '-' for stdin")
+    parser.add_argument('--fernet-key', type=Path, default=None, help='Fernet key file')
+    parser.add_argument('--stop-on-error', action='store_true', help='Do not run the jobs after a failed one')
+
+    add_auth_arguments(parser)
+
+    # Defaults of every job; None means "not given"
+    opts = parser.add_argument_group('job options')
+    opts.add_argument('-j', '--jobs', type=int, default=None, help='Worker threads per dir (default: CPU count)')
+    opts.add_argument('-q', '--quiet', action='store_true', default=None, help='Live status line instead of a line per file')
+    opts.add_argument('--metrics', dest='metrics_file', type=Path, default=None, help='JSON lines file of progress metrics')
+    opts.add_argument('--archive', action='store_true', default=None, help='Pack a dir into one encrypted archive')
+    opts.add_argument('--compress', choices=[AUTO] + list(CODECS), default=None, help='Compress before encrypting')
+    opts.add_argument('--cipher', choices=list(CIPHERS), default=None, help='Cipher of the binary format')
+    opts.add_argument('--durability', choices=DURABILITY_LEVELS, default=None, help='fsync policy (default: batch)')
+    opts.add_argument('--no-resume', dest='resume', action='store_false', default=None, help='Ignore the journal of a dir')
+    opts.add_argument('--exclude', action='append', default=None, metavar='GLOB', help='Skip matching files and dirs')
+    return parser
+
+
+def main(argv:list=None):
+
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+
+    fernet_key_file = resolve_fernet_key(args.fernet_key)
+
+    # Collect the jobs
+    defaults = {
+        k: v for k, v in vars(args).items()
+        if k in JOB_OPTIONS[ENC][0] | JOB_OPTIONS[ENC][1] | JOB_OPTIONS[DEC][1] and v is not None
+    }
+    if 'metrics_file' in defaults:
+        defaults['metrics_file'] = defaults['metrics_file'].absolute()
+
+    try:
+        jobs = []
+        if args.manifest is not None:
+            jobs += read_manifest(args.manifest, default_op=args.op, defaults=defaults)
+        if args.op is None and args.paths:
+            parser.error("the paths need an op, 'enc' or 'dec'")
+        if args.op is not None and (args.paths or args.manifest is None):
+            options = {k: v for k, v in defaults.items() if k in JOB_OPTIONS[args.op][0] | JOB_OPTIONS[args.op][1]}
+            for p in args.paths or [str(CWD)]:
+                jobs.append(_make_job(args.op, p, dict(options), 'command line'))
+    except (JobError, OSError) as e:
+        print(f"\nERROR: {e}\n")
+        sys.exit(1)
+
+    if not jobs:
+        parser.error("nothing to do; give 'enc'/'dec' and paths, or a --manifest")
+
+    interactive = sys.stdin.isatty() and args.manifest != '-'
+
+    # Authenticate once for the whole batch
+    if not has_password(args.user):
+        if not interactive:
+            print("\nERROR: no password is set yet; run `python main.py enc` on a terminal first.\n")
+            sys.exit(1)
+        save_password(user=args.user)
+        print("\nPassword has been saved for future. You can try encrypting again with this new password!\n")
+        return
+
+    if not authenticate(args, interactive):
+        print("\nSorry that didn't work!\n")
+        sys.exit(1)
+
+    # Load the key once; all the jobs share it
+    ctx = load_cipher_context(fernet_key_file)
+
+    t1 = time.time()
+    results = run_jobs(ctx, jobs, keep_going=not args.stop_on_error)
+    t2 = time.time()
 
+    if len(jobs) > 1 or any(outcome == FAILED for _, _, outcome, _ in results):
+        print_summary(results, len(jobs), t2 - t1)
 
-    # Take input properly
-    crypto = sys.argv[1]
-
-    p = ' '.join(sys.argv[2:])
-    p = Path(p) if p is not None else CWD
-    
-    if not p.exists():
-        print(f"\nERROR: no such file or dir exists > `{p}`\n")
-        sys.exit()
-
-    if crypto == 'enc':
-        # Encryption
-        if DOT_ENV_FILE.exists():
-            if input_secret_key():
-                _encrypt(path=p, fernet_file=fernet_key_file)
-            else:
-                print("\nSorry that didn't work!\n")
-                sys.exit()
-                
-        else:
-            save_password(filepath=DOT_ENV_FILE)
-            print("\nPassword has been saved for future. You can try encrypting again with this new password!\n")
-
-    
-    elif crypto == 'dec':
-        # Decryption
-        if input_secret_key():
-            _decrypt(path=p, fernet_file=fernet_key_file)
-        else:
-            print("\nSorry that didn't work!\n")
-            sys.exit()
+    if any(outcome == FAILED for _, _, outcome, _ in results):
+        sys.exit(1)
 
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,281 @@
+# Live progress display and metrics of directory runs
+#
+# Author: Indrajit Ghosh
+#
+# Created on: Oct 18, 2026
+#
+# A `Progress` is fed by the thread collecting the results of a directory
+# run (see `encryption._map_files()`). It redraws one status line on stderr
+# at most every `interval` seconds, and optionally appends JSON lines to a
+# metrics file:
+#
+#   {"event": "start", "action": ..., "time": ...}
+#   {"event": "progress", "elapsed": ..., "files": ..., "bytes": ..., "files_per_s": ..., "mb_per_s": ..., "eta": ...}
+#   {"event": "end", ..., "skipped": ..., "errors": ..., "phases": {"walk": ..., "read": ..., "crypt": ..., "write": ...}}
+#
+# Phase times are summed over the worker threads, so with several jobs they
+# may add up to more than the wall time. Reads through a memory map happen
+# inside the cipher and are counted as 'crypt'.
+#
+
+import json, sys, threading, time
+from contextlib import contextmanager, nullcontext
+
+PHASES = ('walk', 'read', 'crypt', 'write')
+DEFAULT_INTERVAL = 0.5 # Seconds between two redraws / metrics lines
+
+
+class _TimedFile:
+    """Wraps a file object and adds the time spent in `read`/`write` to a clock phase."""
+
+    def __init__(self, file, clock, name):
+        self.file = file
+        self._clock = clock
+        self._name = name
+
+    def read(self, *args):
+        with self._clock.phase(self._name):
+            return self.file.read(*args)
+
+    def write(self, data):
+        with self._clock.phase(self._name):
+            return self.file.write(data)
+
+
+class PhaseClock:
+    """
+    Times the phases of one file; see `Progress.clock()`. Not shared
+    between threads.
+
+    Example:
+    --------
+        >>> clock = progress.clock()
+        >>> with clock.phase('read'):
+        ...     data = f.read()
+        >>> clock.close()
+    """
+
+    def __init__(self, progress):
+        self._progress = progress
+        self.times = dict.fromkeys(PHASES, 0.0)
+
+    @contextmanager
+    def phase(self, name:str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] += time.perf_counter() - start
+
+    @contextmanager
+    def rest(self, name:str='crypt'):
+        """
+        Times the block as `name`, minus the time the files wrapped by
+        `reader()`/`writer()` spent in I/O meanwhile.
+        """
+        io_before = self.times['read'] + self.times['write']
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            io = self.times['read'] + self.times['write'] - io_before
+            self.times[name] += time.perf_counter() - start - io
+
+    def reader(self, file):
+        return _TimedFile(file, self, 'read')
+
+    def writer(self, file):
+        return _TimedFile(file, self, 'write')
+
+    def close(self):
+        self._progress.add_phases(self.times)
+
+
+class _NoClock:
+    """Stand-in for `PhaseClock` when no metrics are collected."""
+
+    def phase(self, name:str):
+        return nullcontext()
+
+    def rest(self, name:str='crypt'):
+        return nullcontext()
+
+    def reader(self, file):
+        return file
+
+    def writer(self, file):
+        return file
+
+    def close(self):
+        pass
+
+
+NO_CLOCK = _NoClock()
+
+
+class Progress:
+    """
+    Counts the files of a directory run, shows their rate and ETA and
+    records the phase timings.
+
+    Arguments:
+    ----------
+        `action`: e.g. 'Encrypting'; the prefix of the status line
+        `live`: redraw a status line on `stream`
+        `metrics_file`: Path() of a JSON-lines file to append metrics to
+        `interval`: min. seconds between two redraws or metrics lines
+
+    Example:
+    --------
+        >>> with Progress('Encrypting', live=True) as progress:
+        ...     for file, st in progress.walk(_walk_files(root_dir)):
+        ...         clock = progress.clock()
+        ...         encrypt_file(file, ctx, clock=clock)
+        ...         progress.update(st.st_size)
+    """
+
+    def __init__(self, action:str, live:bool=False, metrics_file=None, interval:float=DEFAULT_INTERVAL, stream=None):
+        self.action = action
+        self.live = live
+        self.interval = interval
+        self.stream = sys.stderr if stream is None else stream
+        self.files = 0
+        self.bytes = 0
+        self.skipped = 0
+        self.errors = 0
+        self.total_files = None
+        self.total_bytes = None
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self._lock = threading.Lock()
+        self._metrics = open(metrics_file, 'a', encoding='utf-8') if metrics_file is not None else None
+        self._start = self._last = time.perf_counter()
+        self._width = 0
+        self._closed = False
+        self._emit({'event': 'start', 'action': action, 'time': time.time()})
+
+    @property
+    def enabled(self):
+        """True if anything is displayed or recorded."""
+        return self.live or self._metrics is not None
+
+    def clock(self):
+        """A `PhaseClock` for one file, or a no-op clock if nothing is recorded."""
+        return PhaseClock(self) if self._metrics is not None else NO_CLOCK
+
+    def add_phases(self, times:dict):
+        with self._lock:
+            for name, t in times.items():
+                self.phases[name] += t
+
+    def walk(self, files):
+        """Passes on the items of the iterable `files`, timing the walk."""
+        it = iter(files)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                self.phases['walk'] += time.perf_counter() - start
+            yield item
+
+    def count_in_background(self, files):
+        """
+        Counts the `(path, stat)` items of `files` (a fresh walk of the same
+        tree) in a daemon thread, which gives the totals for the ETA.
+        """
+        def _count():
+            n = size = 0
+            for _, st in files:
+                if self._closed:
+                    return
+                n += 1
+                size += st.st_size
+            self.total_files, self.total_bytes = n, size
+
+        threading.Thread(target=_count, daemon=True).start()
+
+    def update(self, size:int, skipped:bool=False, error:bool=False):
+        """Counts one file of `size` Bytes; skipped files count towards the ETA only."""
+        if error:
+            self.errors += 1
+        elif skipped:
+            self.skipped += 1
+        else:
+            self.files += 1
+        self.bytes += size
+
+        now = time.perf_counter()
+        if now - self._last >= self.interval:
+            self._last = now
+            self._report(now)
+
+    def _rates(self, now:float):
+        elapsed = now - self._start
+        done = self.files + self.skipped + self.errors
+        files_per_s = done / elapsed if elapsed else 0.0
+        bytes_per_s = self.bytes / elapsed if elapsed else 0.0
+        eta = None
+        if self.total_bytes is not None and bytes_per_s:
+            eta = max(0.0, (self.total_bytes - self.bytes) / bytes_per_s)
+        elif self.total_files is not None and files_per_s:
+            eta = max(0.0, (self.total_files - done) / files_per_s)
+        return elapsed, files_per_s, bytes_per_s, eta
+
+    def _report(self, now:float):
+        from encryption import ByteSize, format_time
+
+        elapsed, files_per_s, bytes_per_s, eta = self._rates(now)
+        self._emit({
+            'event': 'progress', 'elapsed': elapsed, 'files': self.files, 'skipped': self.skipped,
+            'errors': self.errors, 'bytes': self.bytes, 'files_per_s': files_per_s,
+            'mb_per_s': bytes_per_s / 1024**2, 'eta': eta,
+        })
+
+        if self.live:
+            total = f"/{self.total_files}" if self.total_files is not None else ''
+            line = (
+                f"{self.action}: {self.files + self.skipped + self.errors}{total} files, {ByteSize(self.bytes):.2f}"
+                f" | {files_per_s:.1f} files/s, {ByteSize(int(bytes_per_s)):.2f}/s"
+                f" | ETA {format_time(eta) or '0s' if eta is not None else '--'}"
+            )
+            self.stream.write('\r' + line.ljust(self._width))
+            self.stream.flush()
+            self._width = len(line)
+
+    def _emit(self, record:dict):
+        if self._metrics is not None:
+            self._metrics.write(json.dumps(record) + '\n')
+            self._metrics.flush()
+
+    def rate_summary(self):
+        """e.g. '1200.5 files/s, 85.31 MB/s'"""
+        from encryption import ByteSize
+
+        _, files_per_s, bytes_per_s, _ = self._rates(time.perf_counter())
+        return f"{files_per_s:.1f} files/s, {ByteSize(int(bytes_per_s)):.2f}/s"
+
+    def close(self):
+        """Clears the status line and writes the final metrics record."""
+        if self._closed:
+            return
+        self._closed = True
+        if self.live and self._width:
+            self.stream.write('\r' + ' ' * self._width + '\r')
+            self.stream.flush()
+
+        elapsed, files_per_s, bytes_per_s, _ = self._rates(time.perf_counter())
+        self._emit({
+            'event': 'end', 'action': self.action, 'elapsed': elapsed, 'files': self.files,
+            'skipped': self.skipped, 'errors': self.errors, 'bytes': self.bytes,
+            'files_per_s': files_per_s, 'mb_per_s': bytes_per_s / 1024**2, 'phases': self.phases,
+        })
+        if self._metrics is not None:
+            self._metrics.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
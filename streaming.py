@@ -0,0 +1,462 @@
+# Segmented (streaming) container format used by Locker
+#
+# Author: Indrajit Ghosh
+#
+# Created on: Oct 18, 2026
+#
+# Layout of an encrypted file:
+#
+#   MARKER | STREAM_MAGIC | version | flags | segment_size | nonce_prefix
+#   segment_0 | segment_1 | ... | segment_n
+#
+# The low nibble of `flags` is the compression codec applied before
+# encryption (see `compressors.py`); 0 means no compression. The high nibble
+# is the AEAD cipher (see `CIPHERS`); 0 means AES-GCM.
+#
+# Every segment is `segment_size` bytes of (compressed) plaintext (the last
+# one may be shorter, even empty) sealed with the cipher, i.e. ciphertext
+# followed by a 16-byte tag. The nonce of a segment is `nonce_prefix || counter || last`,
+# so segments can neither be reordered nor dropped from the end, and the
+# whole header (including the MARKER) is authenticated with every segment.
+#
+
+import base64, io, mmap, os, struct, threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from compressors import CODECS, CODEC_NONE, CompressingReader, DecompressingWriter
+
+STREAM_MAGIC = b'\x00LKS'  # A Fernet token never starts with a NUL byte
+STREAM_VERSION = 1
+DEFAULT_SEGMENT_SIZE = 256 * 1024
+TAG_SIZE = 16
+SEGMENT_CACHE_SIZE = 8 # Decrypted segments kept by a `SegmentedStream`
+NONCE_PREFIX_SIZE = 7
+CODEC_MASK = 0x0F
+CIPHER_SHIFT = 4
+
+CIPHER_AESGCM = 0
+CIPHER_CHACHA20 = 1
+
+# Both take a 32-byte key and a 12-byte nonce. ChaCha20-Poly1305 is the
+# faster of the two on CPUs without AES instructions.
+CIPHERS = {
+    'aesgcm': CIPHER_AESGCM,
+    'chacha20': CIPHER_CHACHA20,
+}
+_AEADS = {
+    CIPHER_AESGCM: AESGCM,
+    CIPHER_CHACHA20: ChaCha20Poly1305,
+}
+
+# magic, version, flags, segment_size, nonce_prefix
+_HEADER = struct.Struct(f'>4sBBI{NONCE_PREFIX_SIZE}s')
+HEADER_SIZE = _HEADER.size
+
+
+class StreamFormatError(ValueError):
+    """Raised when a stream header is missing or malformed."""
+
+
+def derive_stream_key(fernet_key:bytes):
+    """
+    Derive the 256-bit key of the stream format (for either cipher) from a
+    Fernet key.
+    The Fernet key itself is never used directly by the stream cipher.
+    """
+    hkdf = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b'locker-stream-v1',
+    )
+    return hkdf.derive(base64.urlsafe_b64decode(fernet_key))
+
+
+def cipher_from_name(name:str):
+    """Maps a cipher name (see `CIPHERS`) to its id."""
+    if name not in CIPHERS:
+        raise ValueError(f"Unknown cipher {name!r}; choose one of {list(CIPHERS)}")
+    return CIPHERS[name]
+
+
+def _nonce(prefix:bytes, counter:int, last:bool):
+    return prefix + counter.to_bytes(4, 'big') + (b'\x01' if last else b'\x00')
+
+
+def is_stream_header(data:bytes, marker:bytes=b''):
+    """
+    Returns True if `data` (the first bytes of a file) starts with
+    `marker` followed by the stream magic.
+    """
+    start = len(marker)
+    return data[:start] == marker and data[start:start + len(STREAM_MAGIC)] == STREAM_MAGIC
+
+
+def parse_header(header:bytes):
+    """
+    Parse the fixed-size header (without the marker).
+    Returns:
+    --------
+        dict with keys `version`, `flags`, `codec`, `cipher`, `segment_size`,
+        `nonce_prefix`
+    """
+    if len(header) != HEADER_SIZE:
+        raise StreamFormatError("Truncated stream header")
+
+    magic, version, flags, segment_size, nonce_prefix = _HEADER.unpack(header)
+    if magic != STREAM_MAGIC:
+        raise StreamFormatError("Not a Locker stream")
+    if version != STREAM_VERSION:
+        raise StreamFormatError(f"Unsupported stream version {version}")
+    if segment_size == 0:
+        raise StreamFormatError("Invalid segment size")
+    codec = flags & CODEC_MASK
+    if codec not in CODECS.values():
+        raise StreamFormatError(f"Unknown compression codec {codec}")
+    cipher = flags >> CIPHER_SHIFT
+    if cipher not in _AEADS:
+        raise StreamFormatError(f"Unknown cipher {cipher}")
+
+    return {
+        'version': version,
+        'flags': flags,
+        'codec': codec,
+        'cipher': cipher,
+        'segment_size': segment_size,
+        'nonce_prefix': nonce_prefix,
+    }
+
+
+@contextmanager
+def map_file(path):
+    """
+    Maps the file at `path` read-only into memory and yields the `mmap`
+    object (or b'' for an empty file, which cannot be mapped). Pages are read
+    on demand by the OS, so nothing is copied up front.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if hasattr(mm, 'madvise'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            yield mm
+        finally:
+            mm.close()
+
+
+def encrypt_stream(src, dst, key:bytes, marker:bytes=b'', segment_size:int=DEFAULT_SEGMENT_SIZE, codec:int=CODEC_NONE,
+                   cipher:int=CIPHER_AESGCM):
+    """
+    Encrypts everything readable from the binary file object `src` into `dst`.
+    Only two segments are held in memory at any time.
+
+    Arguments:
+    ----------
+        `src`: binary file object opened for reading
+        `dst`: binary file object opened for writing
+        `key`: 32-byte key; see `derive_stream_key()`
+        `marker`: bytes written (and authenticated) in front of the header
+        `segment_size`: plaintext bytes per segment
+        `codec`: compression applied before encryption; see `compressors.py`
+        `cipher`: `CIPHER_AESGCM` or `CIPHER_CHACHA20`
+
+    Returns:
+    --------
+        number of bytes written to `dst`
+    """
+    prefix = os.urandom(NONCE_PREFIX_SIZE)
+    if cipher not in _AEADS:
+        raise ValueError(f"Unknown cipher {cipher}")
+    flags = (cipher << CIPHER_SHIFT) | codec
+    aad = marker + _HEADER.pack(STREAM_MAGIC, STREAM_VERSION, flags, segment_size, prefix)
+    if codec != CODEC_NONE:
+        src = CompressingReader(src, codec)
+    aead = _AEADS[cipher](key)
+
+    dst.write(aad)
+    written = len(aad)
+
+    counter = 0
+    chunk = src.read(segment_size)
+    while True:
+        # Read ahead one segment to know whether `chunk` is the last one
+        nxt = src.read(segment_size)
+        last = not nxt
+        sealed = aead.encrypt(_nonce(prefix, counter, last), chunk, aad)
+        dst.write(sealed)
+        written += len(sealed)
+        if last:
+            break
+        chunk = nxt
+        counter += 1
+
+    return written
+
+
+def _plain_writer(dst, codec:int):
+    return dst if codec == CODEC_NONE else DecompressingWriter(dst, codec)
+
+
+def _finish_plain_writer(out, written:int):
+    """Returns the number of plaintext bytes written through `out`."""
+    if isinstance(out, DecompressingWriter):
+        out.close()
+        return out.written
+    return written
+
+
+def decrypt_stream(src, dst, key:bytes, marker:bytes=b''):
+    """
+    Decrypts a stream written by `encrypt_stream()` from `src` into `dst`.
+    `src` must be positioned at the start of the `marker`.
+
+    Raises:
+    -------
+        `StreamFormatError` if the header is invalid,
+        `cryptography.exceptions.InvalidTag` if any segment fails to
+        authenticate (wrong key, tampering or truncation),
+        `compressors.CompressionError` if the codec is not available.
+
+    Returns:
+    --------
+        number of plaintext bytes written to `dst`
+    """
+    if src.read(len(marker)) != marker:
+        raise StreamFormatError("Missing marker")
+
+    header = src.read(HEADER_SIZE)
+    info = parse_header(header)
+    aad = marker + header
+    prefix = info['nonce_prefix']
+    sealed_size = info['segment_size'] + TAG_SIZE
+    aead = _AEADS[info['cipher']](key)
+    out = _plain_writer(dst, info['codec'])
+
+    written = 0
+    counter = 0
+    chunk = src.read(sealed_size)
+    while True:
+        nxt = src.read(sealed_size)
+        last = not nxt
+        if len(chunk) < TAG_SIZE:
+            raise InvalidTag()
+        plain = aead.decrypt(_nonce(prefix, counter, last), chunk, aad)
+        out.write(plain)
+        written += len(plain)
+        if last:
+            break
+        chunk = nxt
+        counter += 1
+
+    return _finish_plain_writer(out, written)
+
+
+def decrypt_buffer(buf, dst, key:bytes, marker:bytes=b''):
+    """
+    Same as `decrypt_stream()` but reads from a buffer, typically the `mmap`
+    yielded by `map_file()`. Segments are handed to the cipher as memoryview
+    slices, so the ciphertext is never copied.
+    """
+    with memoryview(buf) as view:
+        if bytes(view[:len(marker)]) != marker:
+            raise StreamFormatError("Missing marker")
+
+        pos = len(marker) + HEADER_SIZE
+        header = bytes(view[len(marker):pos])
+        info = parse_header(header)
+        aad = marker + header
+        prefix = info['nonce_prefix']
+        sealed_size = info['segment_size'] + TAG_SIZE
+        aead = _AEADS[info['cipher']](key)
+        out = _plain_writer(dst, info['codec'])
+        size = len(view)
+
+        written = 0
+        counter = 0
+        while True:
+            end = min(pos + sealed_size, size)
+            last = end == size
+            if end - pos < TAG_SIZE:
+                raise InvalidTag()
+            plain = aead.decrypt(_nonce(prefix, counter, last), view[pos:end], aad)
+            out.write(plain)
+            written += len(plain)
+            if last:
+                break
+            pos = end
+            counter += 1
+
+    return _finish_plain_writer(out, written)
+
+
+class SegmentedStream:
+    """
+    Random access to the plaintext of a stream written by `encrypt_stream()`
+    without compression. Segment `i` is read and decrypted on its own, so
+    reading a range costs only the segments it overlaps. The last
+    `cache_size` decrypted segments are kept in an LRU, hence sequential and
+    nearby reads decrypt every segment once. Safe to share between threads.
+
+    Only the segments actually read are authenticated; in particular a
+    stream cut at a segment boundary is noticed only when its (new) last
+    segment is read.
+
+    Arguments:
+    ----------
+        `f`: binary file object opened for reading
+        `key`: 32-byte key; see `derive_stream_key()`
+        `marker`: bytes in front of the header
+        `start`: offset of the stream (i.e. of the `marker`) in `f`
+        `length`: size of the stream in bytes; defaults to the rest of `f`
+        `cache_size`: number of decrypted segments to keep
+    """
+
+    def __init__(self, f, key:bytes, marker:bytes=b'', start:int=0, length:int=None,
+                 cache_size:int=SEGMENT_CACHE_SIZE):
+        self._f = f
+        self._lock = threading.Lock()
+        self._pread = getattr(os, 'pread', None)
+        if length is None:
+            length = os.fstat(f.fileno()).st_size - start
+
+        head = self._read_at(start, len(marker) + HEADER_SIZE)
+        if head[:len(marker)] != marker:
+            raise StreamFormatError("Missing marker")
+        header = head[len(marker):]
+        info = parse_header(header)
+        if info['codec'] != CODEC_NONE:
+            raise StreamFormatError("A compressed stream cannot be read at random")
+
+        self._aad = marker + header
+        self._aead = _AEADS[info['cipher']](key)
+        self.nonce_prefix = info['nonce_prefix']
+        self.segment_size = info['segment_size']
+        self._sealed_size = self.segment_size + TAG_SIZE
+        self._body = start + len(self._aad)
+
+        body_len = length - len(self._aad)
+        self.segments = max(1, -(-body_len // self._sealed_size))
+        last_len = body_len - (self.segments - 1) * self._sealed_size
+        if last_len < TAG_SIZE:
+            raise InvalidTag()
+        self._end = self._body + body_len
+        self.size = body_len - self.segments * TAG_SIZE
+
+        self._cache = OrderedDict()
+        self._cache_size = max(1, cache_size)
+
+    def _read_at(self, pos:int, n:int):
+        if self._pread is not None:
+            return self._pread(self._f.fileno(), n, pos)
+        with self._lock:
+            self._f.seek(pos)
+            return self._f.read(n)
+
+    def read_segment(self, i:int):
+        """Returns the plaintext of segment `i`."""
+        with self._lock:
+            plain = self._cache.get(i)
+            if plain is not None:
+                self._cache.move_to_end(i)
+                return plain
+        if not 0 <= i < self.segments:
+            raise IndexError(f"segment {i} out of range")
+
+        pos = self._body + i * self._sealed_size
+        sealed = self._read_at(pos, min(self._sealed_size, self._end - pos))
+        plain = self._aead.decrypt(_nonce(self.nonce_prefix, i, i == self.segments - 1), sealed, self._aad)
+        with self._lock:
+            self._cache[i] = plain
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return plain
+
+    def iter_range(self, offset:int, n:int):
+        """Yields the plaintext bytes [offset, offset + n) one segment slice at a time."""
+        end = min(offset + n, self.size)
+        while offset < end:
+            i, skip = divmod(offset, self.segment_size)
+            chunk = self.read_segment(i)[skip:skip + end - offset]
+            if not chunk:
+                raise InvalidTag()  # segment shorter than the layout says
+            yield chunk
+            offset += len(chunk)
+
+    def read_range(self, offset:int, n:int):
+        """Returns the plaintext bytes [offset, offset + n)."""
+        return b''.join(self.iter_range(offset, n))
+
+
+class StreamReader(io.RawIOBase):
+    """
+    Read-only, seekable file object over the plaintext of a
+    `SegmentedStream`, or over the window [`start`, `start` + `size`) of it.
+    Only the segments a read touches are decrypted. `file` (e.g. the file
+    object the stream reads from) is closed together with the reader.
+
+    Example:
+    --------
+        >>> with StreamReader(SegmentedStream(f, key, marker=MARKER)) as r:
+        ...     r.seek(10 * 1024**3)
+        ...     line = r.readline()
+    """
+
+    def __init__(self, segments:SegmentedStream, start:int=0, size:int=None, file=None):
+        super().__init__()
+        self.segments = segments
+        self._start = start
+        self._size = segments.size - start if size is None else size
+        self._pos = 0
+        self._file = file
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset:int, whence:int=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+        if pos < 0:
+            raise ValueError(f"negative seek position {pos}")
+        self._pos = pos
+        return pos
+
+    def readinto(self, b):
+        n = max(0, min(len(b), self._size - self._pos))
+        with memoryview(b) as view:
+            filled = 0
+            for chunk in self.segments.iter_range(self._start + self._pos, n):
+                view[filled:filled + len(chunk)] = chunk
+                filled += len(chunk)
+        self._pos += filled
+        return filled
+
+    def read(self, n:int=-1):
+        if n is None or n < 0:
+            n = max(0, self._size - self._pos)
+        return super().read(n)
+
+    def close(self):
+        if not self.closed and self._file is not None:
+            self._file.close()
+        super().close()
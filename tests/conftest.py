@@ -0,0 +1,24 @@
+# Shared setup of the tests
+#
+# Author: Indrajit Ghosh
+#
+# Created on: Oct 18, 2026
+#
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# The modules live at the top of the repo, not in a package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from encryption import generate_fernet_key
+
+
+@pytest.fixture
+def key_file(tmp_path):
+    """A fresh fernet key file."""
+    path = tmp_path / 'fernet.key'
+    path.write_bytes(generate_fernet_key())
+    return path
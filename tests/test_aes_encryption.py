@@ -0,0 +1,63 @@
+# Regression tests of the AES file format
+#
+# Author: Indrajit Ghosh
+#
+# Created on: Oct 18, 2026
+#
+
+import pytest
+
+from aes_encryption import aes_encrypt_file, aes_decrypt_file, derive_aes_key, MAX_PBKDF2_ITERATIONS
+
+
+def test_corrupt_payload_raises_the_decryption_error(tmp_path):
+    plain = tmp_path / 'data.txt'
+    plain.write_bytes(b'x' * 100000)
+    aes_key, salt = derive_aes_key('pw')
+    aes_encrypt_file(plain, aes_key, salt=salt)
+
+    encrypted = tmp_path / 'data.txt.bin'
+    data = bytearray(encrypted.read_bytes())
+    data[-1] ^= 0xFF  # breaks the padding of the last block
+    encrypted.write_bytes(bytes(data))
+
+    # Not a BufferError from closing the memory map
+    with pytest.raises(ValueError):
+        aes_decrypt_file(encrypted, 'pw')
+
+
+@pytest.mark.parametrize('iterations', [0, 2**32 - 1])
+def test_iteration_count_out_of_range_is_rejected(tmp_path, iterations):
+    plain = tmp_path / 'data.txt'
+    plain.write_bytes(b'data')
+    aes_key, salt = derive_aes_key('pw')
+    aes_encrypt_file(plain, aes_key, salt=salt)
+
+    # Rewrite the iteration count in the header (magic | version | salt_len | iterations)
+    encrypted = tmp_path / 'data.txt.bin'
+    data = bytearray(encrypted.read_bytes())
+    data[7:11] = iterations.to_bytes(4, 'big')
+    encrypted.write_bytes(bytes(data))
+
+    with pytest.raises(ValueError, match="iteration count"):
+        aes_decrypt_file(encrypted, 'pw')
+
+
+def test_non_default_iteration_count_round_trips(tmp_path):
+    plain = tmp_path / 'data.txt'
+    plain.write_bytes(b'data')
+    aes_key, salt = derive_aes_key('pw', iterations=10000)
+    aes_encrypt_file(plain, aes_key, salt=salt, iterations=10000, replace=True)
+
+    assert aes_decrypt_file(tmp_path / 'data.txt.bin', 'pw', replace=True)
+    assert plain.read_bytes() == b'data'
+
+
+def test_writer_rejects_what_the_reader_would(tmp_path):
+    plain = tmp_path / 'data.txt'
+    plain.write_bytes(b'data')
+    aes_key, salt = derive_aes_key('pw')
+
+    with pytest.raises(ValueError, match="iteration count"):
+        aes_encrypt_file(plain, aes_key, salt=salt, iterations=MAX_PBKDF2_ITERATIONS + 1)
+    assert not (tmp_path / 'data.txt.bin').exists()
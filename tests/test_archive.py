@@ -0,0 +1,77 @@
+# Regression tests of the archive mode
+#
+# Author: Indrajit Ghosh
+#
+# Created on: Oct 18, 2026
+#
+
+import os
+
+import pytest
+
+from archive import create_archive, ArchiveReader, ArchiveError, ARCHIVE_MAGIC
+from encryption import encrypt_dir, DOT_ARCHIVE_FILENAME
+from decryption import decrypt_dir
+
+
+def test_round_trip_keeps_empty_dirs_and_prunes_ancestors(tmp_path, key_file):
+    root = tmp_path / 'root'
+    (root / 'a' / 'b' / 'c').mkdir(parents=True)
+    (root / 'a' / 'b' / 'c' / 'f.txt').write_text('deep')
+    (root / 'empty' / 'nested').mkdir(parents=True)
+    (root / 'top.txt').write_text('top')
+
+    encrypt_dir(root, key_file, archive=True, silent=True)
+    assert sorted(p.name for p in root.iterdir()) == [DOT_ARCHIVE_FILENAME]
+
+    decrypt_dir(root, key_file)
+    assert (root / 'a' / 'b' / 'c' / 'f.txt').read_text() == 'deep'
+    assert (root / 'top.txt').read_text() == 'top'
+    assert (root / 'empty' / 'nested').is_dir()
+    assert not (root / DOT_ARCHIVE_FILENAME).exists()
+
+
+def test_symlinked_file_outside_the_root_is_not_archived(tmp_path, key_file):
+    outside = tmp_path / 'outside.txt'
+    outside.write_text('keep me')
+    root = tmp_path / 'root'
+    root.mkdir()
+    (root / 'in.txt').write_text('in')
+    os.symlink(outside, root / 'link.txt')
+
+    encrypt_dir(root, key_file, archive=True, silent=True, follow_symlinks=True)
+    assert outside.read_text() == 'keep me'
+
+    decrypt_dir(root, key_file)
+    assert (root / 'in.txt').read_text() == 'in'
+    assert outside.read_text() == 'keep me'
+
+
+def test_truncated_archive_raises_archive_error(tmp_path):
+    root = tmp_path / 'root'
+    root.mkdir()
+    files = []
+    for name in ('a.txt', 'b.txt'):
+        (root / name).write_bytes(name.encode() * 1000)
+        files.append((root / name, (root / name).stat()))
+    archive = tmp_path / 'archive'
+    key = os.urandom(32)
+    create_archive(archive, root, files, key=key)
+    data = archive.read_bytes()
+
+    for cut in list(range(len(ARCHIVE_MAGIC) + 1, 20)) + [len(data) // 2, len(data) - 1]:
+        archive.write_bytes(data[:cut])
+        with pytest.raises(ArchiveError):
+            ArchiveReader(archive, key=key)
+
+
+def test_decrypt_dir_keeps_a_truncated_archive(tmp_path, key_file):
+    root = tmp_path / 'root'
+    root.mkdir()
+    (root / 'a.txt').write_text('a')
+    encrypt_dir(root, key_file, archive=True, silent=True)
+    archive = root / DOT_ARCHIVE_FILENAME
+    archive.write_bytes(archive.read_bytes()[:40])
+
+    decrypt_dir(root, key_file)
+    assert archive.exists()
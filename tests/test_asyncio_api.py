@@ -0,0 +1,69 @@
+# Regression tests of the asyncio front end
+#
+# Author: Indrajit Ghosh
+#
+# Created on: Oct 18, 2026
+#
+
+import asyncio
+
+import pytest
+
+import asyncio_api
+from asyncio_api import encrypt_chunks_async, decrypt_chunks_async, encrypt_file_async
+
+DATA = bytes(range(256)) * 4096 # 1 MiB, 16 segments of 64 KiB
+
+
+@pytest.fixture
+def single_worker():
+    asyncio_api.configure(max_workers=1)
+    yield
+    asyncio_api.configure()
+
+
+async def _collect(chunks):
+    return b''.join([chunk async for chunk in chunks])
+
+
+@pytest.mark.parametrize('pipes', [1, 4])
+def test_decrypting_stream_piped_into_an_encrypting_one(tmp_path, key_file, single_worker, pipes):
+    src = tmp_path / 'src'
+
+    async def main():
+        await encrypt_chunks_async([DATA], src, key_file, segment_size=64 * 1024)
+        dsts = [tmp_path / f'dst{i}' for i in range(pipes)]
+        await asyncio.wait_for(asyncio.gather(*(
+            encrypt_chunks_async(decrypt_chunks_async(src, key_file), dst, key_file, segment_size=64 * 1024)
+            for dst in dsts
+        )), timeout=30)
+        return [await _collect(decrypt_chunks_async(dst, key_file)) for dst in dsts]
+
+    assert asyncio.run(main()) == [DATA] * pipes
+
+
+def test_idle_stream_does_not_starve_the_pool(tmp_path, key_file, single_worker):
+    src = tmp_path / 'src'
+    plain = tmp_path / 'plain.txt'
+    plain.write_bytes(b'plain')
+
+    async def main():
+        await encrypt_chunks_async([DATA], src, key_file, segment_size=64 * 1024)
+        chunks = decrypt_chunks_async(src, key_file)
+        first = await chunks.__anext__()
+        # The stream's worker now waits for room in its queue
+        await asyncio.sleep(0.2)
+        size = await asyncio.wait_for(encrypt_file_async(plain, key_file), timeout=30)
+        rest = await _collect(chunks)
+        return size, first + rest
+
+    size, data = asyncio.run(main())
+    assert size > 0
+    assert data == DATA
+
+
+def test_unknown_cipher_is_rejected_before_any_work(tmp_path, key_file):
+    dst = tmp_path / 'dst'
+    with pytest.raises(ValueError, match="Unknown cipher"):
+        asyncio.run(encrypt_chunks_async([b'data'], dst, key_file, cipher='rot13'))
+    assert not dst.exists()
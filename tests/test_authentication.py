@@ -0,0 +1,40 @@
+# Regression tests of the password checks
+#
+# Author: Indrajit Ghosh
+#
+# Created on: Oct 18, 2026
+#
+
+import pytest
+
+import authentication
+from credentials import CredentialStore
+
+LEGACY_SALT = 'salt'
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = CredentialStore(tmp_path / 'credentials.json')
+    store.params = {'n': 2**10, 'r': 8, 'p': 1}
+    monkeypatch.setattr(authentication, 'get_store', lambda: store)
+    monkeypatch.setattr(authentication, 'SALT', LEGACY_SALT)
+    monkeypatch.setattr(authentication, 'SECRET_KEY', authentication.sha256_hash('legacy' + LEGACY_SALT))
+    monkeypatch.setenv('LOCKER_USER', 'owner')
+    return store
+
+
+def test_legacy_password_does_not_register_other_users(store):
+    assert not authentication.has_password('mallory')
+    assert not authentication.check_password('legacy', user='mallory')
+    assert 'mallory' not in store
+
+
+def test_legacy_password_is_migrated_once(store):
+    assert authentication.has_password()
+    assert authentication.check_password('legacy')
+    assert 'owner' in store
+
+    store.set_password('owner', 'new')
+    assert not authentication.check_password('legacy')
+    assert authentication.check_password('new')
@@ -0,0 +1,74 @@
+# Regression tests of the compression stage
+#
+# Author: Indrajit Ghosh
+#
+# Created on: Oct 18, 2026
+#
+
+import io
+
+import pytest
+
+from compressors import DecompressingWriter, CompressionError, CODEC_ZSTD, MAX_OUTPUT
+
+zstandard = pytest.importorskip('zstandard')
+
+
+class _Recorder:
+    def __init__(self):
+        self.sizes = []
+
+    def write(self, data):
+        self.sizes.append(len(data))
+
+
+def test_zstd_output_is_bounded():
+    bomb = zstandard.ZstdCompressor().compress(b'\0' * (64 * MAX_OUTPUT))
+    out = _Recorder()
+    writer = DecompressingWriter(out, CODEC_ZSTD)
+    writer.write(bomb)
+    writer.close()
+    assert max(out.sizes) <= MAX_OUTPUT
+    assert sum(out.sizes) == 64 * MAX_OUTPUT
+
+
+@pytest.mark.parametrize('cut', [1, 10, -1])
+def test_truncated_zstd_is_detected(cut):
+    data = zstandard.ZstdCompressor(write_checksum=True).compress(bytes(range(256)) * 4000)
+    writer = DecompressingWriter(io.BytesIO(), CODEC_ZSTD)
+    writer.write(data[:cut])
+    with pytest.raises(CompressionError, match="Truncated"):
+        writer.close()
+
+
+def _skippable(payload):
+    return (0x184D2A50).to_bytes(4, 'little') + len(payload).to_bytes(4, 'little') + payload
+
+
+@pytest.mark.parametrize('checksum', [False, True])
+def test_zstd_frames_of_every_kind_are_decoded(checksum):
+    comp = zstandard.ZstdCompressor(write_checksum=checksum)
+    data = _skippable(b'meta') + comp.compress(b'a' * 100000) + _skippable(b'') + comp.compress(b'b' * 10)
+    for step in (1, 7, len(data)):
+        out = io.BytesIO()
+        writer = DecompressingWriter(out, CODEC_ZSTD)
+        for i in range(0, len(data), step):
+            writer.write(data[i:i + step])
+        writer.close()
+        assert out.getvalue() == b'a' * 100000 + b'b' * 10
+
+
+def test_truncated_second_zstd_frame_is_detected():
+    comp = zstandard.ZstdCompressor()
+    data = comp.compress(b'a' * 1000) + comp.compress(b'b' * 1000)
+    writer = DecompressingWriter(io.BytesIO(), CODEC_ZSTD)
+    writer.write(data[:-3])
+    with pytest.raises(CompressionError, match="Truncated"):
+        writer.close()
+
+
+def test_garbage_after_a_zstd_frame_is_corrupt():
+    data = zstandard.ZstdCompressor().compress(b'a' * 1000) + b'garbage!'
+    writer = DecompressingWriter(io.BytesIO(), CODEC_ZSTD)
+    with pytest.raises(CompressionError, match="Corrupt"):
+        writer.write(data)
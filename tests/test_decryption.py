@@ -0,0 +1,47 @@
+# Regression tests of the directory decryption
+#
+# Author: Indrajit Ghosh
+#
+# Created on: Oct 18, 2026
+#
+
+import asyncio
+
+from encryption import encrypt_dir, encrypt_file, is_file_encrypted
+from decryption import decrypt_dir
+from asyncio_api import decrypt_dir_async
+
+
+def _setup(tmp_path, key_file):
+    root = tmp_path / 'root'
+    (root / 'sub').mkdir(parents=True)
+    (root / 'a.txt').write_text('a')
+    (root / 'sub' / 'b.txt').write_text('b')
+    encrypt_dir(root, key_file, silent=True)
+    assert (root / '.encrypted.manifest').exists()
+
+    # Encrypted on its own after the directory run, so not in the manifest
+    (root / 'new.txt').write_text('new')
+    encrypt_file(root / 'new.txt', key_file, print_status=False)
+    # Added later and left as plaintext
+    (root / 'plain.txt').write_text('plain')
+    return root
+
+
+def _check(root):
+    for name in ('a.txt', 'sub/b.txt', 'new.txt', 'plain.txt'):
+        assert not is_file_encrypted(root / name), name
+    assert (root / 'new.txt').read_text() == 'new'
+    assert (root / 'plain.txt').read_text() == 'plain'
+
+
+def test_decrypt_dir_decrypts_files_missing_from_the_manifest(tmp_path, key_file):
+    root = _setup(tmp_path, key_file)
+    decrypt_dir(root, key_file)
+    _check(root)
+
+
+def test_decrypt_dir_async_decrypts_files_missing_from_the_manifest(tmp_path, key_file):
+    root = _setup(tmp_path, key_file)
+    asyncio.run(decrypt_dir_async(root, key_file))
+    _check(root)
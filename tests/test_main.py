@@ -0,0 +1,57 @@
+# Regression tests of the command line
+#
+# Author: Indrajit Ghosh
+#
+# Created on: Oct 18, 2026
+#
+
+import json
+
+import pytest
+
+import main
+from encryption import encrypt_dir
+
+
+@pytest.fixture
+def logged_in(monkeypatch):
+    monkeypatch.setattr(main, 'has_password', lambda user: True)
+    monkeypatch.setattr(main, 'authenticate', lambda args, interactive: True)
+
+
+def _manifest(tmp_path, *jobs):
+    path = tmp_path / 'jobs.jsonl'
+    path.write_text(''.join(json.dumps(job) + '\n' for job in jobs))
+    return str(path)
+
+
+def test_invalid_manifest_line_exits_non_zero(tmp_path, key_file, logged_in):
+    manifest = _manifest(tmp_path, {'path': str(tmp_path), 'op': 'enc'}, {'path': str(tmp_path)})
+    with pytest.raises(SystemExit) as exc:
+        main.main(['-m', manifest, '--fernet-key', str(key_file)])
+    assert exc.value.code != 0
+
+
+def test_failed_file_in_a_dir_job_exits_non_zero(tmp_path, key_file, logged_in):
+    root = tmp_path / 'root'
+    root.mkdir()
+    (root / 'good.txt').write_text('good')
+    (root / 'bad.txt').write_text('bad')
+    encrypt_dir(root, key_file, silent=True, resume=False)
+    bad = root / 'bad.txt'
+    bad.write_bytes(bad.read_bytes()[:-10])
+
+    manifest = _manifest(tmp_path, {'path': str(root), 'op': 'dec', 'options': {'resume': False}})
+    with pytest.raises(SystemExit) as exc:
+        main.main(['-m', manifest, '--fernet-key', str(key_file)])
+    assert exc.value.code != 0
+    assert (root / 'good.txt').read_text() == 'good'
+
+
+def test_successful_manifest_exits_zero(tmp_path, key_file, logged_in):
+    root = tmp_path / 'root'
+    root.mkdir()
+    (root / 'a.txt').write_text('a')
+    manifest = _manifest(tmp_path, {'path': str(root), 'op': 'enc'}, {'path': str(root), 'op': 'dec'})
+    main.main(['-m', manifest, '--fernet-key', str(key_file)])
+    assert (root / 'a.txt').read_text() == 'a'
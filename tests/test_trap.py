@@ -0,0 +1,46 @@
+# Regression tests of the directory trap
+#
+# Author: Indrajit Ghosh
+#
+# Created on: Oct 18, 2026
+#
+
+import os, shutil
+
+from trap import trap, _create_directory_trap, _create_sparse_trap
+
+
+def test_resumed_trap_reports_the_paths_it_created(tmp_path, capsys):
+    target = tmp_path / 'trapped'
+    _create_directory_trap(target, depth=2, symbols=['A', 'B'])
+    capsys.readouterr()
+
+    # Levels 1 and 2 are known complete; only level 3 is new
+    assert _create_directory_trap(target, depth=3, symbols=['A', 'B']) == 8
+    assert 'Total paths created 8' in capsys.readouterr().out
+
+
+def test_state_file_is_not_inside_the_trap(tmp_path):
+    target = tmp_path / 'trapped'
+    _create_directory_trap(target, depth=2, symbols=['A', 'B'])
+
+    assert sorted(os.listdir(target)) == ['A', 'B']
+    assert sorted(os.listdir(tmp_path)) == ['.trapped.trap-state', 'trapped']
+
+
+def test_sparse_trap_reports_only_new_paths(tmp_path, capsys):
+    _create_sparse_trap(tmp_path, '123', decoys=5, seed=1)
+    capsys.readouterr()
+
+    assert _create_sparse_trap(tmp_path, '123', decoys=5, seed=1) == 0
+    assert 'Total paths created 0 of 6' in capsys.readouterr().out
+
+
+def test_state_of_a_removed_trap_is_not_trusted(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    trap(pin='12')
+    shutil.rmtree(tmp_path / 'trapped')
+
+    trap(pin='12')
+    assert len(os.listdir(tmp_path / 'trapped')) == 10
+    assert all(len(os.listdir(tmp_path / 'trapped' / d)) == 10 for d in '0123456789')
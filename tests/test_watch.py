@@ -0,0 +1,60 @@
+# Regression tests of the watch mode
+#
+# Author: Indrajit Ghosh
+#
+# Created on: Oct 18, 2026
+#
+
+import os, threading, time
+
+import pytest
+
+from encryption import encrypt_dir, is_file_encrypted
+from decryption import decrypt_dir
+from watch import watch_dir
+
+
+def _watch(root, key_file, action, poll=False):
+    """Runs `watch_dir()` in a thread while `action()` changes `root`."""
+    stop = threading.Event()
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(r=watch_dir(
+        root, key_file, settle=0.2, poll=poll, interval=0.1, quiet=True, stop_event=stop
+    )))
+    thread.start()
+    time.sleep(0.3)
+    action()
+    time.sleep(1.0)
+    stop.set()
+    thread.join(timeout=10)
+    assert not thread.is_alive(), "watch_dir did not stop"
+    return result['r']
+
+
+@pytest.mark.parametrize('poll', [False, True])
+def test_watched_files_are_decrypted_after_an_encrypt_dir_run(tmp_path, key_file, poll):
+    root = tmp_path / 'w'
+    root.mkdir()
+    (root / 'old.txt').write_text('old')
+    encrypt_dir(root, key_file, silent=True)
+
+    _watch(root, key_file, lambda: (root / 'new.txt').write_text('new'), poll=poll)
+    assert is_file_encrypted(root / 'new.txt')
+
+    decrypt_dir(root, key_file)
+    assert (root / 'old.txt').read_text() == 'old'
+    assert (root / 'new.txt').read_text() == 'new'
+
+
+@pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason="needs FIFOs")
+def test_fifo_does_not_block_the_watcher(tmp_path, key_file):
+    root = tmp_path / 'w'
+    root.mkdir()
+
+    def action():
+        os.mkfifo(root / 'pipe')
+        (root / 'file.txt').write_text('data')
+
+    encrypted, failed = _watch(root, key_file, action)
+    assert (encrypted, failed) == (1, 0)
+    assert is_file_encrypted(root / 'file.txt')
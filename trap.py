@@ -6,13 +6,17 @@
 # Modified on: Oct 8, 2023
 #
 
-import string, time, shutil, sys, argparse
-from distutils.dir_util import copy_tree
-from itertools import product
+import string, time, sys, argparse, os, json, random, secrets
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice, product
 from pathlib import Path, PurePath
 
+from fastcopy import copy_file, copy_tree, COPY_MODES, AUTO
+
 UPPERCASE = list(string.ascii_uppercase)
 DIGITS = list(string.digits)
+TRAP_STATE_SUFFIX = '.trap-state' # Levels of the trap known to be complete
+MKDIR_BATCH = 512 # Directories created per task of the mkdir pool
 
 def _create_path_from_str(dir:Path=Path.cwd(), s:str="ABC"):
     """
@@ -30,16 +34,87 @@ def _get_list_of_paths(keywords:list=None, dir:Path=Path.cwd()):
     return [_create_path_from_str(dir=dir, s=k) for k in keywords]
 
 
-def _create_directory_trap(target:Path, depth:int=2, symbols:list=["A", "B", "C"]):
+def _iter_trap_level(target:Path, level:int, symbols:list):
+    """
+    Yields the paths of all dirs of the given `level` of the trap (e.g.
+    'target/A/B' for level 2), one at a time and in a fixed order.
+    """
+    root = os.fspath(target)
+    for combo in product(symbols, repeat=level):
+        yield os.path.join(root, *combo)
+
+
+def _mkdir_batch(paths:list):
+    """Creates the dirs `paths` whose parents exist. Returns the number of new ones."""
+    created = 0
+    for p in paths:
+        try:
+            os.mkdir(p)
+            created += 1
+        except FileExistsError:
+            pass
+    return created
+
+
+def _trap_state_file(target:Path):
+    """
+    Returns the state file of the trap at `target`. It lives next to the
+    trap ('.trapped.trap-state' for 'trapped'), so it is not one more entry
+    among the dirs of the trap.
+    """
+    return target.parent / f'.{target.name}{TRAP_STATE_SUFFIX}'
+
+
+def _load_trap_state(target:Path, symbols:list):
+    """
+    Returns the number of levels of the trap at `target` known to be
+    complete. The state is trusted only if the first and the last dir of
+    its last level exist, since it survives the removal of the trap.
+    """
+    try:
+        with open(_trap_state_file(target)) as f:
+            state = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return 0
+    levels = state.get('levels', 0)
+    if state.get('symbols') != list(symbols) or levels <= 0:
+        return 0
+    for s in (symbols[0], symbols[-1]):
+        if not os.path.isdir(os.path.join(target, *[s] * levels)):
+            return 0
+    return levels
+
+
+def _save_trap_state(target:Path, symbols:list, levels:int):
+    state_file = _trap_state_file(target)
+    tmp = state_file.with_name(state_file.name + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump({'symbols': list(symbols), 'levels': levels}, f)
+    os.replace(tmp, state_file)
+
+
+def _create_directory_trap(target:Path, depth:int=2, symbols:list=["A", "B", "C"], jobs:int=None):
     """
     This function will create directories with all possible strings that 
     can be made from `symbols` of length `depth` inside the dir `target`.
 
+    The trap is built level by level, so every mkdir finds its parent and
+    no `parents=True` lookups are needed. The dirs of a level are streamed
+    (never listed in memory) to a pool of `jobs` threads in batches of
+    `MKDIR_BATCH`. After each level a state file next to `target` (see
+    `_trap_state_file()`) records it as complete, so an interrupted run
+    (or a deeper trap later) resumes from the first incomplete level.
+
     Parameters:
     -----------
         `target`: `Path`; Path of the dir where the trap is to be created
         `depth`: `int`; A integer indicating the level of the trap
         `symbols`: `list`: symbols to be used
+        `jobs`: `int`; number of mkdir threads; defaults to the CPU count
+
+    Returns:
+    --------
+        `int`: number of dirs created by this call
 
     Example:
     ---------
@@ -48,42 +123,132 @@ def _create_directory_trap(target:Path, depth:int=2, symbols:list=["A", "B", "C"
 
         This will create all dirs "A/A", "A/B", "B/A" and "B/B" inside `target`
     """
+    target = Path(target)
+    target.mkdir(parents=True, exist_ok=True)
+    jobs = (os.cpu_count() or 1) if jobs is None else max(1, int(jobs))
 
-    keywds = [''.join(c) for c in product(symbols, repeat = depth)]
+    done_levels = _load_trap_state(target, symbols)
+    created = 0
+    paths_created = 0 # dirs of the last level, i.e. the pin paths
 
-    N = len(symbols)
-    
-    paths = _get_list_of_paths(keywords=keywds, dir=target)
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for level in range(done_levels + 1, depth + 1):
+            paths = _iter_trap_level(target, level, symbols)
+            pending = set()
+            level_created = 0
+            while True:
+                batch = list(islice(paths, MKDIR_BATCH))
+                if not batch:
+                    break
+                pending.add(pool.submit(_mkdir_batch, batch))
+                if len(pending) >= 4 * jobs:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    level_created += sum(f.result() for f in done)
 
-    for p in paths:
-        print(f" - Creating {p}")
-        p.mkdir(parents=True, exist_ok=True)
+            # The next level needs all of this one
+            done, _ = wait(pending)
+            level_created += sum(f.result() for f in done)
+            created += level_created
+            if level == depth:
+                paths_created = level_created
+            _save_trap_state(target, symbols, level)
+
+    if done_levels >= depth:
+        print(f" - The trap of depth {depth} already exists")
+    else:
+        print(f" - Total paths created {paths_created}")
 
-    print(f" - Total paths created {len(keywds)}")
+    return created
+
+
+def _sample_decoy_pins(pin:str, decoys:int, symbols:list, seed:int=None):
+    """
+    Returns `decoys` distinct pins of the length of `pin` (never `pin`
+    itself), drawn uniformly from `symbols` by a PRNG seeded with `seed`;
+    the same seed gives the same decoys.
+    """
+    rng = random.Random(seed)
+    decoys = min(decoys, len(symbols) ** len(pin) - 1)
+    picked = set()
+    while len(picked) < decoys:
+        p = ''.join(rng.choices(symbols, k=len(pin)))
+        if p != pin:
+            picked.add(p)
+    return sorted(picked)
 
 
-def trap(item:Path=None, pin:str="0123"):
+def _create_sparse_trap(target:Path, pin:str, decoys:int=100, symbols:list=DIGITS, seed:int=None):
+    """
+    Creates only the path of `pin` plus `decoys` decoy paths of the same
+    depth inside `target`, instead of all `len(symbols) ** len(pin)` of
+    them. Time and inodes are bounded by `(decoys + 1) * len(pin)` dirs,
+    whatever the length of the pin. The paths are created in random order,
+    so the creation times do not single out the real one.
+
+    Without a `seed` the decoys are random; with one they are reproducible.
+
+    NOTE: someone who can list `target` only has `decoys + 1` candidates to
+    try, so choose `decoys` accordingly.
+
+    Returns:
+    --------
+        `int`: number of dirs created
+    """
+    target = Path(target)
+    if seed is None:
+        seed = secrets.randbits(64)
+    pins = _sample_decoy_pins(pin, decoys, symbols, seed=seed) + [pin]
+    random.Random(seed).shuffle(pins)
+
+    created = 0
+    paths_created = 0 # pin paths whose last dir is new
+    for p in pins:
+        path = target
+        for c in p:
+            path = path / c
+            try:
+                os.mkdir(path)
+                created += 1
+                is_new = True
+            except FileExistsError:
+                is_new = False
+        paths_created += is_new
+
+    print(f" - Total paths created {paths_created} of {len(pins)} ({len(pins) - 1} decoys)")
+    return created
+
+
+def trap(item:Path=None, pin:str="0123", decoys:int=None, seed:int=None, copy_mode:str=AUTO, jobs:int=None):
     """
     Traps the `item`.
     If the `item` is a file then this function copy the file into trapped/pin
     if the `item` is a directory then it copies the whole directory into trapped/pin
+
+    By default every possible pin path is created. With `decoys`, only the
+    real path and that many decoy paths are; see `_create_sparse_trap()`.
+
+    The item is copied with `fastcopy.py`: `copy_mode` is 'copy', 'reflink'
+    (instant copy-on-write where the filesystem supports it), 'hardlink' or
+    'auto'; a dir is copied by `jobs` threads.
     """
     pin = str(pin)
     trap_dir = Path.cwd() / "trapped"
-    _create_directory_trap(target=trap_dir, depth=len(pin), symbols=DIGITS)
+    if decoys is None:
+        _create_directory_trap(target=trap_dir, depth=len(pin), symbols=DIGITS)
+    else:
+        trap_dir.mkdir(exist_ok=True)
+        _create_sparse_trap(target=trap_dir, pin=pin, decoys=decoys, symbols=DIGITS, seed=seed)
 
     if item is not None:
 
         item = Path(item).absolute()
 
         trap_loc = _create_path_from_str(dir=trap_dir, s=pin)
+        trap_loc.mkdir(parents=True, exist_ok=True)
         if item.is_file():
-            shutil.copy(src=item, dst=trap_loc)
+            copy_file(src=item, dst=trap_loc / item.name, mode=copy_mode)
         else:
-            dst_dir = trap_loc / item.name
-            if not dst_dir.exists():
-                dst_dir.mkdir()
-            copy_tree(src=str(item), dst=str(dst_dir))
+            copy_tree(src=item, dst=trap_loc / item.name, mode=copy_mode, jobs=jobs)
 
         print(f"\n The item has been trapped inside the dir\n {trap_dir}\nwith the pin {pin}.\n")
     else:
@@ -101,6 +266,16 @@ def main():
     # Add the -p or --pin option
     parser.add_argument('-p', '--pin', help='PIN')
 
+    # Sparse trap: only the real path plus some decoys
+    parser.add_argument('-d', '--decoys', type=int, default=None,
+                        help='Create only the pin path and this many decoy paths instead of all of them')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for reproducible decoys')
+
+    # How the item is copied into the trap
+    parser.add_argument('-c', '--copy-mode', choices=COPY_MODES, default=AUTO,
+                        help='copy, reflink (copy-on-write), hardlink or auto (default: auto)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Number of copy threads')
+
     # Parse the command-line arguments
     args = parser.parse_args()
 
@@ -114,7 +289,7 @@ def main():
 
     t1 = time.time()
     # Call your trap function here with item_path and my_pin
-    trap(item=item_path, pin=my_pin)
+    trap(item=item_path, pin=my_pin, decoys=args.decoys, seed=args.seed, copy_mode=args.copy_mode, jobs=args.jobs)
     t2 = time.time()
 
     print(f"\n Total time taken: {t2 - t1} secs.\n")
@@ -0,0 +1,441 @@
+# Watch a drop directory and encrypt files as they arrive
+#
+# Author: Indrajit Ghosh
+#
+# Created on: Oct 18, 2026
+#
+# Usage:
+#   python watch.py DIR [--settle 2] [--poll] [-j N] [auth options]
+#
+# New and changed files are found with inotify (Linux, through ctypes) or,
+# where that is not available, by rescanning the tree every `--interval`
+# seconds. Instead of a whole-tree run per change, only the files named by
+# the events are looked at.
+#
+# A file is encrypted once it has had no event for `settle` seconds and its
+# size and mtime are unchanged over that time, so files still being written
+# (or copied in piece by piece) are left alone until they are complete.
+# Already encrypted files are skipped (`is_file_encrypted()`); this also
+# covers the events caused by our own atomic replacements.
+#
+
+import ctypes, ctypes.util, errno, os, select, stat, struct, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from encryption import (encrypt_file, is_file_encrypted, load_cipher_context, _walk_files, _compile_patterns,
+                        NOT_TO_ENCRYPT, DOT_ENCRYPTED_FILENAME, DOT_ARCHIVE_FILENAME)
+from atomic_io import is_temp_path, DEFAULT_DURABILITY
+from journal import MANIFEST_SUFFIX
+
+DEFAULT_SETTLE = 2.0 # Seconds a file must stay unchanged before it is encrypted
+DEFAULT_POLL_INTERVAL = 5.0 # Seconds between two scans of the polling watcher
+TICK = 0.5 # Max seconds between two checks of the pending files
+
+# inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+_EVENT = struct.Struct('iIII') # wd, mask, cookie, len; followed by the name
+READ_SIZE = 64 * 1024
+
+
+class _PathFilter:
+    """Tells which paths below `root_dir` are never to be encrypted."""
+
+    def __init__(self, root_dir:Path, exclude:list=None, skip_hidden:bool=False):
+        self.root = os.path.abspath(root_dir)
+        self.exclude = exclude
+        self.skip_hidden = skip_hidden
+        self.name_re, self.rel_re = _compile_patterns(exclude)
+        self.ignore = {os.path.abspath(p) for p in NOT_TO_ENCRYPT} | {
+            os.path.join(self.root, name)
+            for name in (DOT_ENCRYPTED_FILENAME, DOT_ENCRYPTED_FILENAME + MANIFEST_SUFFIX, DOT_ARCHIVE_FILENAME)
+        }
+
+    def walk_options(self):
+        """Keyword arguments of `_walk_files()` applying the same filter."""
+        return {'exclude': self.exclude, 'skip_hidden': self.skip_hidden}
+
+    def ignored(self, path:str):
+        path = os.path.abspath(path)
+        if path in self.ignore or is_temp_path(path):
+            return True
+        rel = os.path.relpath(path, self.root)
+        parts = rel.split(os.sep)
+        if self.skip_hidden and any(p.startswith('.') for p in parts):
+            return True
+        if self.name_re is not None and any(self.name_re.match(p) for p in parts):
+            return True
+        if self.rel_re is not None and any(self.rel_re.match(os.path.join(*parts[:i])) for i in range(1, len(parts) + 1)):
+            return True
+        return False
+
+
+class InotifyWatcher:
+    """
+    Watches `root_dir` and all its subdirectories with inotify. New subdirs
+    are watched as they appear. `events()` returns the paths of the files
+    that were written, created or moved in.
+
+    Raises OSError if inotify is not available or its watch limit is hit.
+    """
+
+    def __init__(self, root_dir:Path, path_filter:_PathFilter):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self._libc = libc
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.root = os.path.abspath(root_dir)
+        self.filter = path_filter
+        self._dirs = {}  # watch descriptor -> dir path
+
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        try:
+            self._watch_tree(self.root, strict=True)
+        except BaseException:
+            os.close(self.fd)
+            raise
+
+    def _watch(self, dirpath:str):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(dirpath), WATCH_MASK)
+        if wd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, f"inotify_add_watch: {os.strerror(e)}", dirpath)
+        self._dirs[wd] = dirpath
+
+    def _watch_tree(self, top:str, strict:bool=False):
+        """
+        Watches `top` and the dirs below it. Returns the files found there,
+        which may have been written before the watch existed. With `strict`,
+        a failing watch raises instead of being reported.
+        """
+        found = []
+        for dirpath, dirnames, filenames in os.walk(top):
+            dirnames[:] = [d for d in dirnames if not self.filter.ignored(os.path.join(dirpath, d))]
+            try:
+                self._watch(dirpath)
+            except OSError as e:
+                if strict:
+                    raise
+                print(f"\nWARNING: {dirpath} is not watched ({e.strerror}); raise fs.inotify.max_user_watches\n")
+            found += [os.path.join(dirpath, f) for f in filenames]
+        return found
+
+    def events(self, timeout:float):
+        """
+        Waits up to `timeout` seconds and returns a list of tuples
+        (path, written) for the files with events; `written` is False for
+        mere modifications of a file still open for writing.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            buf = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+
+        out = []
+        i = 0
+        while i + _EVENT.size <= len(buf):
+            wd, mask, _, length = _EVENT.unpack_from(buf, i)
+            name = buf[i + _EVENT.size:i + _EVENT.size + length].rstrip(b'\0')
+            i += _EVENT.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost; fall back to one scan of the tree
+                print("\nWARNING: inotify queue overflowed; rescanning\n")
+                out += [(os.fspath(p), True) for p, _ in _walk_files(self.root, **self.filter.walk_options())]
+                continue
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            dirpath = self._dirs.get(wd)
+            if dirpath is None or not name:
+                continue
+
+            path = os.path.join(dirpath, os.fsdecode(name))
+            if self.filter.ignored(path):
+                continue
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    out += [(p, True) for p in self._watch_tree(path) if not self.filter.ignored(p)]
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                out.append((path, True))
+            elif mask & (IN_MODIFY | IN_CREATE):
+                out.append((path, False))
+        return out
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """
+    Finds new and changed files of `root_dir` by comparing the size and
+    mtime of every file with the previous scan, every `interval` seconds.
+    The fallback where inotify is not available.
+    """
+
+    def __init__(self, root_dir:Path, path_filter:_PathFilter, interval:float=DEFAULT_POLL_INTERVAL):
+        self.root = os.path.abspath(root_dir)
+        self.filter = path_filter
+        self.interval = interval
+        self._snapshot = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def _scan(self):
+        return {
+            os.fspath(p): (st.st_size, st.st_mtime_ns)
+            for p, st in _walk_files(self.root, **self.filter.walk_options())
+            if not self.filter.ignored(p)
+        }
+
+    def events(self, timeout:float):
+        """As `InotifyWatcher.events()`."""
+        wait = self._next_scan - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(wait, 0))
+
+        snapshot = self._scan()
+        self._next_scan = time.monotonic() + self.interval
+        changed = [(p, True) for p, sig in snapshot.items() if self._snapshot.get(p) != sig]
+        self._snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+def open_watcher(root_dir:Path, path_filter:_PathFilter, poll:bool=False, interval:float=DEFAULT_POLL_INTERVAL):
+    """Returns an `InotifyWatcher`, or a `PollingWatcher` if `poll` or inotify is not available."""
+    if not poll:
+        try:
+            return InotifyWatcher(root_dir, path_filter)
+        except (OSError, AttributeError) as e:
+            print(f"inotify not available ({e}); polling every {interval}s instead")
+    return PollingWatcher(root_dir, path_filter, interval=interval)
+
+
+class _Debouncer:
+    """
+    Pending files and the time they are due. A file becomes ready once it
+    had no event for `settle` seconds and its size and mtime did not change
+    over the last `settle` seconds.
+    """
+
+    def __init__(self, settle:float):
+        self.settle = settle
+        self._pending = {}  # path -> [due time, (size, mtime_ns) or None]
+
+    def __len__(self):
+        return len(self._pending)
+
+    def touch(self, path:str, written:bool=True):
+        entry = self._pending.get(path)
+        if entry is None:
+            if not written:
+                # The file will be reported again when it is closed
+                self._pending[path] = [time.monotonic() + self.settle, None]
+                return
+            entry = self._pending[path] = [0, None]
+        entry[0] = time.monotonic() + self.settle
+        if written:
+            try:
+                st = os.stat(path)
+                entry[1] = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                entry[1] = None
+
+    def next_due(self):
+        """Seconds until the next file is due, or None if none is pending."""
+        if not self._pending:
+            return None
+        return max(0.0, min(entry[0] for entry in self._pending.values()) - time.monotonic())
+
+    def pop_ready(self):
+        """Removes and returns the files that are due and did not change."""
+        now = time.monotonic()
+        ready = []
+        for path, entry in list(self._pending.items()):
+            if entry[0] > now:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self._pending[path]  # removed or moved away meanwhile
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                del self._pending[path]  # e.g. a FIFO, whose open() would block
+                continue
+            sig = (st.st_size, st.st_mtime_ns)
+            if sig == entry[1]:
+                del self._pending[path]
+                ready.append(path)
+            else:
+                # Still changing: wait for another quiet period
+                entry[0] = now + self.settle
+                entry[1] = sig
+        return ready
+
+
+def watch_dir(root_dir:Path, fernet_file:Path, settle:float=DEFAULT_SETTLE, poll:bool=False,
+              interval:float=DEFAULT_POLL_INTERVAL, jobs:int=None, initial_scan:bool=True, quiet:bool=False,
+              exclude:list=None, skip_hidden:bool=False, compress:str=None, cipher:str=None,
+              durability:str=DEFAULT_DURABILITY, stop_event:threading.Event=None):
+    """
+    Encrypts the files arriving in `root_dir` (and its subdirectories) until
+    `stop_event` is set or the process is interrupted.
+
+    Arguments:
+    ----------
+        `root_dir`: the directory to watch
+        `fernet_file`: Path() of the fernet key or a `CipherContext`
+        `settle`: seconds a file must stay unchanged before it is encrypted
+        `poll`: rescan every `interval` seconds instead of using inotify
+        `jobs`: number of threads encrypting; defaults to the CPU count
+        `initial_scan`: also encrypt the plaintext files already there
+        `quiet`: do not print a line per file
+        `exclude`, `skip_hidden`: as in `encrypt_dir()`
+        `compress`, `cipher`, `durability`: as in `encrypt_file()`
+
+    Returns:
+    --------
+        tuple(`int`, `int`): (files encrypted, files that failed)
+    """
+    root_dir = Path(root_dir).absolute()
+    ctx = load_cipher_context(fernet_file)
+    stop_event = threading.Event() if stop_event is None else stop_event
+    path_filter = _PathFilter(root_dir, exclude=exclude, skip_hidden=skip_hidden)
+    debouncer = _Debouncer(settle)
+    in_flight = {}  # path -> future
+    encrypted = 0
+    failed = 0
+
+    def _encrypt(path:str):
+        # Only regular files; opening a FIFO or a device could block forever
+        try:
+            if not stat.S_ISREG(os.stat(path).st_mode):
+                return False
+        except OSError:
+            return False
+        if is_file_encrypted(path):
+            return False
+        encrypt_file(filepath=Path(path), fernet_file=ctx, print_status=False,
+                     compress=compress, cipher=cipher, durability=durability)
+        return True
+
+    # Watch before scanning, so that nothing arriving in between is missed
+    watcher = open_watcher(root_dir, path_filter, poll=poll, interval=interval)
+    if initial_scan:
+        for path, _ in _walk_files(root_dir, **path_filter.walk_options()):
+            if not path_filter.ignored(path):
+                debouncer.touch(os.fspath(path))
+
+    print(f"Watching '{root_dir}' ({type(watcher).__name__}); press Ctrl+C to stop")
+    pool = ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1)
+    try:
+        while not stop_event.is_set():
+            due = debouncer.next_due()
+            for path, written in watcher.events(TICK if due is None else min(due, TICK)):
+                debouncer.touch(path, written)
+
+            for path in debouncer.pop_ready():
+                if path in in_flight:
+                    debouncer.touch(path)  # changed while being encrypted; look again later
+                else:
+                    in_flight[path] = pool.submit(_encrypt, path)
+
+            for path, fut in list(in_flight.items()):
+                if not fut.done():
+                    continue
+                del in_flight[path]
+                try:
+                    if fut.result():
+                        encrypted += 1
+                        if not quiet:
+                            print(f"Encrypted: '{path}'")
+                except Exception as e:
+                    failed += 1
+                    print(f"\nERROR: The following file could not be encrypted ({e}):\n - {path}\n")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        pool.shutdown(wait=True)
+        for path, fut in in_flight.items():
+            if fut.exception() is None and fut.result():
+                encrypted += 1
+            elif fut.exception() is not None:
+                failed += 1
+
+    print(f"\nStopped watching '{root_dir}'. Files encrypted: {encrypted}" + (f", failed: {failed}" if failed else ""))
+    return encrypted, failed
+
+
+def main():
+    import argparse
+    from main import add_auth_arguments, authenticate, resolve_fernet_key
+    from authentication import has_password
+    from atomic_io import DURABILITY_LEVELS
+    from compressors import CODECS, AUTO
+    from streaming import CIPHERS
+
+    parser = argparse.ArgumentParser(description="Encrypt the files arriving in a directory.")
+    parser.add_argument('dir', type=Path, help='Directory to watch')
+    parser.add_argument('--settle', type=float, default=DEFAULT_SETTLE, help='Seconds a file must stay unchanged')
+    parser.add_argument('--poll', action='store_true', help='Rescan periodically instead of using inotify')
+    parser.add_argument('--interval', type=float, default=DEFAULT_POLL_INTERVAL, help='Seconds between rescans with --poll')
+    parser.add_argument('--no-initial-scan', dest='initial_scan', action='store_false',
+                        help='Leave the plaintext files already there alone')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Encrypting threads (default: CPU count)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='No line per file')
+    parser.add_argument('--exclude', action='append', default=None, metavar='GLOB', help='Skip matching files and dirs')
+    parser.add_argument('--skip-hidden', action='store_true', help='Skip files and dirs starting with a dot')
+    parser.add_argument('--compress', choices=[AUTO] + list(CODECS), default=None, help='Compress before encrypting')
+    parser.add_argument('--cipher', choices=list(CIPHERS), default=None, help='Cipher of the binary format')
+    parser.add_argument('--durability', choices=DURABILITY_LEVELS, default=DEFAULT_DURABILITY, help='fsync policy')
+    parser.add_argument('--fernet-key', type=Path, default=None, help='Fernet key file')
+    add_auth_arguments(parser)
+    args = parser.parse_args()
+
+    if not args.dir.is_dir():
+        print(f"\nERROR: no such dir exists > `{args.dir}`\n")
+        sys.exit(1)
+    if not has_password(args.user):
+        print("\nERROR: no password is set yet; run `python main.py enc` on a terminal first.\n")
+        sys.exit(1)
+    if not authenticate(args, interactive=sys.stdin.isatty()):
+        print("\nSorry that didn't work!\n")
+        sys.exit(1)
+
+    _, failed = watch_dir(
+        args.dir, resolve_fernet_key(args.fernet_key), settle=args.settle, poll=args.poll,
+        interval=args.interval, jobs=args.jobs, initial_scan=args.initial_scan, quiet=args.quiet,
+        exclude=args.exclude, skip_hidden=args.skip_hidden, compress=args.compress, cipher=args.cipher,
+        durability=args.durability
+    )
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()